@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import uuid
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from functools import partial
+from typing import Any, Callable
+from urllib.parse import urlparse
+
+from app.api.connection import connect_with_retry
+
+Handler = Callable[[bytes], None]
+
+logger = logging.getLogger(__name__)
+
+# tells this process' own messages apart when the broker echoes them back
+WORKER_ID = uuid.uuid4().hex
+
+
+class Broker(ABC):
+    """Publish/subscribe channel shared by every worker process of a deployment."""
+
+    def __init__(self):
+        self._reconnect_listeners: list[Callable[[], None]] = []
+
+    @abstractmethod
+    async def connect(self) -> None:
+        ...
+
+    @abstractmethod
+    async def close(self) -> None:
+        ...
+
+    @abstractmethod
+    def publish(self, channel: str, message: bytes) -> None:
+        """Send a message to every subscriber of `channel`, this process included, keeping publication order."""
+
+    @abstractmethod
+    async def subscribe(self, channel: str, handler: Handler) -> None:
+        """Call `handler` for every message published to `channel` once this returns."""
+
+    def on_reconnect(self, listener: Callable[[], None]) -> None:
+        """Have `listener` called whenever the connection came back, messages may have been missed meanwhile."""
+        self._reconnect_listeners.append(listener)
+
+
+class LocalBroker(Broker):
+    """Delivers within the current process, stands in for a real broker in a single worker."""
+
+    def __init__(self):
+        super().__init__()
+        self._handlers: dict[str, list[Handler]] = defaultdict(list)
+
+    async def connect(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        self._handlers.clear()
+
+    def publish(self, channel: str, message: bytes) -> None:
+        loop = asyncio.get_running_loop()
+        for handler in self._handlers.get(channel, ()):
+            loop.call_soon(handler, message)
+
+    async def subscribe(self, channel: str, handler: Handler) -> None:
+        self._handlers[channel].append(handler)
+
+
+class RespBroker(Broker):
+    """Pub/sub over the Redis protocol, against Redis itself or the bundled hub (`app.api.broker_hub`).
+
+    `url` is `redis://host[:port]` or `unix:///path/to/socket`. Publishing and receiving use separate
+    connections since a subscribed Redis connection accepts no other commands. A lost connection is
+    reconnected for as long as it takes, messages published meanwhile are held back up to `PENDING_LIMIT`
+    and the reconnect listeners are told once subscriptions are restored.
+    """
+    PENDING_LIMIT = 100_000
+
+    def __init__(self, url: str, connect_timeout: float = 10.0):
+        super().__init__()
+        self.url = url
+        self.connect_timeout = connect_timeout
+        self._handlers: dict[bytes, list[Handler]] = defaultdict(list)
+        self._subscribed: dict[bytes, asyncio.Future] = {}
+        self._publisher: asyncio.StreamWriter | None = None
+        self._subscriber: asyncio.StreamWriter | None = None
+        self._pending: deque[bytes] = deque(maxlen=self.PENDING_LIMIT)
+        self._tasks: list[asyncio.Task] = []
+
+    async def connect(self) -> None:
+        publisher_reader, self._publisher = await self._open(self.connect_timeout)
+        subscriber_reader, self._subscriber = await self._open(self.connect_timeout)
+        self._tasks = [asyncio.create_task(self._keep_publishing(publisher_reader)),
+                       asyncio.create_task(self._keep_listening(subscriber_reader))]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for writer in (self._publisher, self._subscriber):
+            if writer is not None:
+                writer.close()
+        self._tasks = []
+        self._publisher = self._subscriber = None
+
+    def publish(self, channel: str, message: bytes) -> None:
+        command = encode_command(b"PUBLISH", channel.encode(), message)
+        if self._publisher is None or self._publisher.is_closing():
+            self._pending.append(command)
+        else:
+            self._publisher.write(command)
+
+    async def subscribe(self, channel: str, handler: Handler) -> None:
+        name = channel.encode()
+        self._handlers[name].append(handler)
+        if name not in self._subscribed:
+            self._subscribed[name] = asyncio.get_running_loop().create_future()
+            self._subscriber.write(encode_command(b"SUBSCRIBE", name))
+        await self._subscribed[name]
+
+    async def _open(self, timeout: float | None) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        url = urlparse(self.url)
+        if url.scheme == "unix":
+            return await connect_with_retry(partial(asyncio.open_unix_connection, url.path), timeout)
+        return await connect_with_retry(partial(asyncio.open_connection, url.hostname, url.port or 6379), timeout)
+
+    async def _keep_publishing(self, reader: asyncio.StreamReader) -> None:
+        while True:
+            try:
+                while True:
+                    await read_reply(reader)
+            except (ConnectionError, asyncio.IncompleteReadError, BrokerError, ValueError) as e:
+                logger.warning("Lost the broker connection for publishing, reconnecting: %s", e)
+            self._publisher.close()
+            reader, self._publisher = await self._open(timeout=None)
+            while self._pending:
+                self._publisher.write(self._pending.popleft())
+
+    async def _keep_listening(self, reader: asyncio.StreamReader) -> None:
+        while True:
+            try:
+                await self._listen(reader)
+            except (ConnectionError, asyncio.IncompleteReadError, BrokerError, ValueError) as e:
+                logger.warning("Lost the broker connection for receiving, reconnecting: %s", e)
+            self._subscriber.close()
+            reader, self._subscriber = await self._open(timeout=None)
+            for name in self._subscribed:
+                self._subscribed[name] = asyncio.get_running_loop().create_future()
+                self._subscriber.write(encode_command(b"SUBSCRIBE", name))
+            self._tasks = [task for task in self._tasks if not task.done()]
+            self._tasks.append(asyncio.create_task(self._reconnected()))
+
+    async def _reconnected(self) -> None:
+        # listeners resync through the broker, so they are told once the subscriptions are back
+        await asyncio.gather(*self._subscribed.values())
+        for listener in self._reconnect_listeners:
+            listener()
+
+    async def _listen(self, reader: asyncio.StreamReader) -> None:
+        while True:
+            kind, channel, payload = await read_reply(reader)
+            if kind == b"message":
+                for handler in self._handlers.get(channel, ()):
+                    try:
+                        handler(payload)
+                    except Exception:
+                        # one bad message must not stop replication
+                        logger.exception("Handling a message on channel %r failed", channel)
+            elif kind == b"subscribe" and not (subscribed := self._subscribed[channel]).done():
+                subscribed.set_result(None)
+
+
+class BrokerError(Exception):
+    pass
+
+
+def encode_command(*arguments: bytes) -> bytes:
+    return b"*%d\r\n" % len(arguments) + b"".join(b"$%d\r\n%s\r\n" % (len(argument), argument)
+                                                  for argument in arguments)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    """Read one RESP2 value: simple string, error, integer, bulk string or array."""
+    line = await reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("Broker connection closed")
+    kind, value = line[:1], line[1:-2]
+    match kind:
+        case b"+":
+            return value
+        case b"-":
+            raise BrokerError(value.decode())
+        case b":":
+            return int(value)
+        case b"$":
+            length = int(value)
+            return None if length < 0 else (await reader.readexactly(length + 2))[:-2]
+        case b"*":
+            length = int(value)
+            return None if length < 0 else [await read_reply(reader) for _ in range(length)]
+    raise BrokerError(f"Unexpected reply {line!r}")
+
+
+def broker_from_url(url: str) -> Broker:
+    if url == "local":
+        return LocalBroker()
+    if urlparse(url).scheme in ("redis", "unix"):
+        return RespBroker(url)
+    raise ValueError(f"Unknown broker '{url}'")
@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import os
+from collections import defaultdict
+from contextlib import suppress
+
+from app.api.broker import BrokerError, encode_command, read_reply
+
+
+class BrokerHub:
+    """Local stand-in for Redis pub/sub, understands PING, PUBLISH, SUBSCRIBE and UNSUBSCRIBE.
+
+    A publisher waits for the subscribers of its channel to take its messages, so a slow worker holds
+    publishers back instead of growing the hub's buffers; one that takes longer than `drain_timeout` is
+    disconnected, it reconnects and catches up.
+    """
+
+    def __init__(self, drain_timeout: float = 5.0):
+        self.drain_timeout = drain_timeout
+        self._subscribers: dict[bytes, set[asyncio.StreamWriter]] = defaultdict(set)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        channels: set[bytes] = set()
+        try:
+            while True:
+                command = await read_reply(reader)
+                if not isinstance(command, list) or not command:
+                    raise BrokerError("Commands must be arrays")
+                name, *arguments = command
+                match name.upper():
+                    case b"PING":
+                        writer.write(b"+PONG\r\n")
+                    case b"PUBLISH":
+                        channel, message = arguments
+                        receivers = tuple(self._subscribers.get(channel, ()))
+                        frame = encode_command(b"message", channel, message)
+                        for receiver in receivers:
+                            receiver.write(frame)
+                        writer.write(b":%d\r\n" % len(receivers))
+                        await asyncio.gather(*(self._drain(receiver) for receiver in receivers))
+                    case b"SUBSCRIBE":
+                        for channel in arguments:
+                            channels.add(channel)
+                            self._subscribers[channel].add(writer)
+                            writer.write(self._confirmation(b"subscribe", channel, len(channels)))
+                    case b"UNSUBSCRIBE":
+                        for channel in arguments or list(channels):
+                            channels.discard(channel)
+                            self._unsubscribe(channel, writer)
+                            writer.write(self._confirmation(b"unsubscribe", channel, len(channels)))
+                    case _:
+                        writer.write(b"-ERR unknown command '%s'\r\n" % name)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, BrokerError, ValueError):
+            pass
+        finally:
+            for channel in channels:
+                self._unsubscribe(channel, writer)
+            writer.close()
+
+    async def _drain(self, receiver: asyncio.StreamWriter) -> None:
+        try:
+            await asyncio.wait_for(receiver.drain(), self.drain_timeout)
+        except TimeoutError:
+            receiver.close()
+        except ConnectionError:
+            # gone, its own handler unsubscribes it
+            pass
+
+    def _unsubscribe(self, channel: bytes, writer: asyncio.StreamWriter) -> None:
+        if (writers := self._subscribers.get(channel)) is not None:
+            writers.discard(writer)
+            if not writers:
+                del self._subscribers[channel]
+
+    @staticmethod
+    def _confirmation(kind: bytes, channel: bytes, count: int) -> bytes:
+        return b"*3\r\n$%d\r\n%s\r\n$%d\r\n%s\r\n:%d\r\n" % (len(kind), kind, len(channel), channel, count)
+
+
+async def serve(path: str | None = None, port: int | None = None) -> None:
+    hub = BrokerHub()
+    if path is not None:
+        if os.path.exists(path):
+            os.unlink(path)
+        server = await asyncio.start_unix_server(hub.handle, path)
+    else:
+        server = await asyncio.start_server(hub.handle, "127.0.0.1", port)
+    async with server:
+        await server.serve_forever()
+
+
+def run(path: str | None = None, port: int | None = None) -> None:
+    with suppress(KeyboardInterrupt):
+        asyncio.run(serve(path, port))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pub/sub hub connecting the workers of the trading platform")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--unix", help="listen on this Unix socket, for BROKER_URL=unix://<path>")
+    target.add_argument("--port", type=int,
+                        help="listen on this local TCP port, for BROKER_URL=redis://127.0.0.1:<port>")
+    args = parser.parse_args()
+    run(args.unix, args.port)
@@ -0,0 +1,36 @@
+from app.api.lifecycle import lifecycle_scheduler
+from app.api.matching import matching_engine
+from app.api.utils import orders_db
+from app.api.websocket_manager import order_update, ws_manager
+from app.model.trading_platform_model import OrderOutput, OrderStatus
+
+
+def is_live(order: OrderOutput) -> bool:
+    """Whether the order may still change, matched orders settle once they leave the book."""
+    if order.side is not None:
+        return order.status == OrderStatus.pending.value
+    return order.status != OrderStatus.cancelled.value
+
+
+async def cancel_orders(orders: list[OrderOutput]) -> list[OrderOutput]:
+    """Cancel orders and remove them from the store, returns the ones that had not finished yet.
+
+    Resting limit orders leave their books and remaining lifecycle transitions are descheduled, then every
+    live order gets its final cancelled update in one grouped broadcast.
+    """
+    await matching_engine.cancel([order for order in orders if order.side is not None and is_live(order)])
+    cancelled = []
+    messages = []
+    for order in orders:
+        # re-read, a fill may have settled the order while its shard was busy
+        if (order := orders_db.remove(order.id)) is None or not is_live(order):
+            continue
+        order = order.model_copy(update={"status": OrderStatus.cancelled.value})
+        cancelled.append(order)
+        messages.append(order_update(order))
+    if messages:
+        await ws_manager.broadcast_many(messages)
+    for order in orders:
+        if not lifecycle_scheduler.deschedule(order.id):
+            ws_manager.release_order(order.id)
+    return cancelled
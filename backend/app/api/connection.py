@@ -0,0 +1,22 @@
+import asyncio
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+async def connect_with_retry(connect: Callable[[], Awaitable[T]],
+                             timeout: float | None,
+                             interval: float = 0.1) -> T:
+    """Call `connect` until it stops raising OSError, re-raising it after `timeout` seconds unless that is None.
+
+    Brokers and shards may still be starting up next to the workers, or be restarting.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    while True:
+        try:
+            return await connect()
+        except OSError:
+            if deadline is not None and loop.time() > deadline:
+                raise
+            await asyncio.sleep(interval)
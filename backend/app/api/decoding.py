@@ -0,0 +1,97 @@
+import json
+from collections import defaultdict
+from typing import Annotated, Any, Callable, TypeVar
+
+from fastapi.exceptions import RequestValidationError
+from pydantic import Field, TypeAdapter, ValidationError
+from pydantic_core import from_json
+
+from app.api.utils import order_inputs_adapter
+from app.config import settings
+from app.model.trading_platform_model import OrderInput
+
+T = TypeVar("T")
+
+order_input_adapter = TypeAdapter(OrderInput)
+order_batch_adapter = TypeAdapter(Annotated[list[OrderInput],
+                                            Field(min_length=1, max_length=settings.orders_max_batch_size)])
+
+
+def request_body(adapter: TypeAdapter) -> dict[str, Any]:
+    """OpenAPI request body of a route decoding its body itself, with the schemas it refers to inlined."""
+    schema = adapter.json_schema()
+    definitions = schema.pop("$defs", {})
+
+    def inline(node: Any) -> Any:
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return inline(definitions[node["$ref"].rsplit("/", 1)[-1]])
+            return {key: inline(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [inline(value) for value in node]
+        return node
+
+    return {"requestBody": {"required": True, "content": {"application/json": {"schema": inline(schema)}}}}
+
+
+def decode(adapter: TypeAdapter[T], frame: str | bytes) -> T:
+    """Parse and validate a raw frame or body in one pass.
+
+    Malformed JSON raises the JSONDecodeError of the standard library, whose message and position
+    clients already rely on, anything else ValidationError.
+    """
+    try:
+        return adapter.validate_json(frame)
+    except ValidationError as e:
+        if e.error_count() == 1 and e.errors(include_url=False, include_context=False)[0]["type"] == "json_invalid":
+            # only on the error path, the standard parser tells where the JSON broke
+            json.loads(frame)
+        raise
+
+
+def decode_order_batch(frame: str | bytes,
+                       adapter: TypeAdapter[list[OrderInput]] = order_inputs_adapter
+                       ) -> tuple[list[OrderInput | None], dict[int, list[dict]]]:
+    """Inputs of a basket (None for rejected ones) and errors by index, ValidationError when it is no basket."""
+    try:
+        return decode(adapter, frame), {}
+    except ValidationError as e:
+        errors = defaultdict(list)
+        for error in e.errors(include_url=False, include_context=False):
+            if not error["loc"]:
+                raise
+            errors[error["loc"][0]].append(error)
+        # only the orders that passed are validated again, to get their models; parsed the way validation
+        # did, which also takes NaN and numbers out of float range
+        return [None if index in errors else OrderInput.model_validate(item)
+                for index, item in enumerate(from_json(frame))], errors
+
+
+def decode_body(decoder: Callable[[bytes], T], body: bytes) -> T:
+    """Run a decoder over a request body, failing the way FastAPI's own body validation does."""
+    if not body:
+        raise RequestValidationError([{"type": "missing", "loc": ("body",), "msg": "Field required", "input": None}])
+    try:
+        return decoder(body)
+    except json.JSONDecodeError as e:
+        raise RequestValidationError([{"type": "json_invalid",
+                                       "loc": ("body", e.pos),
+                                       "msg": "JSON decode error",
+                                       "input": {},
+                                       "ctx": {"error": e.msg}}])
+    except ValidationError as e:
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])}
+                                      for error in e.errors(include_url=False, include_context=False)])
+
+
+def render_errors(errors: list[dict], code: int | None = None) -> list[dict[str, Any]]:
+    """`RequestError` payloads straight from validation errors, without building a model per error."""
+    rendered = []
+    for error in errors:
+        item = {"message": error["msg"]} if code is None else {"code": code, "message": error["msg"]}
+        if (value := error.get("input")) is not None:
+            item["input"] = value
+        item["localization"] = list(error["loc"])
+        item["type"] = error["type"]
+        rendered.append(item)
+    return rendered
@@ -0,0 +1,80 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, TypeVar
+
+from app.api.metrics import registry
+from app.config import settings
+
+T = TypeVar("T")
+
+
+class IdempotencyCache:
+    """Outcomes of placements by the idempotency key the client sent along, so a retry gets the original answer.
+
+    Keys are kept for `ttl` seconds at most and beyond `max_size` the least recently used ones go first.
+    A placement still running is represented by its future, repeats arriving meanwhile wait for its outcome.
+    A placement that failed is forgotten, so it is run again when retried.
+    """
+
+    def __init__(self, max_size: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        # key -> (expiry, outcome)
+        self._entries: OrderedDict[Hashable, tuple[float, asyncio.Future]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> asyncio.Future | None:
+        if (entry := self._entries.get(key)) is None:
+            return None
+        if entry[0] <= self.clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: Hashable, outcome: Any) -> None:
+        self._reserve(key).set_result(outcome)
+
+    async def run_once(self, key: Hashable | None, place: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        """Outcome of `place`, run only for the first request with `key`; True along with repeated outcomes."""
+        if key is None:
+            return await place(), False
+        if (outcome := self.get(key)) is not None:
+            # shielded, a repeat giving up must not cancel the original
+            return await asyncio.shield(outcome), True
+        outcome = self._reserve(key)
+        try:
+            result = await place()
+        except BaseException as e:
+            if self._entries.get(key, (None, None))[1] is outcome:
+                del self._entries[key]
+            if isinstance(e, Exception):
+                outcome.set_exception(e)
+                # waiting repeats see the error, nobody else has to
+                outcome.exception()
+            else:
+                outcome.cancel()
+            raise
+        outcome.set_result(result)
+        return result, False
+
+    def _reserve(self, key: Hashable) -> asyncio.Future:
+        outcome = asyncio.get_running_loop().create_future()
+        now = self.clock()
+        self._entries[key] = (now + self.ttl, outcome)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        # the least recently used keys are the likeliest to have expired
+        while self._entries and next(iter(self._entries.values()))[0] <= now:
+            self._entries.popitem(last=False)
+        return outcome
+
+
+idempotency_cache = IdempotencyCache(settings.idempotency_cache_size, settings.idempotency_ttl_seconds)
+
+registry.gauge("idempotency_keys", "Idempotency keys remembered by this process", lambda: len(idempotency_cache))
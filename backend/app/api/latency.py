@@ -0,0 +1,67 @@
+import itertools
+import random
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+
+class LatencyModel(ABC):
+    """Source of the artificial processing delay every handler and lifecycle transition waits for."""
+
+    @abstractmethod
+    def next_delay(self) -> float:
+        ...
+
+
+class ZeroLatency(LatencyModel):
+
+    def next_delay(self) -> float:
+        return 0.0
+
+
+class FixedLatency(LatencyModel):
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def next_delay(self) -> float:
+        return self.seconds
+
+
+class UniformLatency(LatencyModel):
+
+    def __init__(self, low: float, high: float, seed: int | None = None):
+        self.low = low
+        self.high = high
+        self._random = random.Random(seed)
+
+    def next_delay(self) -> float:
+        return self._random.uniform(self.low, self.high)
+
+
+class TraceLatency(LatencyModel):
+    """Replays delays recorded one per line (in seconds), starting over once the trace is exhausted."""
+
+    def __init__(self, path: Path):
+        delays = [float(line) for line in path.read_text().split() if line]
+        if not delays:
+            raise ValueError(f"Latency trace '{path}' holds no delays")
+        self._delays = itertools.cycle(delays)
+
+    def next_delay(self) -> float:
+        return next(self._delays)
+
+
+def latency_model_from_spec(spec: str) -> LatencyModel:
+    """Build a model from `zero`, `fixed:<s>`, `uniform:<low>:<high>[:<seed>]` or `trace:<path>`."""
+    kind, _, arguments = spec.partition(":")
+    match kind:
+        case "zero":
+            return ZeroLatency()
+        case "fixed":
+            return FixedLatency(float(arguments))
+        case "uniform":
+            low, high, *seed = arguments.split(":")
+            return UniformLatency(float(low), float(high), int(seed[0]) if seed else None)
+        case "trace":
+            return TraceLatency(Path(arguments))
+    raise ValueError(f"Unknown latency model '{spec}'")
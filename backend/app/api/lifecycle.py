@@ -0,0 +1,163 @@
+import asyncio
+import heapq
+import logging
+from itertools import count
+from typing import Callable
+
+from app.api.metrics import lifecycle_lag, lifecycle_transition_latency, registry
+from app.api.order_store import OrderStore
+from app.api.utils import orders_db, next_delay
+from app.api.websocket_manager import WebSocketManager, order_update, ws_manager
+from app.model.trading_platform_model import OrderStatus
+
+ORDER_LIFECYCLE = (OrderStatus.pending, OrderStatus.executed, OrderStatus.cancelled)
+
+logger = logging.getLogger(__name__)
+
+
+class OrderLifecycleScheduler:
+    """Drives every order through its status lifecycle from a single task.
+
+    Due transitions live in a heap keyed by their deadline; each tick pops everything that is due,
+    applies the transitions to the store and publishes the resulting updates as one grouped broadcast.
+    Descheduled orders leave their timer behind, it is skipped when popped and compacted away once
+    such timers make up half of the heap. An order whose transition fails drops out of its lifecycle,
+    the others carry on.
+    """
+    COMPACTION_THRESHOLD = 64
+
+    def __init__(self,
+                 store: OrderStore,
+                 manager: WebSocketManager,
+                 delay: Callable[[], float] = next_delay,
+                 tick: float = 0.005):
+        self.store = store
+        self.manager = manager
+        self.delay = delay
+        self.tick = tick
+        # (deadline, tie breaker, order id, lifecycle stage, scheduled at)
+        self._timers: list[tuple[float, int, str, int, float]] = []
+        self._sequence = count()
+        # order id -> tie breaker of its live timer, timers of descheduled orders stay in the heap until popped
+        self._scheduled: dict[str, int] = {}
+        self._stale = 0
+        self._on_done: dict[str, Callable[[], None]] = {}
+        self._wakeup = asyncio.Event()
+        self._runner: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._scheduled)
+
+    def schedule(self, order_id: str, on_done: Callable[[], None] | None = None, stage: int = 0) -> None:
+        """Schedule the order's next transition, `stage` indexes the status it is about to move to."""
+        if on_done is not None:
+            self._on_done[order_id] = on_done
+        self._push(order_id, stage)
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self.run())
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            due = []
+            while self._timers and self._timers[0][0] <= now:
+                timer = heapq.heappop(self._timers)
+                if self._scheduled.get(timer[2]) == timer[1]:
+                    del self._scheduled[timer[2]]
+                    due.append(timer)
+                else:
+                    self._stale -= 1
+            if due:
+                try:
+                    await self._fire(due, now)
+                except Exception:
+                    logger.exception("Broadcasting %d lifecycle transitions failed", len(due))
+            self._wakeup.clear()
+            timeout = max(self._timers[0][0] - loop.time(), self.tick) if self._timers else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except TimeoutError:
+                pass
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+
+    async def _fire(self, due: list[tuple[float, int, str, int, float]], now: float) -> None:
+        messages = []
+        finished = []
+        for deadline, _, order_id, stage, scheduled_at in due:
+            if order_id not in self.store:
+                finished.append(order_id)
+                continue
+            order_status = ORDER_LIFECYCLE[stage]
+            lifecycle_lag.observe(now - deadline)
+            lifecycle_transition_latency.observe(now - scheduled_at, order_status.value)
+            try:
+                order = self.store.set_status(order_id, order_status)
+            except Exception:
+                logger.exception("Moving order %s to %s failed", order_id, order_status.value)
+                finished.append(order_id)
+                continue
+            messages.append(order_update(order))
+            if stage + 1 < len(ORDER_LIFECYCLE):
+                self._push(order_id, stage + 1)
+            else:
+                finished.append(order_id)
+        try:
+            if messages:
+                await self.manager.broadcast_many(messages)
+        finally:
+            for order_id in finished:
+                self._finish(order_id)
+
+    def _push(self, order_id: str, stage: int) -> None:
+        now = asyncio.get_running_loop().time()
+        deadline = now + self.delay()
+        if not self._timers or deadline < self._timers[0][0]:
+            self._wakeup.set()
+        if order_id in self._scheduled:
+            # scheduled again before its previous timer fired
+            self._stale += 1
+        sequence = self._scheduled[order_id] = next(self._sequence)
+        heapq.heappush(self._timers, (deadline, sequence, order_id, stage, now))
+
+    def deschedule(self, order_id: str) -> bool:
+        """Drop the order's remaining transitions in O(1), False when it had none left."""
+        if self._scheduled.pop(order_id, None) is None:
+            return False
+        self._stale += 1
+        if self._stale > max(self.COMPACTION_THRESHOLD, len(self._timers) // 2):
+            self._timers = [timer for timer in self._timers if self._scheduled.get(timer[2]) == timer[1]]
+            heapq.heapify(self._timers)
+            self._stale = 0
+        self._finish(order_id)
+        return True
+
+    def resume(self) -> None:
+        """Schedule the remaining transitions of every order found in the store, e.g. after recovery."""
+        for order in self.store:
+            if order.side is not None:
+                # matched orders change status when they trade, not on a timer
+                continue
+            stage = ORDER_LIFECYCLE.index(OrderStatus(order.status)) + 1
+            if stage < len(ORDER_LIFECYCLE):
+                self.schedule(order.id, stage=stage)
+
+    def _finish(self, order_id: str) -> None:
+        self.manager.release_order(order_id)
+        if on_done := self._on_done.pop(order_id, None):
+            on_done()
+
+
+lifecycle_scheduler = OrderLifecycleScheduler(orders_db, ws_manager)
+
+registry.gauge("order_lifecycle_scheduled_transitions", "Status transitions waiting in the lifecycle scheduler",
+               lambda: len(lifecycle_scheduler))
+registry.gauge("orders_stored", "Orders currently held by the order store", lambda: len(orders_db))
@@ -0,0 +1,157 @@
+from collections import defaultdict, deque
+from functools import partial
+
+import orjson
+
+from app.api.broker import WORKER_ID, Broker
+from app.api.websocket_manager import ClientConnection, WebSocketManager, encode_message, ws_manager
+
+
+class DepthUpdate:
+    """Level changes of one symbol's book taking it from `previous_sequence` to `sequence`."""
+    __slots__ = ("stocks", "previous_sequence", "sequence", "changes", "_payload")
+
+    def __init__(self, stocks: str, previous_sequence: int, sequence: int, changes: dict[tuple[str, float], list]):
+        self.stocks = stocks
+        self.previous_sequence = previous_sequence
+        self.sequence = sequence
+        # (side, price) -> [size delta, size afterwards]
+        self.changes = changes
+        self._payload: str | None = None
+
+    @classmethod
+    def from_event(cls, stocks: str, sequence: int, changes: list[list]) -> "DepthUpdate":
+        return cls(stocks, sequence - 1, sequence, {(side, price): [delta, size] for side, price, delta, size in changes})
+
+    def merged(self, later: "DepthUpdate") -> "DepthUpdate":
+        """One update with the effect of both, for a client that has not been sent this one yet."""
+        changes = dict(self.changes)
+        for key, (delta, size) in later.changes.items():
+            changes[key] = [changes[key][0] + delta, size] if key in changes else [delta, size]
+        return DepthUpdate(self.stocks, self.previous_sequence, later.sequence, changes)
+
+    def encode(self) -> str:
+        # shared by every client the update was not merged for, so it is encoded at most once
+        if self._payload is None:
+            self._payload = encode_message({"type": "depth",
+                                            "stocks": self.stocks,
+                                            "previous_sequence": self.previous_sequence,
+                                            "sequence": self.sequence,
+                                            "changes": [[side, price, delta, size]
+                                                        for (side, price), (delta, size) in self.changes.items()]})
+        return self._payload
+
+
+class BookSnapshot:
+    """Size of every level of one symbol's book as of `sequence`."""
+    __slots__ = ("stocks", "sequence", "bids", "asks")
+
+    def __init__(self, stocks: str, sequence: int, bids: dict[float, float], asks: dict[float, float]):
+        self.stocks = stocks
+        self.sequence = sequence
+        self.bids = bids
+        self.asks = asks
+
+    def merged(self, later: DepthUpdate) -> "BookSnapshot":
+        bids, asks = dict(self.bids), dict(self.asks)
+        for (side, price), (_, size) in later.changes.items():
+            levels = bids if side == "buy" else asks
+            if size > 0:
+                levels[price] = size
+            else:
+                levels.pop(price, None)
+        return BookSnapshot(self.stocks, later.sequence, bids, asks)
+
+    def encode(self) -> str:
+        return encode_message({"type": "book",
+                               "stocks": self.stocks,
+                               "sequence": self.sequence,
+                               "bids": [[price, self.bids[price]] for price in sorted(self.bids, reverse=True)],
+                               "asks": [[price, self.asks[price]] for price in sorted(self.asks)]})
+
+
+class MarketDataFeed:
+    """Aggregated depth of the order books for WebSocket clients: a book snapshot, then incremental updates.
+
+    Updates of a symbol are numbered by its book. Clients that fall behind get queued updates merged
+    rather than dropped, so they always see consecutive sequence numbers unless their queue overflowed;
+    a client that notices a gap asks for a resync and gets a fresh snapshot. With a broker updates
+    reach every worker, arriving out of order they are held back until the missing ones came in.
+    """
+    CHANNEL = "market_data"
+    HISTORY = 256
+
+    def __init__(self, manager: WebSocketManager):
+        self.manager = manager
+        self._sequence: dict[str, int] = {}
+        self._early: dict[str, dict[int, DepthUpdate]] = defaultdict(dict)
+        # recent updates, replayed to clients whose snapshot is older than the feed
+        self._history: dict[str, deque[DepthUpdate]] = defaultdict(partial(deque, maxlen=self.HISTORY))
+        self._broker: Broker | None = None
+
+    async def attach_broker(self, broker: Broker) -> None:
+        self._broker = broker
+        await broker.subscribe(self.CHANNEL, self._receive)
+
+    def publish(self, stocks: str, sequence: int, changes: list[list]) -> None:
+        if self._broker is not None:
+            self._broker.publish(self.CHANNEL, orjson.dumps([WORKER_ID, stocks, sequence, changes]))
+        self._accept(DepthUpdate.from_event(stocks, sequence, changes))
+
+    def send_book(self,
+                  connection: ClientConnection,
+                  stocks: str,
+                  depth: tuple[int, list[list[float]], list[list[float]]]) -> None:
+        """Send a subscriber the book as of `depth`, followed by any newer update the feed already has."""
+        sequence, bids, asks = depth
+        book = BookSnapshot(stocks, sequence, dict(bids), dict(asks))
+        key = ("depth", stocks)
+        if key in connection.messages:
+            # the book supersedes the update the client is still waiting for and takes its place in the queue
+            connection.messages[key] = book
+        elif not connection.enqueue(book, key):
+            self.manager.drop(connection)
+            return
+        connection.market_data[stocks] = sequence
+        for update in self._history.get(stocks, ()):
+            self._send(connection, update)
+
+    def _receive(self, data: bytes) -> None:
+        origin, stocks, sequence, changes = orjson.loads(data)
+        if origin != WORKER_ID:
+            self._accept(DepthUpdate.from_event(stocks, sequence, changes))
+
+    def _accept(self, update: DepthUpdate) -> None:
+        stocks = update.stocks
+        latest = self._sequence.get(stocks)
+        if latest is not None and update.sequence <= latest:
+            return
+        early = self._early[stocks]
+        if latest is not None and update.previous_sequence != latest:
+            early[update.sequence] = update
+            if len(early) <= self.HISTORY:
+                return
+            # whatever is missing is not coming, carry on and let clients resync on the gap
+            update = early.pop(min(early))
+        while update is not None:
+            self._deliver(update)
+            update = early.pop(update.sequence + 1, None)
+        if not early:
+            del self._early[stocks]
+
+    def _deliver(self, update: DepthUpdate) -> None:
+        self._sequence[update.stocks] = update.sequence
+        self._history[update.stocks].append(update)
+        for connection in list(self.manager.market_data_subscribers(update.stocks)):
+            self._send(connection, update)
+
+    def _send(self, connection: ClientConnection, update: DepthUpdate) -> None:
+        sent = connection.market_data.get(update.stocks)
+        if sent is None or update.sequence <= sent:
+            return
+        connection.market_data[update.stocks] = update.sequence
+        if not connection.enqueue_mergeable(update, ("depth", update.stocks)):
+            self.manager.drop(connection)
+
+
+market_data = MarketDataFeed(ws_manager)
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from contextlib import suppress
+
+from app.api.market_data import MarketDataFeed, market_data
+from app.api.matching_shard import ShardedOrderBooks, shard_of
+from app.api.metrics import registry
+from app.api.order_book import Event, OrderBooks, order_fields
+from app.api.order_store import OrderStore
+from app.api.utils import orders_db
+from app.api.websocket_manager import BroadcastMessage, WebSocketManager, encode_message, order_update, ws_manager
+from app.config import settings
+from app.model.trading_platform_model import Fill, OrderOutput, OrderStatus
+
+logger = logging.getLogger(__name__)
+
+
+class MatchingEngine:
+    """Matches orders that carry a side against per-symbol books and records the outcome in the store.
+
+    The books live in this process, or in shard processes when `shards` is given. Either way the
+    resulting fills are broadcast next to the updates of the orders involved.
+    """
+
+    def __init__(self,
+                 store: OrderStore,
+                 manager: WebSocketManager,
+                 market_data: MarketDataFeed,
+                 shards: ShardedOrderBooks | None = None):
+        self.store = store
+        self.manager = manager
+        self.market_data = market_data
+        self.books = OrderBooks()
+        self.shards = shards
+        self._refills: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self.books)
+
+    async def open(self) -> None:
+        if self.shards is not None:
+            self.shards.on_reconnect(self._refill)
+            await self.shards.connect()
+
+    async def close(self) -> None:
+        if self.shards is not None:
+            await self.shards.close()
+
+    async def submit(self, orders: list[OrderOutput]) -> list[OrderOutput]:
+        """Match freshly stored orders one after the other, returns them as they stand afterwards."""
+        fields = [order_fields(order) for order in orders]
+        try:
+            events = self.books.match(fields) if self.shards is None else await self.shards.match(fields)
+        except Exception:
+            # the orders were not placed as far as the caller knows, what a healthy shard took is taken back out
+            for order in orders:
+                self.store.remove(order.id)
+            with suppress(Exception):
+                await self.cancel(orders)
+            raise
+        latest = await self._apply(events)
+        return [latest.get(order.id, order) for order in orders]
+
+    async def cancel(self, orders: list[OrderOutput]) -> None:
+        """Take resting orders out of their books, publishing the depth of every book they left."""
+        if not orders:
+            return
+        if self.shards is None:
+            events = self.books.cancel(order.id for order in orders)
+        else:
+            events = await self.shards.cancel([(order.id, order.stocks) for order in orders])
+        await self._apply(events)
+
+    async def restore(self, shard: int | None = None) -> None:
+        """Put the pending limit orders found in the store back into their books, e.g. after recovery.
+
+        Only the orders of the symbols of `shard` when given, e.g. once it was restarted.
+        """
+        resting = [order_fields(order) for order in self.store.by_status(OrderStatus.pending)
+                   if order.side is not None and order.price is not None
+                   and (shard is None or shard_of(order.stocks, self.shards.shards) == shard)]
+        events = self.books.rest(resting) if self.shards is None else await self.shards.rest(resting)
+        await self._apply(events)
+
+    async def depth(self, stocks: str) -> tuple[int, list[list[float]], list[list[float]]]:
+        """Sequence number and levels of the book of `stocks`, to start a market data feed from."""
+        return self.books.depth(stocks) if self.shards is None else await self.shards.depth(stocks)
+
+    def _refill(self, shard: int) -> None:
+        task = asyncio.create_task(self._refill_shard(shard))
+        self._refills.add(task)
+        task.add_done_callback(self._refills.discard)
+
+    async def _refill_shard(self, shard: int) -> None:
+        try:
+            await self.restore(shard)
+        except Exception:
+            logger.exception("Refilling the books of matching shard %d failed", shard)
+
+    async def _apply(self, events: list[Event]) -> dict[str, OrderOutput]:
+        messages = []
+        latest = {}
+        for kind, *values in events:
+            if kind == "depth":
+                self.market_data.publish(*values)
+                continue
+            if kind == "fill":
+                stocks, price, quantity, buy_order, sell_order = values
+                fill = Fill(stocks=stocks, price=price, quantity=quantity, buy_order=buy_order, sell_order=sell_order)
+                messages.append(BroadcastMessage(encode_message(fill.model_dump()), None, stocks))
+                continue
+            order_id, order_status, filled = values
+            if order_id not in self.store:
+                # deleted by another worker while its shard was matching
+                continue
+            order = latest[order_id] = self.store.set_status(order_id, OrderStatus(order_status), filled)
+            if order_status != OrderStatus.pending.value:
+                self.manager.release_order(order_id)
+            messages.append(order_update(order))
+        if messages:
+            await self.manager.broadcast_many(messages)
+        return latest
+
+
+matching_engine = MatchingEngine(orders_db,
+                                 ws_manager,
+                                 market_data,
+                                 ShardedOrderBooks(settings.matching_shards, settings.matching_shard_dir)
+                                 if settings.matching_shards else None)
+
+registry.gauge("matching_resting_orders", "Limit orders resting in the order books of this process",
+               lambda: len(matching_engine))
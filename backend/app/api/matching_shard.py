@@ -0,0 +1,253 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from collections import deque
+from contextlib import suppress
+from functools import partial
+from typing import Any, Callable
+
+import orjson
+
+from app.api.connection import connect_with_retry
+from app.api.order_book import Event, OrderBooks, OrderFields
+
+FRAME_LENGTH = struct.Struct("<I")
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(stocks: str, shards: int) -> int:
+    # crc32 rather than hash() so every process agrees on the owner of a symbol
+    return zlib.crc32(stocks.encode()) % shards
+
+
+def shard_path(directory: str, shard: int) -> str:
+    return os.path.join(directory, f"shard-{shard}.sock")
+
+
+def encode_frame(message: Any) -> bytes:
+    payload = orjson.dumps(message)
+    return FRAME_LENGTH.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Any:
+    (length,) = FRAME_LENGTH.unpack(await reader.readexactly(FRAME_LENGTH.size))
+    return orjson.loads(await reader.readexactly(length))
+
+
+class MatchingShard:
+    """Order books of the symbols hashed onto one engine process, serving every front end worker.
+
+    Requests are `[operation, arguments]` frames answered in the order they arrive on a connection.
+    """
+
+    def __init__(self):
+        self.books = OrderBooks()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                operation, arguments = await read_frame(reader)
+                match operation:
+                    case "match":
+                        reply = self.books.match(arguments)
+                    case "cancel":
+                        reply = self.books.cancel(arguments)
+                    case "rest":
+                        reply = self.books.rest(arguments)
+                    case "depth":
+                        reply = self.books.depth(arguments)
+                    case _:
+                        raise ValueError(f"Unknown operation '{operation}'")
+                writer.write(encode_frame(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(path: str) -> None:
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(MatchingShard().handle, path)
+    async with server:
+        await server.serve_forever()
+
+
+def run(path: str) -> None:
+    with suppress(KeyboardInterrupt):
+        asyncio.run(serve(path))
+
+
+def start_shard(path: str) -> multiprocessing.Process:
+    process = multiprocessing.get_context("spawn").Process(target=run, args=(path,), daemon=True)
+    process.start()
+    return process
+
+
+def start_shards(shards: int) -> tuple[str, list[multiprocessing.Process]]:
+    """Start engine processes listening in a fresh directory, returns it along with the processes."""
+    directory = tempfile.mkdtemp()
+    return directory, [start_shard(shard_path(directory, shard)) for shard in range(shards)]
+
+
+class ShardConnection:
+    """Pipelined requests to one shard, replies resolve the oldest waiting request.
+
+    When the shard goes away every waiting request fails, and so does every later one until the
+    connection is back. It is reopened in the background, `restart` is called first to bring back a shard
+    this process started and `on_reconnect` once it is connected again, to refill its books.
+    """
+    RECONNECT_INTERVAL = 0.5
+
+    def __init__(self,
+                 path: str,
+                 connect_timeout: float = 10.0,
+                 restart: Callable[[], None] | None = None,
+                 on_reconnect: Callable[[], None] | None = None):
+        self.path = path
+        self.connect_timeout = connect_timeout
+        self.restart = restart
+        self.on_reconnect = on_reconnect
+        self._waiting: deque[asyncio.Future] = deque()
+        self._writer: asyncio.StreamWriter | None = None
+        self._reader_task: asyncio.Task | None = None
+        self._failure: ConnectionError | None = None
+
+    async def connect(self) -> None:
+        reader, self._writer = await connect_with_retry(partial(asyncio.open_unix_connection, self.path),
+                                                        self.connect_timeout, interval=0.05)
+        self._reader_task = asyncio.create_task(self._keep_reading(reader))
+
+    async def close(self) -> None:
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._reader_task
+            self._reader_task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def request(self, operation: str, arguments: Any) -> asyncio.Future:
+        reply = asyncio.get_running_loop().create_future()
+        if self._writer is None:
+            reply.set_exception(self._failure or ConnectionError(f"Not connected to matching shard {self.path}"))
+            return reply
+        self._waiting.append(reply)
+        self._writer.write(encode_frame([operation, arguments]))
+        return reply
+
+    async def _keep_reading(self, reader: asyncio.StreamReader) -> None:
+        while True:
+            await self._read_replies(reader)
+            if self.restart is not None:
+                self.restart()
+            reader, writer = await connect_with_retry(partial(asyncio.open_unix_connection, self.path), None,
+                                                      interval=self.RECONNECT_INTERVAL)
+            self._writer, self._failure = writer, None
+            logger.info("Reconnected to matching shard %s", self.path)
+            if self.on_reconnect is not None:
+                self.on_reconnect()
+
+    async def _read_replies(self, reader: asyncio.StreamReader) -> None:
+        failure = ConnectionError(f"Connection to matching shard {self.path} closed")
+        try:
+            while True:
+                reply = await read_frame(reader)
+                self._waiting.popleft().set_result(reply)
+        except Exception as e:
+            failure = ConnectionError(f"Matching shard {self.path} went away: {e!r}")
+            logger.error("%s", failure)
+        finally:
+            self._failure = failure
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            while self._waiting:
+                if not (reply := self._waiting.popleft()).done():
+                    reply.set_exception(failure)
+
+
+class ShardedOrderBooks:
+    """Same operations as `OrderBooks`, spread over shard processes which each own a share of the symbols."""
+
+    def __init__(self, shards: int, directory: str = ""):
+        self.shards = shards
+        self.directory = directory
+        self._connections: list[ShardConnection] = []
+        self._processes: list[multiprocessing.Process] = []
+        self._reconnect_listeners: list[Callable[[int], None]] = []
+
+    async def connect(self) -> None:
+        if not self.directory:
+            # nobody started shards for us, so this process is the only front end
+            self.directory, self._processes = start_shards(self.shards)
+        self._connections = [ShardConnection(shard_path(self.directory, shard),
+                                             restart=partial(self._restart, shard) if self._processes else None,
+                                             on_reconnect=partial(self._reconnected, shard))
+                             for shard in range(self.shards)]
+        for connection in self._connections:
+            await connection.connect()
+
+    def on_reconnect(self, listener: Callable[[int], None]) -> None:
+        """Have `listener` called with the number of a shard that came back, its books may be empty."""
+        self._reconnect_listeners.append(listener)
+
+    async def close(self) -> None:
+        for connection in self._connections:
+            await connection.close()
+        if self._processes:
+            for process in self._processes:
+                process.terminate()
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory, self._processes = "", []
+
+    async def match(self, orders: list[OrderFields]) -> list[Event]:
+        replies = [self._connections[shard].request("match", shard_orders)
+                   for shard, shard_orders in self._by_shard(orders).items()]
+        return [event for reply in await asyncio.gather(*replies) for event in reply]
+
+    async def cancel(self, orders: list[tuple[str, str]]) -> list[Event]:
+        """Take resting orders, given as (order id, stocks) pairs, out of the books of their shards."""
+        replies = [self._connections[shard].request("cancel", [order_id for order_id, _ in shard_orders])
+                   for shard, shard_orders in self._by_shard(orders).items()]
+        return [event for reply in await asyncio.gather(*replies) for event in reply]
+
+    async def rest(self, orders: list[OrderFields]) -> list[Event]:
+        replies = [self._connections[shard].request("rest", shard_orders)
+                   for shard, shard_orders in self._by_shard(orders).items()]
+        return [event for reply in await asyncio.gather(*replies) for event in reply]
+
+    async def depth(self, stocks: str) -> tuple[int, list[list[float]], list[list[float]]]:
+        return await self._connections[shard_of(stocks, self.shards)].request("depth", stocks)
+
+    def _restart(self, shard: int) -> None:
+        if not self._processes[shard].is_alive():
+            logger.warning("Matching shard %d exited, restarting it", shard)
+            self._processes[shard] = start_shard(shard_path(self.directory, shard))
+
+    def _reconnected(self, shard: int) -> None:
+        for listener in self._reconnect_listeners:
+            listener(shard)
+
+    def _by_shard(self, orders: list[tuple]) -> dict[int, list[tuple]]:
+        # the symbol is the second field of order fields and of (order id, stocks) pairs alike
+        by_shard: dict[int, list[tuple]] = {}
+        for fields in orders:
+            by_shard.setdefault(shard_of(fields[1], self.shards), []).append(fields)
+        return by_shard
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Matching engine process owning a share of the order books")
+    parser.add_argument("--unix", required=True, help="listen on this Unix socket")
+    args = parser.parse_args()
+    run(args.unix)
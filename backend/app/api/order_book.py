@@ -0,0 +1,234 @@
+import heapq
+from typing import Iterable, NamedTuple
+
+from app.model.trading_platform_model import OrderOutput, OrderSide, OrderStatus
+
+# id, stocks, side, limit price or None, quantity, filled quantity
+OrderFields = tuple[str, str, str, float | None, float, float]
+# ("fill", stocks, price, quantity, buy order id, sell order id), ("order", order id, status, filled quantity)
+# or ("depth", stocks, sequence number, [[side, price, size delta, size], ...])
+Event = tuple
+
+# what float arithmetic can leave of a quantity that was traded in full, far below any real lot
+QUANTITY_EPSILON = 1e-9
+# a heap of prices is rebuilt once it holds this many times more prices than there are levels
+STALE_PRICES_FACTOR = 2
+
+
+def order_fields(order: OrderOutput) -> OrderFields:
+    return order.id, order.stocks, order.side, order.price, order.quantity, order.filled_quantity or 0.0
+
+
+class RestingOrder:
+    __slots__ = ("id", "stocks", "side", "price", "quantity", "remaining", "filled")
+
+    def __init__(self, order_id: str, stocks: str, side: str, price: float | None, quantity: float, filled: float):
+        self.id = order_id
+        self.stocks = stocks
+        self.side = OrderSide(side)
+        self.price = price
+        self.quantity = quantity
+        self.filled = filled
+        # tracked on its own rather than derived from the fill, so a complete fill leaves exactly zero
+        self.remaining = quantity - filled
+
+    def take(self, quantity: float) -> None:
+        self.remaining -= quantity
+        if self.remaining <= QUANTITY_EPSILON:
+            self.remaining = 0.0
+            self.filled = self.quantity
+        else:
+            self.filled += quantity
+
+
+class Trade(NamedTuple):
+    maker: RestingOrder
+    price: float
+    quantity: float
+
+
+class OrderBook:
+    """Limit orders of one symbol waiting for a counterparty, in price-time priority.
+
+    Each side maps a price to its level, an insertion-ordered dict of the orders resting there,
+    so the oldest order comes first and any order leaves its level in O(1). A heap of prices per side
+    finds the best level in O(log n), prices of levels that emptied are dropped from it lazily, from the top
+    as they surface or all at once when they outnumber the live levels.
+    """
+
+    def __init__(self, stocks: str):
+        self.stocks = stocks
+        self._levels: dict[OrderSide, dict[float, dict[str, RestingOrder]]] = {OrderSide.buy: {}, OrderSide.sell: {}}
+        # bids are kept negated so the best price of either side sits at the top of its heap
+        self._prices: dict[OrderSide, list[float]] = {OrderSide.buy: [], OrderSide.sell: []}
+        # quantity resting at every price, and how it changed since the last depth event
+        self._depth: dict[OrderSide, dict[float, float]] = {OrderSide.buy: {}, OrderSide.sell: {}}
+        self._changes: dict[tuple[OrderSide, float], float] = {}
+        self.sequence = 0
+
+    def __len__(self) -> int:
+        return sum(len(level) for levels in self._levels.values() for level in levels.values())
+
+    def best_price(self, side: OrderSide) -> float | None:
+        levels, prices = self._levels[side], self._prices[side]
+        while prices:
+            price = -prices[0] if side is OrderSide.buy else prices[0]
+            if price in levels:
+                return price
+            heapq.heappop(prices)
+        return None
+
+    def match(self, taker: RestingOrder) -> list[Trade]:
+        """Fill `taker` from the opposite side as far as it goes, at its limit price or better."""
+        opposite = OrderSide.sell if taker.side is OrderSide.buy else OrderSide.buy
+        levels = self._levels[opposite]
+        trades = []
+        while taker.remaining > 0 and (best := self.best_price(opposite)) is not None:
+            if taker.price is not None and (best > taker.price if taker.side is OrderSide.buy else best < taker.price):
+                break
+            level = levels[best]
+            while taker.remaining > 0 and level:
+                maker = next(iter(level.values()))
+                traded = min(taker.remaining, maker.remaining)
+                if abs(taker.remaining - maker.remaining) <= QUANTITY_EPSILON:
+                    # the same quantity short of a rounding error fills both
+                    traded = maker.remaining
+                maker.take(traded)
+                taker.take(traded)
+                trades.append(Trade(maker, best, traded))
+                self._change(opposite, best, -traded)
+                if maker.remaining <= 0:
+                    del level[maker.id]
+            if not level:
+                self._drop_level(opposite, best)
+        return trades
+
+    def rest(self, order: RestingOrder) -> None:
+        levels = self._levels[order.side]
+        if order.price not in levels:
+            levels[order.price] = {}
+            heapq.heappush(self._prices[order.side], -order.price if order.side is OrderSide.buy else order.price)
+        levels[order.price][order.id] = order
+        self._change(order.side, order.price, order.remaining)
+
+    def cancel(self, order: RestingOrder) -> None:
+        levels = self._levels[order.side]
+        level = levels[order.price]
+        del level[order.id]
+        self._change(order.side, order.price, -order.remaining)
+        if not level:
+            self._drop_level(order.side, order.price)
+
+    def depth(self) -> tuple[int, list[list[float]], list[list[float]]]:
+        """Sequence number of the latest depth event with the size of every bid and ask level, best first."""
+        return (self.sequence,
+                [[price, self._depth[OrderSide.buy][price]] for price in sorted(self._depth[OrderSide.buy],
+                                                                                reverse=True)],
+                [[price, self._depth[OrderSide.sell][price]] for price in sorted(self._depth[OrderSide.sell])])
+
+    def depth_event(self) -> Event | None:
+        """Depth changes made since the previous event, which is numbered one less."""
+        if not self._changes:
+            return None
+        self.sequence += 1
+        changes = [[side.value, price, delta, self._depth[side].get(price, 0.0)]
+                   for (side, price), delta in self._changes.items()]
+        self._changes.clear()
+        return "depth", self.stocks, self.sequence, changes
+
+    def _drop_level(self, side: OrderSide, price: float) -> None:
+        levels, prices = self._levels[side], self._prices[side]
+        del levels[price]
+        del self._depth[side][price]
+        if len(prices) > STALE_PRICES_FACTOR * len(levels) + 1:
+            self._prices[side] = [-live for live in levels] if side is OrderSide.buy else list(levels)
+            heapq.heapify(self._prices[side])
+
+    def _change(self, side: OrderSide, price: float, delta: float) -> None:
+        depth = self._depth[side]
+        depth[price] = depth.get(price, 0.0) + delta
+        self._changes[(side, price)] = self._changes.get((side, price), 0.0) + delta
+
+
+class OrderBooks:
+    """The books of any number of symbols, speaking in plain tuples so they can live in another process.
+
+    An order that is not filled completely rests in its book as pending when it has a limit price
+    and is cancelled otherwise.
+    """
+
+    def __init__(self):
+        self._books: dict[str, OrderBook] = {}
+        # id of every resting order -> the order in its book, for cancelling without a search
+        self._resting: dict[str, RestingOrder] = {}
+
+    def __len__(self) -> int:
+        return len(self._resting)
+
+    def book(self, stocks: str) -> OrderBook:
+        if (book := self._books.get(stocks)) is None:
+            book = self._books[stocks] = OrderBook(stocks)
+        return book
+
+    def match(self, orders: Iterable[OrderFields]) -> list[Event]:
+        """Match orders one after the other, returns the fills and the orders they changed, in that order."""
+        events = []
+        for fields in orders:
+            taker = RestingOrder(*fields)
+            book = self.book(taker.stocks)
+            for trade in book.match(taker):
+                buy, sell = (taker, trade.maker) if taker.side is OrderSide.buy else (trade.maker, taker)
+                events.append(("fill", taker.stocks, trade.price, trade.quantity, buy.id, sell.id))
+                events.append(self._event(trade.maker))
+            if taker.remaining > 0 and taker.price is not None:
+                book.rest(taker)
+                self._resting[taker.id] = taker
+            events.append(self._event(taker))
+            if depth := book.depth_event():
+                events.append(depth)
+        return events
+
+    def cancel(self, order_ids: Iterable[str]) -> list[Event]:
+        """Take resting orders out of their books, returns one depth event per book that changed.
+
+        Ids of orders that are not resting, e.g. because they were filled meanwhile, are ignored.
+        """
+        books = {}
+        for order_id in order_ids:
+            if (order := self._resting.pop(order_id, None)) is None:
+                continue
+            book = books[order.stocks] = self._books[order.stocks]
+            book.cancel(order)
+        return [book.depth_event() for book in books.values()]
+
+    def rest(self, orders: Iterable[OrderFields]) -> list[Event]:
+        """Put orders straight into their books without matching them, e.g. after recovery.
+
+        Orders already resting are left as they are, every worker refills a restarted shard.
+        """
+        books = {}
+        for fields in orders:
+            if fields[0] in self._resting:
+                continue
+            order = RestingOrder(*fields)
+            book = books[order.stocks] = self.book(order.stocks)
+            book.rest(order)
+            self._resting[order.id] = order
+        return [book.depth_event() for book in books.values()]
+
+    def depth(self, stocks: str) -> tuple[int, list[list[float]], list[list[float]]]:
+        if (book := self._books.get(stocks)) is None:
+            # a symbol nobody traded yet, asking must not create a book for it
+            return 0, [], []
+        return book.depth()
+
+    def _event(self, order: RestingOrder) -> Event:
+        if order.remaining <= 0:
+            order_status = OrderStatus.executed
+            self._resting.pop(order.id, None)
+        elif order.id in self._resting:
+            order_status = OrderStatus.pending
+        else:
+            # what is left of a market order has nothing to rest on
+            order_status = OrderStatus.cancelled
+        return "order", order.id, order_status.value, order.filled
@@ -0,0 +1,20 @@
+from app.model.trading_platform_model import OrderSide, OrderStatus
+
+STATUSES = tuple(OrderStatus)
+STATUS_NUMBERS = {order_status: number for number, order_status in enumerate(STATUSES)}
+# side number 0 marks orders which are not matched
+SIDES = (None, *OrderSide)
+SIDE_NUMBERS = {side: number for number, side in enumerate(SIDES)}
+
+
+def pack_order_id(order_id: str) -> int:
+    """Turn a UUID string into its 128-bit number, raising ValueError for anything else."""
+    digits = order_id.replace("-", "")
+    if len(order_id) != 36 or len(digits) != 32:
+        raise ValueError(f"'{order_id}' is not an order id")
+    return int(digits, 16)
+
+
+def unpack_order_id(number: int) -> str:
+    digits = number.to_bytes(16).hex()
+    return f"{digits[:8]}-{digits[8:12]}-{digits[12:16]}-{digits[16:20]}-{digits[20:]}"
@@ -0,0 +1,84 @@
+import asyncio
+from typing import AsyncIterator
+
+from app.api.broker import WORKER_ID
+from app.api.metrics import registry
+from app.api.websocket_manager import BroadcastMessage, WebSocketManager, ws_manager
+from app.config import settings
+
+KEEPALIVE = b": keepalive\n\n"
+# tells a resuming client that events were missed, e.g. it reconnected to another worker
+GAP = b"event: gap\ndata: \n\n"
+
+
+class OrderEvents:
+    """Broadcasts as Server-Sent Events, framed once into a ring of recent events every stream reads from.
+
+    A stream only holds its position in the ring, so a passive subscriber costs a wake-up per batch of
+    broadcasts. A stream that falls a whole ring behind is ended and its client resumes with Last-Event-ID.
+    """
+
+    def __init__(self, manager: WebSocketManager, history_size: int, keepalive: float):
+        self.history_size = history_size
+        self.keepalive = keepalive
+        self.streams = 0
+        # event `sequence` lives at sequence % history_size as (symbol, frame)
+        self._history: list[tuple[str | None, bytes] | None] = [None] * history_size
+        self._sequence = 0
+        self._new_events = asyncio.Event()
+        self._id_prefix = f"{WORKER_ID}-"
+        manager.add_listener(self._receive)
+
+    def subscribe(self, last_event_id: str | None = None, stocks: str | None = None) -> AsyncIterator[bytes]:
+        """Frames of the events after `last_event_id`, or from now on, optionally of one symbol only."""
+        position = self._resume_position(last_event_id) if last_event_id is not None else self._sequence
+        if position is None:
+            return self._stream(self._sequence, stocks, GAP)
+        return self._stream(position, stocks)
+
+    def _resume_position(self, last_event_id: str) -> int | None:
+        sequence = last_event_id.removeprefix(self._id_prefix)
+        if sequence == last_event_id or not sequence.isdigit():
+            return None
+        if not self._sequence - self.history_size <= int(sequence) <= self._sequence:
+            return None
+        return int(sequence)
+
+    async def _stream(self, position: int, stocks: str | None, first: bytes = b"") -> AsyncIterator[bytes]:
+        self.streams += 1
+        try:
+            if first:
+                yield first
+            while True:
+                if position == self._sequence:
+                    try:
+                        async with asyncio.timeout(self.keepalive):
+                            await self._new_events.wait()
+                    except TimeoutError:
+                        # keeps proxies from timing out idle streams
+                        yield KEEPALIVE
+                        continue
+                if self._sequence - position > self.history_size:
+                    return
+                events = (self._history[sequence % self.history_size]
+                          for sequence in range(position + 1, self._sequence + 1))
+                position = self._sequence
+                if frames := [frame for symbol, frame in events if stocks is None or symbol == stocks]:
+                    yield b"".join(frames)
+        finally:
+            self.streams -= 1
+
+    def _receive(self, messages: list[BroadcastMessage]) -> None:
+        for message in messages:
+            self._sequence += 1
+            frame = f"id: {self._id_prefix}{self._sequence}\ndata: {message.payload}\n\n".encode()
+            self._history[self._sequence % self.history_size] = (message.stocks, frame)
+        # wakes every stream waiting, later ones wait for the next batch
+        self._new_events.set()
+        self._new_events = asyncio.Event()
+
+
+order_events = OrderEvents(ws_manager, settings.sse_history_size, settings.sse_keepalive_seconds)
+
+registry.gauge("order_event_streams", "Open Server-Sent Events streams of order updates",
+               lambda: order_events.streams)
@@ -0,0 +1,486 @@
+import asyncio
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from functools import partial
+from itertools import islice
+from typing import Iterator
+
+import orjson
+from pydantic import TypeAdapter
+
+from app.api.broker import WORKER_ID, Broker
+from app.api.order_encoding import STATUS_NUMBERS, pack_order_id
+from app.api.snapshot import OrderColumns, OrderSnapshot
+from app.api.wal import WriteAheadLog
+from app.model.trading_platform_model import OrderOutput, OrderStatus
+
+order_outputs_adapter = TypeAdapter(list[OrderOutput])
+
+
+class OrderStore(ABC):
+    __slots__ = ()
+
+    @abstractmethod
+    def add(self, order: OrderOutput) -> None:
+        ...
+
+    @abstractmethod
+    def get(self, order_id: str) -> OrderOutput | None:
+        ...
+
+    @abstractmethod
+    def remove(self, order_id: str) -> OrderOutput | None:
+        ...
+
+    @abstractmethod
+    def set_status(self,
+                   order_id: str,
+                   order_status: OrderStatus,
+                   filled_quantity: float | None = None) -> OrderOutput:
+        """Move an order to `order_status`, also recording how much of a matched order is filled when given."""
+
+    @abstractmethod
+    def by_status(self, order_status: OrderStatus) -> Iterator[OrderOutput]:
+        ...
+
+    @abstractmethod
+    def by_stocks(self, stocks: str) -> Iterator[OrderOutput]:
+        ...
+
+    @abstractmethod
+    def page(self,
+             limit: int,
+             cursor: int | None = None,
+             order_status: OrderStatus | None = None,
+             stocks: str | None = None) -> tuple[list[OrderOutput], int | None]:
+        """Return up to `limit` orders placed after `cursor` and the cursor of the next page, if any."""
+
+    @abstractmethod
+    def __iter__(self) -> Iterator[OrderOutput]:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    async def open(self) -> None:
+        """Load persisted state, called once on application startup."""
+
+    async def close(self) -> None:
+        """Release resources, called once on application shutdown."""
+
+    async def sync(self) -> None:
+        """Wait until every mutation made so far is durable."""
+
+    def load_snapshot(self, snapshot: OrderSnapshot) -> None:
+        columns = snapshot.columns()
+        for row in range(len(columns)):
+            self.add(OrderOutput.model_validate(columns.fields(row)))
+
+    def columns(self) -> OrderColumns:
+        """Copy of the book, consistent with every mutation made so far, to be written out elsewhere."""
+        symbols = {}
+        columns = OrderColumns()
+        for order in self:
+            columns.append_order(order, symbols.setdefault(order.stocks, len(symbols)))
+        columns.symbols.extend(symbols)
+        return columns
+
+    def __contains__(self, order_id: str) -> bool:
+        return self.get(order_id) is not None
+
+    def __getitem__(self, order_id: str) -> OrderOutput:
+        if (order := self.get(order_id)) is None:
+            raise KeyError(order_id)
+        return order
+
+
+class InMemoryOrderStore(OrderStore):
+    """Insertion-ordered order book with secondary indexes by status and by symbol.
+
+    Every order gets a monotonically increasing sequence number which doubles as the pagination
+    cursor and as its row in typed columns holding the 128-bit id, quantity, status number, number
+    of the interned symbol and the matching fields. `OrderOutput` models are only built for the orders
+    a caller asks for, so an order costs tens of bytes rather than a pydantic model plus a UUID string.
+    Indexes are sorted arrays of sequence numbers, so a page is a bisect plus a short slice
+    no matter how large the book grows. A status transition appends the order to the index of its new
+    status, the index is put back in order when it is next read. Removals and transitions leave stale
+    entries behind which are skipped on read and compacted once they outnumber the live ones.
+    Returned models are copies, the book only changes through the store's methods.
+    Iterators are live views, take a snapshot before awaiting in between items.
+    """
+    __slots__ = ("_sequence", "_columns", "_symbol_numbers", "_by_status", "_by_stocks", "_stale", "_unsorted")
+
+    COMPACTION_THRESHOLD = 64
+
+    def __init__(self):
+        # 128-bit order id -> sequence number
+        self._sequence: dict[int, int] = {}
+        # rows indexed by sequence number, the id is None once the order was removed
+        self._columns = OrderColumns()
+        self._symbol_numbers: dict[str, int] = {}
+        self._by_status: dict[int, array] = defaultdict(partial(array, "Q"))
+        self._by_stocks: dict[int, array] = defaultdict(partial(array, "Q"))
+        self._stale: Counter = Counter()
+        # status number -> length of the sorted head of its index, the rest was appended by transitions
+        self._unsorted: dict[int, int] = {}
+
+    def add(self, order: OrderOutput) -> None:
+        order_id = pack_order_id(order.id)
+        if order_id in self._sequence:
+            self._remove(order_id)
+        sequence = len(self._columns)
+        self._columns.append_order(order, self._symbol(order.stocks))
+        self._index(order_id, sequence)
+
+    def get(self, order_id: str) -> OrderOutput | None:
+        sequence = self._find(order_id)
+        return None if sequence is None else self._order(sequence)
+
+    def remove(self, order_id: str) -> OrderOutput | None:
+        sequence = self._find(order_id)
+        if sequence is None:
+            return None
+        order = self._order(sequence)
+        self._remove(self._columns.ids[sequence])
+        return order
+
+    def set_status(self,
+                   order_id: str,
+                   order_status: OrderStatus,
+                   filled_quantity: float | None = None) -> OrderOutput:
+        sequence = self._find(order_id)
+        if sequence is None:
+            raise KeyError(order_id)
+        if filled_quantity is not None:
+            self._columns.filled[sequence] = filled_quantity
+        status_number = STATUS_NUMBERS[order_status]
+        previous_status = self._columns.statuses[sequence]
+        if previous_status != status_number:
+            index = self._by_status[status_number]
+            if index and index[-1] >= sequence:
+                self._unsorted.setdefault(status_number, len(index))
+            index.append(sequence)
+            self._columns.statuses[sequence] = status_number
+            self._mark_stale("status", previous_status)
+        return self._order(sequence)
+
+    def by_status(self, order_status: OrderStatus) -> Iterator[OrderOutput]:
+        status_number = STATUS_NUMBERS[order_status]
+        return self._scan(self._status_index(status_number), 0, status_number)
+
+    def by_stocks(self, stocks: str) -> Iterator[OrderOutput]:
+        return self._scan(self._by_stocks.get(self._symbol_numbers.get(stocks), ()), 0, None)
+
+    def page(self,
+             limit: int,
+             cursor: int | None = None,
+             order_status: OrderStatus | None = None,
+             stocks: str | None = None) -> tuple[list[OrderOutput], int | None]:
+        start = 0 if cursor is None else cursor + 1
+        status_number = None if order_status is None else STATUS_NUMBERS[order_status]
+        if stocks is not None:
+            source = self._by_stocks.get(self._symbol_numbers.get(stocks), ())
+        elif status_number is not None:
+            source = self._status_index(status_number)
+        else:
+            source = range(len(self._columns))
+        sequences = list(islice(self._live(source, start, status_number), limit + 1))
+        next_cursor = sequences[limit - 1] if len(sequences) > limit else None
+        orders = order_outputs_adapter.validate_python([self._columns.fields(sequence)
+                                                        for sequence in sequences[:limit]])
+        return orders, next_cursor
+
+    def __iter__(self) -> Iterator[OrderOutput]:
+        for sequence in self._sequence.values():
+            yield self._order(sequence)
+
+    def __len__(self) -> int:
+        return len(self._sequence)
+
+    def __contains__(self, order_id: str) -> bool:
+        return self._find(order_id) is not None
+
+    def load_snapshot(self, snapshot: OrderSnapshot) -> None:
+        if len(self._columns):
+            raise RuntimeError("A snapshot can only be loaded into an empty store")
+        # the columns are adopted as they are, only the lookup table and the indexes are built row by row
+        columns = self._columns = snapshot.columns()
+        self._symbol_numbers = {stocks: symbol for symbol, stocks in enumerate(columns.symbols)}
+        self._sequence = dict(zip(columns.ids, range(len(columns))))
+        for index, column in ((self._by_status, columns.statuses), (self._by_stocks, columns.symbol_of)):
+            for sequence, key in enumerate(column):
+                index[key].append(sequence)
+
+    def columns(self) -> OrderColumns:
+        return self._columns.copy()
+
+    def _index(self, order_id: int, sequence: int) -> None:
+        self._sequence[order_id] = sequence
+        self._by_status[self._columns.statuses[sequence]].append(sequence)
+        self._by_stocks[self._columns.symbol_of[sequence]].append(sequence)
+
+    def _status_index(self, status_number: int) -> array | tuple:
+        """Index of a status in sequence order, merging in the transitions appended since it was last read."""
+        index = self._by_status.get(status_number)
+        if index is None:
+            return ()
+        if (sorted_length := self._unsorted.pop(status_number, None)) is not None:
+            head = index[:sorted_length]
+            appended = index[sorted_length:]
+            # an order back in a status it had before still has its old entry there
+            new = {sequence for sequence in appended
+                   if (position := bisect_left(head, sequence)) == len(head) or head[position] != sequence}
+            self._stale[("status", status_number)] -= len(appended) - len(new)
+            merged = head.tolist()
+            merged.extend(sorted(new))
+            # two sorted runs, merged in linear time
+            merged.sort()
+            index[:] = array("Q", merged)
+        return index
+
+    def _remove(self, order_id: int) -> None:
+        sequence = self._sequence.pop(order_id)
+        self._columns.ids[sequence] = None
+        self._mark_stale("status", self._columns.statuses[sequence])
+        self._mark_stale("stocks", self._columns.symbol_of[sequence])
+
+    def _find(self, order_id: str) -> int | None:
+        try:
+            return self._sequence.get(pack_order_id(order_id))
+        except ValueError:
+            return None
+
+    def _symbol(self, stocks: str) -> int:
+        symbol = self._symbol_numbers.get(stocks)
+        if symbol is None:
+            symbol = self._symbol_numbers[stocks] = len(self._columns.symbols)
+            self._columns.symbols.append(stocks)
+        return symbol
+
+    def _order(self, sequence: int) -> OrderOutput:
+        # validating runs in pydantic-core and is faster than model_construct, which is pure Python
+        return OrderOutput.model_validate(self._columns.fields(sequence))
+
+    def _live(self, index: array | range | tuple, start: int, status_number: int | None) -> Iterator[int]:
+        ids, statuses = self._columns.ids, self._columns.statuses
+        for position in range(bisect_left(index, start), len(index)):
+            sequence = index[position]
+            if ids[sequence] is not None and (status_number is None or statuses[sequence] == status_number):
+                yield sequence
+
+    def _scan(self, index: array | tuple, start: int, status_number: int | None) -> Iterator[OrderOutput]:
+        for sequence in self._live(index, start, status_number):
+            yield self._order(sequence)
+
+    def _mark_stale(self, index_name: str, key: int) -> None:
+        indexes = self._by_status if index_name == "status" else self._by_stocks
+        self._stale[(index_name, key)] += 1
+        # checked against the index as it is, transitions appended to it are only merged in to compact it
+        if self._stale[(index_name, key)] > max(self.COMPACTION_THRESHOLD, len(indexes[key]) // 2):
+            index = self._status_index(key) if index_name == "status" else indexes[key]
+            live = array("Q", self._live(index, 0, key if index_name == "status" else None))
+            del self._stale[(index_name, key)]
+            if live:
+                index[:] = live
+            else:
+                del indexes[key]
+
+
+class RecordingOrderStore(OrderStore):
+    """Wraps a store, passing reads through and handing every mutation as a record to `_record`."""
+    __slots__ = ("_store",)
+
+    def __init__(self, store: OrderStore):
+        self._store = store
+
+    @abstractmethod
+    def _record(self, record: dict) -> None:
+        ...
+
+    async def close(self) -> None:
+        await self._store.close()
+
+    async def sync(self) -> None:
+        await self._store.sync()
+
+    def add(self, order: OrderOutput) -> None:
+        self._store.add(order)
+        self._record(order_record(order))
+
+    def get(self, order_id: str) -> OrderOutput | None:
+        return self._store.get(order_id)
+
+    def remove(self, order_id: str) -> OrderOutput | None:
+        order = self._store.remove(order_id)
+        if order is not None:
+            self._record({"op": "remove", "id": order_id})
+        return order
+
+    def set_status(self,
+                   order_id: str,
+                   order_status: OrderStatus,
+                   filled_quantity: float | None = None) -> OrderOutput:
+        order = self._store.set_status(order_id, order_status, filled_quantity)
+        self._record(status_record(order_id, order_status, filled_quantity))
+        return order
+
+    def by_status(self, order_status: OrderStatus) -> Iterator[OrderOutput]:
+        return self._store.by_status(order_status)
+
+    def by_stocks(self, stocks: str) -> Iterator[OrderOutput]:
+        return self._store.by_stocks(stocks)
+
+    def page(self,
+             limit: int,
+             cursor: int | None = None,
+             order_status: OrderStatus | None = None,
+             stocks: str | None = None) -> tuple[list[OrderOutput], int | None]:
+        return self._store.page(limit, cursor, order_status, stocks)
+
+    def __iter__(self) -> Iterator[OrderOutput]:
+        return iter(self._store)
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def __contains__(self, order_id: str) -> bool:
+        return order_id in self._store
+
+    def columns(self) -> OrderColumns:
+        return self._store.columns()
+
+
+class DurableOrderStore(RecordingOrderStore):
+    """Logs every mutation of the wrapped store to a write-ahead log and rebuilds it from the log on open."""
+    __slots__ = ("_wal",)
+
+    def __init__(self, store: OrderStore, wal: WriteAheadLog):
+        super().__init__(store)
+        self._wal = wal
+        wal.snapshot_source = store.columns
+
+    async def open(self) -> None:
+        snapshot, records = self._wal.recover()
+        if snapshot is not None:
+            self._store.load_snapshot(OrderSnapshot(snapshot))
+        for record in records:
+            apply_record(self._store, record)
+        await self._wal.open()
+
+    async def close(self) -> None:
+        await self._wal.close()
+        await super().close()
+
+    async def sync(self) -> None:
+        await self._wal.sync()
+
+    def _record(self, record: dict) -> None:
+        self._wal.append(record)
+
+
+class ReplicatedOrderStore(RecordingOrderStore):
+    """Keeps the wrapped store in step with the stores of the other workers through a broker.
+
+    Mutations are applied locally and published; those of other workers are applied as they arrive, so an
+    order placed on one worker shows up on the others a moment later. A starting worker asks its peers for
+    their book and replays whatever was published while it waited on top of the first one it receives, and
+    so does a worker whose broker connection came back, to catch up on what it missed and drop the orders
+    its peers no longer have.
+    """
+    __slots__ = ("_broker", "_origin", "_synced", "_backlog", "_book", "_resync")
+
+    CHANNEL = "orders"
+    SYNC_TIMEOUT = 1.0
+
+    def __init__(self, store: OrderStore, broker: Broker, origin: str = WORKER_ID):
+        super().__init__(store)
+        self._broker = broker
+        # tells this store's own records apart, one per worker process
+        self._origin = origin
+        self._synced = False
+        self._backlog: list[dict] = []
+        self._book: asyncio.Future | None = None
+        self._resync: asyncio.Task | None = None
+
+    async def open(self) -> None:
+        await self._store.open()
+        await self._broker.subscribe(self.CHANNEL, self._receive)
+        self._broker.on_reconnect(self._reconnected)
+        await self._sync()
+
+    async def _sync(self) -> None:
+        self._synced = False
+        self._book = asyncio.get_running_loop().create_future()
+        # orders added from here on may be missing from the book and are kept
+        known = [order.id for order in self._store]
+        self._record({"op": "sync"})
+        try:
+            # nobody answers when this is the first worker up
+            orders = await asyncio.wait_for(self._book, self.SYNC_TIMEOUT)
+        except TimeoutError:
+            orders = []
+        else:
+            # removed by other workers while this one was cut off
+            listed = {record["id"] for record in orders}
+            for order_id in known:
+                if order_id not in listed:
+                    self._store.remove(order_id)
+        for record in orders:
+            if record["id"] in self._store:
+                # catching up after a reconnect, orders keep their place
+                self._store.set_status(record["id"], OrderStatus(record["status"]), record.get("filled_quantity"))
+            else:
+                apply_record(self._store, record)
+        for record in self._backlog:
+            apply_record(self._store, record)
+        self._backlog = []
+        self._synced = True
+
+    def _reconnected(self) -> None:
+        self._resync = asyncio.create_task(self._sync())
+
+    def _record(self, record: dict) -> None:
+        self._broker.publish(self.CHANNEL, orjson.dumps({**record, "origin": self._origin}))
+
+    def _receive(self, message: bytes) -> None:
+        record = orjson.loads(message)
+        if record["origin"] == self._origin:
+            return
+        match record["op"]:
+            case "sync":
+                if self._synced:
+                    self._record({"op": "book", "to": record["origin"],
+                                  "orders": [order_record(order) for order in self._store]})
+            case "book":
+                if record["to"] == self._origin and not self._book.done():
+                    self._book.set_result(record["orders"])
+            case _ if not self._synced:
+                self._backlog.append(record)
+            case _:
+                apply_record(self._store, record)
+
+
+def order_record(order: OrderOutput) -> dict:
+    return {"op": "add", **order.model_dump(exclude_none=True)}
+
+
+def status_record(order_id: str, order_status: OrderStatus, filled_quantity: float | None) -> dict:
+    record = {"op": "status", "id": order_id, "status": order_status.value}
+    if filled_quantity is not None:
+        record["filled"] = filled_quantity
+    return record
+
+
+def apply_record(store: OrderStore, record: dict) -> None:
+    """Replay a logged or replicated mutation, applying the same record twice is harmless."""
+    match record["op"]:
+        case "add":
+            store.add(OrderOutput.model_validate(record))
+        case "status":
+            if record["id"] in store:
+                store.set_status(record["id"], OrderStatus(record["status"]), record.get("filled"))
+        case "remove":
+            store.remove(record["id"])
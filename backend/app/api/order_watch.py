@@ -0,0 +1,55 @@
+import asyncio
+from collections import defaultdict
+
+from app.api.metrics import registry
+from app.api.websocket_manager import BroadcastMessage, WebSocketManager, ws_manager
+
+
+def order_etag(order_status: str, filled_quantity: float | None) -> str:
+    # id, symbol, side, price and quantity never change, so status and fill tell the versions of an order apart
+    if filled_quantity is None:
+        return f'"{order_status}"'
+    return f'"{order_status}:{filled_quantity!r}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+class OrderWatch:
+    """Requests parked until an order changes, woken by the update broadcast for it on any worker."""
+
+    def __init__(self, manager: WebSocketManager):
+        self._waiting: dict[str, set[asyncio.Future]] = defaultdict(set)
+        manager.add_listener(self._receive)
+
+    def __len__(self) -> int:
+        return sum(len(waiting) for waiting in self._waiting.values())
+
+    async def wait(self, order_id: str, timeout: float) -> str | None:
+        """The JSON of the order's next update, None when there was none within `timeout` seconds."""
+        change = asyncio.get_running_loop().create_future()
+        self._waiting[order_id].add(change)
+        try:
+            return await asyncio.wait_for(change, timeout)
+        except TimeoutError:
+            return None
+        finally:
+            if (waiting := self._waiting.get(order_id)) is not None:
+                waiting.discard(change)
+                if not waiting:
+                    del self._waiting[order_id]
+
+    def _receive(self, messages: list[BroadcastMessage]) -> None:
+        for message in messages:
+            if message.order_id is not None and (waiting := self._waiting.pop(message.order_id, None)):
+                for change in waiting:
+                    if not change.done():
+                        change.set_result(message.payload)
+
+
+order_watch = OrderWatch(ws_manager)
+
+registry.gauge("order_watch_waiting_requests", "Requests waiting for an order to change", lambda: len(order_watch))
@@ -1,13 +1,26 @@
+import asyncio
 import uuid
+from functools import partial
+from typing import Annotated, AsyncIterator
 
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+import orjson
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from starlette import status
 
-from app.api.websocket_manager import ws_manager
-from app.api.utils import random_delay, orders_db, update_order_status
-from app.model.trading_platform_model import OrderOutput, OrderInput, OrderStatus
+from app.api.cancellation import cancel_orders, is_live
+from app.api.decoding import (decode, decode_body, decode_order_batch, order_batch_adapter, order_input_adapter,
+                              request_body)
+from app.api.idempotency import idempotency_cache
+from app.api.lifecycle import lifecycle_scheduler
+from app.api.matching import matching_engine
+from app.api.order_events import order_events
+from app.api.order_watch import etag_matches, order_etag, order_watch
+from app.api.utils import random_delay, orders_db, place_orders, new_order
+from app.config import settings
+from app.model.trading_platform_model import CancelledOrders, OrderOutput, OrderStatus, OrderResult, RequestError
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 
 @router.get(
@@ -16,10 +29,64 @@ router = APIRouter()
     name="orders:getOrders"
 )
 async def get_orders(
-        # orders: Annotated[list[OrderOutput], Depends(list_orders)]
+        response: Response,
+        limit: Annotated[int, Query(gt=0, le=settings.orders_max_page_size)] = settings.orders_page_size,
+        cursor: Annotated[int | None, Query(ge=0, description="Value of the previous page's "
+                                                              "X-Next-Cursor header")] = None,
+        order_status: Annotated[OrderStatus | None, Query(alias="status")] = None,
+        stocks: str | None = None,
 ) -> list[OrderOutput]:
     await random_delay()
-    return [v for v in orders_db.values()]
+    orders, next_cursor = orders_db.page(limit=limit, cursor=cursor, order_status=order_status, stocks=stocks)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return orders
+
+
+async def stream_orders_ndjson(order_status: OrderStatus | None, stocks: str | None) -> AsyncIterator[bytes]:
+    # walk the book page by page, the cursor keeps the export consistent while orders keep coming in
+    cursor = None
+    while True:
+        orders, cursor = orders_db.page(limit=settings.orders_max_page_size, cursor=cursor,
+                                        order_status=order_status, stocks=stocks)
+        if orders:
+            yield b"".join(orjson.dumps(order.model_dump(exclude_none=True), option=orjson.OPT_APPEND_NEWLINE)
+                           for order in orders)
+        if cursor is None:
+            break
+
+
+@router.get(
+    "/stream",
+    response_class=StreamingResponse,
+    name="orders:streamOrders",
+    responses={status.HTTP_200_OK: {"content": {"application/x-ndjson": {}},
+                                    "description": "Newline delimited JSON, one order per line"}},
+)
+async def stream_orders(
+        order_status: Annotated[OrderStatus | None, Query(alias="status")] = None,
+        stocks: str | None = None,
+) -> StreamingResponse:
+    await random_delay()
+    return StreamingResponse(stream_orders_ndjson(order_status, stocks), media_type="application/x-ndjson")
+
+
+@router.get(
+    "/events",
+    response_class=StreamingResponse,
+    name="orders:streamOrderEvents",
+    responses={status.HTTP_200_OK: {"content": {"text/event-stream": {}},
+                                    "description": "Server-Sent Events, one per order update or fill"}},
+)
+async def stream_order_events(
+        stocks: str | None = None,
+        last_event_id: Annotated[str | None, Header(description="Id of the last event received, "
+                                                                "the stream resumes after it")] = None,
+) -> StreamingResponse:
+    # a read-only subscription like a WebSocket, so it is not delayed
+    return StreamingResponse(order_events.subscribe(last_event_id, stocks),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @router.post(
@@ -28,20 +95,82 @@ async def get_orders(
     response_model_exclude_none=True,
     name="orders:placeOrder",
     status_code=status.HTTP_201_CREATED,
+    openapi_extra=request_body(order_input_adapter),
 )
-async def place_order(order: OrderInput,
-                      background_tasks: BackgroundTasks) -> OrderOutput:
-    order_output = OrderOutput(
-        id=str(uuid.uuid4()),
-        stocks=order.stocks,
-        quantity=order.quantity,
-        status=OrderStatus.pending)
+async def place_order(
+        request: Request,
+        response: Response,
+        idempotency_key: Annotated[str | None, Header(max_length=255, description="Retries with the same key get the "
+                                                                                  "original order")] = None,
+) -> OrderOutput:
+    order_output, repeated = await idempotency_cache.run_once(idempotency_key and ("order", idempotency_key),
+                                                              partial(place_order_from_body, await request.body()))
+    if repeated:
+        response.headers["Idempotent-Replayed"] = "true"
+    return order_output
+
+
+async def place_order_from_body(body: bytes) -> OrderOutput:
+    # the body is parsed and validated in one pass instead of FastAPI's parse, then validate
+    order = decode_body(partial(decode, order_input_adapter), body)
+    order_output = new_order(str(uuid.uuid4()), order)
     await random_delay()
-    orders_db[order_output.id] = order_output
-    background_tasks.add_task(update_order_status, order_output.id, order, ws_manager)
+    orders_db.add(order_output)
+    if order_output.side is not None:
+        [order_output] = await matching_engine.submit([order_output])
+        await orders_db.sync()
+        return order_output
+    await orders_db.sync()
+    lifecycle_scheduler.schedule(order_output.id)
     return order_output
 
 
+@router.post(
+    "/batch",
+    response_model=list[OrderResult],
+    response_model_exclude_none=True,
+    name="orders:placeOrders",
+    status_code=status.HTTP_201_CREATED,
+    openapi_extra=request_body(order_batch_adapter),
+)
+async def place_orders_batch(
+        request: Request,
+        response: Response,
+        idempotency_key: Annotated[str | None, Header(max_length=255, description="Retries with the same key get the "
+                                                                                  "original results")] = None,
+) -> list[OrderResult]:
+    results, repeated = await idempotency_cache.run_once(idempotency_key and ("batch", idempotency_key),
+                                                         partial(place_orders_from_body, await request.body()))
+    if repeated:
+        response.headers["Idempotent-Replayed"] = "true"
+    return results
+
+
+async def place_orders_from_body(body: bytes) -> list[OrderResult]:
+    input_models, errors = decode_body(partial(decode_order_batch, adapter=order_batch_adapter), body)
+    await random_delay()
+    placed = place_orders(input_models)
+    try:
+        matched = iter(await matching_engine.submit([order for order in placed if order and order.side is not None]))
+    except Exception:
+        # the basket fails as a whole, matching took its own orders back out
+        for order in placed:
+            if order and order.side is None:
+                orders_db.remove(order.id)
+        raise
+    placed = [next(matched) if order and order.side is not None else order for order in placed]
+    await orders_db.sync()
+    for order in placed:
+        if order and order.side is None:
+            lifecycle_scheduler.schedule(order.id)
+    return [OrderResult(order=order) if order else
+            OrderResult(errors=[RequestError(message=error.get("msg"),
+                                             input=error.get("input"),
+                                             localization=["body", *error.get("loc")],
+                                             type=error.get("type")) for error in errors[index]])
+            for index, order in enumerate(placed)]
+
+
 @router.get(
     "/{order_id}",
     response_model=OrderOutput,
@@ -49,13 +178,35 @@ async def place_order(order: OrderInput,
     name="orders:getOrder",
     status_code=status.HTTP_200_OK,
 )
-async def get_order_by_id(order_id: str) -> OrderOutput:
-    await random_delay()
+async def get_order_by_id(
+        order_id: str,
+        response: Response,
+        if_none_match: Annotated[str | None, Header()] = None,
+        wait_for_change: Annotated[float | None, Query(gt=0, le=settings.orders_max_wait_seconds,
+                                                       description="Seconds to wait for the order to change when "
+                                                                   "it is still the version the client has")] = None,
+) -> OrderOutput | Response:
     order = orders_db.get(order_id)
-    if order:
-        return order
-    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                        detail=f"Order not found!")
+    if order is None:
+        await random_delay()
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Order not found!")
+    etag = order_etag(order.status, order.filled_quantity)
+    unchanged = if_none_match is not None and etag_matches(if_none_match, etag)
+    if wait_for_change is not None and (unchanged or if_none_match is None):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait_for_change
+        while (payload := await order_watch.wait(order_id, deadline - loop.time())) is not None:
+            changed = orjson.loads(payload)
+            if (changed_etag := order_etag(changed["status"], changed.get("filled_quantity"))) != etag:
+                # the update is the order as GET renders it, sent as it was broadcast
+                return Response(payload, media_type="application/json", headers={"ETag": changed_etag})
+    # versions the client already has cost neither the delay nor serialization
+    if unchanged:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    await random_delay()
+    response.headers["ETag"] = etag
+    return order
 
 
 @router.delete(
@@ -65,10 +216,24 @@ async def get_order_by_id(order_id: str) -> OrderOutput:
 )
 async def cancel_order(order_id: str) -> None:
     await random_delay()
-    if order := orders_db.get(order_id):
-        orders_db.pop(order.id)
-    else:
+    order = orders_db.get(order_id)
+    if order is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Order not found!"
         )
+    await cancel_orders([order])
+    await orders_db.sync()
+
+
+@router.delete(
+    "/",
+    response_model=CancelledOrders,
+    name="orders:cancelOrders",
+    status_code=status.HTTP_200_OK,
+)
+async def cancel_orders_by_stocks(stocks: str) -> CancelledOrders:
+    await random_delay()
+    cancelled = await cancel_orders([order for order in orders_db.by_stocks(stocks) if is_live(order)])
+    await orders_db.sync()
+    return CancelledOrders(cancelled=[order.id for order in cancelled])
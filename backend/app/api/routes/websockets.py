@@ -1,5 +1,8 @@
-import uuid
+import asyncio
+import json
+from functools import partial
 from json import JSONDecodeError
+from typing import Any, NamedTuple
 
 from fastapi import APIRouter
 from pydantic import ValidationError
@@ -7,45 +10,177 @@ from starlette import status
 from starlette.websockets import WebSocket, WebSocketDisconnect
 from websockets import ConnectionClosed
 
-from app.api.utils import orders_db, random_delay
+from app.api.cancellation import cancel_orders, is_live
+from app.api.decoding import decode, decode_order_batch, order_batch_adapter, order_input_adapter, render_errors
+from app.api.idempotency import idempotency_cache
+from app.api.lifecycle import lifecycle_scheduler
+from app.api.market_data import market_data
+from app.api.matching import matching_engine
+from app.api.utils import orders_db, validate_order_batch, place_orders
 from app.api.websocket_manager import ws_manager
-from app.model.trading_platform_model import OrderInput, OrderOutput, OrderStatus, Error, RequestError, RequestErrors
+from app.api.wire_protocol import FrameError, decode_orders
+from app.config import settings
+from app.model.trading_platform_model import (CancelledOrders, CancelRequest, OrderAck, OrderInput, OrderOutput,
+                                              SubscriptionAction, SubscriptionRequest, Subscriptions)
 
 router = APIRouter()
 
 
+class IdempotentOrder(NamedTuple):
+    key: str
+    order: dict[str, Any]
+
+
+# orders with the errors of the rejected ones by index, an order sent with an idempotency key or a control message
+Message = (tuple[list[OrderInput | None], dict[int, list[dict]]] | IdempotentOrder | CancelRequest
+           | SubscriptionRequest)
+
+
+async def receive_frame(websocket: WebSocket) -> str | bytes:
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message["code"], message.get("reason"))
+    return message["bytes"] if message.get("bytes") is not None else message["text"]
+
+
+def decode_frame(frame: str | bytes) -> Message:
+    """Orders are validated straight from the frame, only control messages are parsed before validation.
+
+    So are orders carrying an idempotency key, which are validated only when the key is new.
+    """
+    if isinstance(frame, bytes):
+        return validate_order_batch(decode_orders(frame, max_orders=settings.orders_max_batch_size))
+    if '"action"' in frame or '"idempotency_key"' in frame:
+        data = json.loads(frame)
+        if isinstance(data, dict) and "action" in data:
+            return (CancelRequest if data["action"] == "cancel" else SubscriptionRequest).model_validate(data)
+        if isinstance(data, dict) and "idempotency_key" in data:
+            return IdempotentOrder(str(data.pop("idempotency_key")), data)
+    if frame.lstrip().startswith("["):
+        # baskets are capped like those of POST /orders/batch
+        return decode_order_batch(frame, adapter=order_batch_adapter)
+    return [decode(order_input_adapter, frame)], {}
+
+
+async def placed_before(idempotency_key: tuple[str, str]) -> OrderOutput | None:
+    """The order placed with the key, None when there is none or its placement failed."""
+    if (outcome := idempotency_cache.get(idempotency_key)) is None:
+        return None
+    try:
+        return await asyncio.shield(outcome)
+    except Exception:
+        return None
+
+
+async def send_errors(websocket: WebSocket, errors: list[dict]) -> None:
+    await ws_manager.send(websocket, {"errors": errors})
+
+
+async def handle_subscription(websocket: WebSocket, request: SubscriptionRequest) -> None:
+    if request.action == SubscriptionAction.resync.value:
+        # subscribing again restarts the depth feed from a fresh book
+        connection = ws_manager.subscribe(websocket, market_data=request.market_data)
+    else:
+        update = ws_manager.subscribe if request.action == SubscriptionAction.subscribe.value else ws_manager.unsubscribe
+        connection = update(websocket,
+                            stocks=request.stocks,
+                            orders=request.orders,
+                            own_orders=request.own_orders,
+                            firehose=request.all,
+                            market_data=request.market_data)
+    await ws_manager.send(websocket, Subscriptions(all=connection.firehose,
+                                                   own_orders=connection.own_orders,
+                                                   stocks=sorted(connection.stocks),
+                                                   orders=sorted(connection.orders),
+                                                   market_data=sorted(connection.market_data)).model_dump())
+    if request.action != SubscriptionAction.unsubscribe.value:
+        for stocks in request.market_data:
+            market_data.send_book(connection, stocks, await matching_engine.depth(stocks))
+
+
+async def handle_cancel(websocket: WebSocket, request: CancelRequest, placed: set[str]) -> None:
+    candidates = [*request.orders, *placed] if request.own_orders else request.orders
+    selected = {order.id: order for order_id in candidates if (order := orders_db.get(order_id)) is not None}
+    for stocks in request.stocks:
+        selected.update((order.id, order) for order in orders_db.by_stocks(stocks))
+    if request.own_orders:
+        placed.clear()
+    cancelled = await cancel_orders([order for order in selected.values() if is_live(order)])
+    await orders_db.sync()
+    await ws_manager.send(websocket, CancelledOrders(cancelled=[order.id for order in cancelled]).model_dump())
+
+
 @router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, ack: bool = False):
     await ws_manager.connect(websocket)
+    # bounds lifecycles started by this socket, once exhausted we stop reading and let TCP push back
+    in_flight = asyncio.Semaphore(settings.ws_max_in_flight_orders)
+    # orders placed through this socket that may still be cancelled by a request for its own orders
+    placed: set[str] = set()
+
+    def finished(order_id: str) -> None:
+        placed.discard(order_id)
+        in_flight.release()
+
     try:
         while True:
             try:
-                data = await websocket.receive_json()
-                input_model = OrderInput(**data)
-                order_id = str(uuid.uuid4())
-                orders_db[order_id] = OrderOutput.construct(id=order_id,
-                                                            stocks=input_model.stocks,
-                                                            quantity=input_model.quantity)
-                for order_status in [OrderStatus.pending, OrderStatus.executed, OrderStatus.cancelled]:
-                    await random_delay()
-                    order = orders_db[order_id]
-                    order.status = order_status.value
-                    await ws_manager.broadcast(order.model_dump(exclude_none=True))
+                message = decode_frame(await receive_frame(websocket))
+                if isinstance(message, CancelRequest):
+                    await handle_cancel(websocket, message, placed)
+                    continue
+                if isinstance(message, SubscriptionRequest):
+                    await handle_subscription(websocket, message)
+                    continue
+                idempotency_key = None
+                if isinstance(message, IdempotentOrder):
+                    idempotency_key = ("order", message.key)
+                    if (original := await placed_before(idempotency_key)) is not None:
+                        await ws_manager.send(websocket, original.model_dump(exclude_none=True))
+                        continue
+                    message = [OrderInput.model_validate(message.order)], {}
+                input_models, errors = message
+                if errors:
+                    await send_errors(websocket, render_errors([error for item_errors in errors.values()
+                                                                for error in item_errors],
+                                                               status.WS_1003_UNSUPPORTED_DATA))
+                accepted = [order for order in place_orders(input_models) if order]
+                for order in accepted:
+                    ws_manager.track_order(websocket, order.id)
+                # matched orders settle right away, only simulated lifecycles hold on to in-flight slots
+                matched = [order for order in accepted if order.side is not None]
+                if matched:
+                    try:
+                        placed.update(order.id for order in await matching_engine.submit(matched) if is_live(order))
+                    except ConnectionError as e:
+                        # nothing of the message is placed, matching took its own orders back out
+                        for order in accepted:
+                            orders_db.remove(order.id)
+                            ws_manager.release_order(order.id)
+                        await send_errors(websocket, [{"code": status.WS_1011_INTERNAL_ERROR, "message": str(e)}])
+                        continue
+                if idempotency_key is not None and accepted:
+                    idempotency_cache.put(idempotency_key, accepted[0])
+                await orders_db.sync()
+                if ack and accepted:
+                    await ws_manager.send(websocket, OrderAck(ack=[order.id for order in accepted]).model_dump())
+                for order in accepted:
+                    if order.side is None:
+                        await in_flight.acquire()
+                        placed.add(order.id)
+                        lifecycle_scheduler.schedule(order.id, on_done=partial(finished, order.id))
 
             except ValidationError as e:
-                await websocket.send_json(RequestErrors(errors=[RequestError(code=status.WS_1003_UNSUPPORTED_DATA,
-                                                                             message=error.get("msg"),
-                                                                             input=error.get("input"),
-                                                                             localization=list(error.get("loc")),
-                                                                             type=error.get("type"))
-                                                                for error in e.errors()]).model_dump(exclude_none=True))
-            except JSONDecodeError as e:
-                await websocket.send_json(RequestErrors(errors=[Error(code=status.WS_1003_UNSUPPORTED_DATA,
-                                                                      message=str(e))]).model_dump())
+                await send_errors(websocket, render_errors(e.errors(include_url=False, include_context=False),
+                                                           status.WS_1003_UNSUPPORTED_DATA))
+            except (JSONDecodeError, FrameError) as e:
+                await send_errors(websocket, [{"code": status.WS_1003_UNSUPPORTED_DATA, "message": str(e)}])
 
     except (WebSocketDisconnect, ConnectionClosed):
         # handle disconnection gracefully
-        ws_manager.disconnect(websocket)
+        pass
     except Exception as e:
-        await websocket.send_json(RequestErrors(errors=[Error(code=status.WS_1006_ABNORMAL_CLOSURE,
-                                                              message=str(e))]).model_dump())
+        await websocket.send_json({"errors": [{"code": status.WS_1006_ABNORMAL_CLOSURE, "message": str(e)}]})
+    finally:
+        # the connection's writer and subscriptions must not outlive the socket, whatever ended it
+        ws_manager.disconnect(websocket)
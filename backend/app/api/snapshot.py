@@ -0,0 +1,133 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from dataclasses import dataclass, field
+from functools import partial
+from itertools import compress
+from math import isnan, nan
+from pathlib import Path
+
+from app.api.order_encoding import SIDE_NUMBERS, SIDES, STATUS_NUMBERS, STATUSES, pack_order_id, unpack_order_id
+from app.model.trading_platform_model import OrderOutput, OrderSide, OrderStatus
+
+MAGIC = b"TPSNAP03"
+# magic, number of orders, number of symbols, offset of the first column
+HEADER = struct.Struct("<8sQIQ")
+SYMBOL_LENGTH = struct.Struct("<H")
+ID_MASK = (1 << 64) - 1
+# every column but the ids, which are split into two 64-bit halves on disk
+COLUMNS = (("quantities", "d"), ("symbol_of", "I"), ("statuses", "B"), ("sides", "B"), ("prices", "d"), ("filled", "d"))
+
+
+@dataclass
+class OrderColumns:
+    """Orders laid out column-wise, row by row in placement order; a None id marks a removed order.
+
+    Orders that are not matched have side number 0, market orders have a NaN price.
+    """
+    ids: list[int | None] = field(default_factory=list)
+    quantities: array = field(default_factory=partial(array, "d"))
+    symbol_of: array = field(default_factory=partial(array, "I"))
+    statuses: array = field(default_factory=partial(array, "B"))
+    sides: array = field(default_factory=partial(array, "B"))
+    prices: array = field(default_factory=partial(array, "d"))
+    filled: array = field(default_factory=partial(array, "d"))
+    symbols: list[str] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def append(self, order_id: int, stocks: int, quantity: float, status_number: int,
+               side_number: int = 0, price: float = nan, filled: float = nan) -> None:
+        self.ids.append(order_id)
+        self.quantities.append(quantity)
+        self.symbol_of.append(stocks)
+        self.statuses.append(status_number)
+        self.sides.append(side_number)
+        self.prices.append(price)
+        self.filled.append(filled)
+
+    def append_order(self, order: OrderOutput, stocks: int) -> None:
+        side = OrderSide(order.side) if order.side is not None else None
+        self.append(pack_order_id(order.id), stocks, order.quantity, STATUS_NUMBERS[OrderStatus(order.status)],
+                    SIDE_NUMBERS[side], nan if order.price is None else order.price,
+                    nan if order.filled_quantity is None else order.filled_quantity)
+
+    def fields(self, row: int) -> dict:
+        """Field values of the order in `row`, ready to be validated into an `OrderOutput`."""
+        fields = {"id": unpack_order_id(self.ids[row]),
+                  "stocks": self.symbols[self.symbol_of[row]],
+                  "quantity": self.quantities[row],
+                  "status": STATUSES[self.statuses[row]]}
+        if side_number := self.sides[row]:
+            fields["side"] = SIDES[side_number]
+            fields["filled_quantity"] = self.filled[row]
+            if not isnan(price := self.prices[row]):
+                fields["price"] = price
+        return fields
+
+    def copy(self) -> "OrderColumns":
+        return OrderColumns(self.ids.copy(), *(getattr(self, name)[:] for name, _ in COLUMNS), self.symbols.copy())
+
+
+def write_snapshot(path: Path, columns: OrderColumns) -> None:
+    """Write the symbol table followed by one fixed-width column per field."""
+    live = [order_id is not None for order_id in columns.ids]
+    ids = list(compress(columns.ids, live))
+    data = [array("Q", [order_id >> 64 for order_id in ids]),
+            array("Q", [order_id & ID_MASK for order_id in ids]),
+            *(array(typecode, compress(getattr(columns, name), live)) for name, typecode in COLUMNS)]
+    symbol_table = bytearray()
+    for stocks in columns.symbols:
+        encoded = stocks.encode()
+        symbol_table += SYMBOL_LENGTH.pack(len(encoded)) + encoded
+    symbol_table += bytes(-(HEADER.size + len(symbol_table)) % 8)
+    with open(path, "wb") as snapshot:
+        snapshot.write(HEADER.pack(MAGIC, len(ids), len(columns.symbols), HEADER.size + len(symbol_table)))
+        snapshot.write(symbol_table)
+        for column in data:
+            if sys.byteorder == "big":
+                column.byteswap()
+            snapshot.write(column)
+        snapshot.flush()
+        os.fsync(snapshot.fileno())
+
+
+class OrderSnapshot:
+    """Read-only, memory-mapped view of a snapshot."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, symbol_count, self._offset = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"'{path}' is not an order snapshot")
+        self.symbols: list[str] = []
+        position = HEADER.size
+        for _ in range(symbol_count):
+            (length,) = SYMBOL_LENGTH.unpack_from(self._map, position)
+            position += SYMBOL_LENGTH.size
+            self.symbols.append(self._map[position:position + length].decode())
+            position += length
+
+    def __len__(self) -> int:
+        return self._count
+
+    def columns(self) -> OrderColumns:
+        position = self._offset
+        data = []
+        for typecode in ("Q", "Q", *(typecode for _, typecode in COLUMNS)):
+            column = array(typecode)
+            end = position + self._count * column.itemsize
+            column.frombytes(self._map[position:end])
+            if sys.byteorder == "big":
+                column.byteswap()
+            data.append(column)
+            position = end
+        high, low, *columns = data
+        return OrderColumns([(high_bits << 64) | low_bits for high_bits, low_bits in zip(high, low)],
+                            *columns,
+                            list(self.symbols))
@@ -1,25 +1,89 @@
+import uuid
 from asyncio import sleep
-from random import uniform
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
 
-from app.api.websocket_manager import WebSocketManager
+from pydantic import TypeAdapter, ValidationError
+
+from app.api.latency import LatencyModel, latency_model_from_spec
+from app.api.broker import Broker, broker_from_url
+from app.api.order_store import DurableOrderStore, InMemoryOrderStore, OrderStore, ReplicatedOrderStore
+from app.api.wal import WriteAheadLog
+from app.config import settings
 from app.model.trading_platform_model import OrderOutput, OrderStatus, OrderInput
 
-orders_db = {}
+
+broker: Broker | None = broker_from_url(settings.broker_url) if settings.broker_url else None
+
+
+def create_order_store() -> OrderStore:
+    if broker is not None:
+        if settings.wal_dir:
+            raise ValueError("WAL_DIR can not be combined with BROKER_URL, every worker would log the same orders")
+        return ReplicatedOrderStore(InMemoryOrderStore(), broker)
+    if not settings.wal_dir:
+        return InMemoryOrderStore()
+    return DurableOrderStore(InMemoryOrderStore(),
+                             WriteAheadLog(Path(settings.wal_dir),
+                                           commit_interval=settings.wal_commit_interval_ms / 1000,
+                                           commit_batch=settings.wal_commit_batch,
+                                           snapshot_records=settings.wal_snapshot_records))
+
+
+orders_db: OrderStore = create_order_store()
+
+order_inputs_adapter = TypeAdapter(list[OrderInput])
+
+latency_model: LatencyModel = latency_model_from_spec(settings.latency_model)
+
+
+def set_latency_model(model: LatencyModel) -> None:
+    global latency_model
+    latency_model = model
+
+
+def next_delay() -> float:
+    # by default a delay between 0.1 and 1 second
+    return latency_model.next_delay()
 
 
 async def random_delay():
-    # delay between 0.1 and 1 second
-    delay = uniform(0.1, 1)
-    await sleep(delay=delay)
-
-
-async def update_order_status(order_id: str, input_model: OrderInput, ws_manager: WebSocketManager):
-    order = orders_db.get(order_id)
-    for order_status in [OrderStatus.pending, OrderStatus.executed, OrderStatus.cancelled]:
-        await random_delay()
-        order.status = order_status.value
-        await ws_manager.broadcast(OrderOutput(id=order_id,
-                                               stocks=input_model.stocks,
-                                               quantity=input_model.quantity,
-                                               status=order_status)
-                                   .model_dump(exclude_none=True))
+    await sleep(delay=next_delay())
+
+
+def validate_order_batch(data: list[Any]) -> tuple[list[OrderInput | None], dict[int, list[dict]]]:
+    """Validate a basket of orders in one pass, returning inputs (None for rejected ones) and errors by index."""
+    try:
+        return order_inputs_adapter.validate_python(data), {}
+    except ValidationError as e:
+        errors = defaultdict(list)
+        for error in e.errors():
+            errors[error["loc"][0]].append(error)
+        return [None if index in errors else OrderInput.model_validate(item)
+                for index, item in enumerate(data)], errors
+
+
+def new_order(order_id: str, input_model: OrderInput) -> OrderOutput:
+    order_output = OrderOutput(id=order_id,
+                               stocks=input_model.stocks,
+                               quantity=input_model.quantity,
+                               status=OrderStatus.pending)
+    if input_model.side is not None:
+        order_output.side = input_model.side
+        order_output.price = input_model.price
+        order_output.filled_quantity = 0.0
+    return order_output
+
+
+def place_orders(input_models: list[OrderInput | None]) -> list[OrderOutput | None]:
+    order_ids = [str(uuid.uuid4()) for _ in input_models]
+    placed = []
+    for order_id, input_model in zip(order_ids, input_models):
+        if input_model is None:
+            placed.append(None)
+            continue
+        order_output = new_order(order_id, input_model)
+        orders_db.add(order_output)
+        placed.append(order_output)
+    return placed
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+import orjson
+
+from app.api.snapshot import OrderColumns, write_snapshot
+
+SEGMENT_PATTERN = re.compile(r"wal-(\d{8})\.log")
+SNAPSHOT_PATTERN = re.compile(r"snapshot-(\d{8})\.bin")
+
+logger = logging.getLogger(__name__)
+
+
+class LogFailedError(OSError):
+    """The log could not be written, nothing appended since is durable."""
+
+
+class WriteAheadLog:
+    """Append-only log of store mutations with group commit.
+
+    Records are buffered in memory and written plus fsynced by a background task every `commit_interval`
+    seconds or as soon as `commit_batch` records are waiting, so any number of concurrent writers share
+    one fsync. Once `snapshot_records` records were logged since the last snapshot, the state returned by
+    `snapshot_source` is copied, the log moves on to a new segment and the copy is written to a snapshot file
+    in a thread while commits carry on; the segments it covers are deleted once it is on disk. The same
+    happens on close so that a restart only has to map the snapshot instead of replaying the log.
+    Replaying a record twice must be harmless, a snapshot may already contain the records that follow it.
+    Once a write or fsync fails the log is failed for good, pending and later syncs raise LogFailedError
+    and what made it to disk is recovered on the next start.
+    """
+
+    def __init__(self,
+                 directory: Path,
+                 commit_interval: float = 0.005,
+                 commit_batch: int = 1000,
+                 snapshot_records: int = 100_000,
+                 snapshot_source: Callable[[], OrderColumns] | None = None):
+        self.directory = directory
+        self.commit_interval = commit_interval
+        self.commit_batch = commit_batch
+        self.snapshot_records = snapshot_records
+        self.snapshot_source = snapshot_source
+        self._buffer: list[bytes] = []
+        # resolved once the records currently buffered, respectively being written, are durable
+        self._commit: asyncio.Future | None = None
+        self._in_flight: asyncio.Future | None = None
+        self._flush_now = asyncio.Event()
+        self._flusher: asyncio.Task | None = None
+        self._closing = False
+        self._segment = 0
+        self._file: int | None = None
+        self._records_since_snapshot = 0
+        self._snapshotting: asyncio.Task | None = None
+        self._failure: Exception | None = None
+
+    def recover(self) -> tuple[Path | None, Iterator[dict]]:
+        """Return the latest snapshot, if any, and the records logged after it, oldest first."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        snapshots = self._numbered(SNAPSHOT_PATTERN)
+        first_segment, snapshot = snapshots[-1] if snapshots else (0, None)
+        segments = [segment for number, segment in self._numbered(SEGMENT_PATTERN) if number >= first_segment]
+        self._segment = max([first_segment, *(number + 1 for number, _ in self._numbered(SEGMENT_PATTERN))])
+        return snapshot, self._replay(segments)
+
+    async def open(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._file = self._open_segment(self._segment)
+        self._closing = False
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            # the flusher writes what is still buffered and stops, only then its file may be closed by a snapshot
+            self._closing = True
+            self._flush_now.set()
+            await self._flusher
+            self._flusher = None
+            if self._snapshotting is not None:
+                await self._snapshotting
+            if self.snapshot_source is not None and self._records_since_snapshot and self._failure is None:
+                self._start_snapshot()
+                await self._snapshotting
+        if self._file is not None:
+            os.close(self._file)
+            self._file = None
+
+    def append(self, record: dict[str, Any]) -> None:
+        if self._failure is not None:
+            # could never be written, sync tells the caller
+            return
+        self._buffer.append(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE))
+        if len(self._buffer) >= self.commit_batch:
+            self._flush_now.set()
+
+    async def sync(self) -> None:
+        """Wait until every record appended so far is on disk."""
+        if self._failure is not None:
+            raise LogFailedError(f"Writing the log failed: {self._failure}") from self._failure
+        if self._flusher is None:
+            return
+        if self._buffer:
+            if self._commit is None:
+                self._commit = asyncio.get_running_loop().create_future()
+            await asyncio.shield(self._commit)
+        elif self._in_flight is not None:
+            await asyncio.shield(self._in_flight)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.commit_interval)
+            except TimeoutError:
+                pass
+            if not self._closing:
+                self._flush_now.clear()
+            if not self._buffer:
+                if self._closing:
+                    return
+                continue
+            records, self._buffer = self._buffer, []
+            commit = self._commit or asyncio.get_running_loop().create_future()
+            self._commit, self._in_flight = None, commit
+            try:
+                await asyncio.to_thread(self._write, self._file, b"".join(records))
+            except Exception as e:
+                self._fail(e, commit)
+                return
+            finally:
+                self._in_flight = None
+            commit.set_result(None)
+            self._records_since_snapshot += len(records)
+            if (self.snapshot_source is not None and self._records_since_snapshot >= self.snapshot_records
+                    and (self._snapshotting is None or self._snapshotting.done())):
+                self._start_snapshot()
+
+    def _fail(self, error: Exception, commit: asyncio.Future) -> None:
+        logger.error("Write-ahead log failed, syncs raise until restart: %s", error)
+        self._failure = error
+        self._buffer = []
+        for waiting in (commit, self._commit):
+            if waiting is not None and not waiting.done():
+                waiting.set_exception(LogFailedError(f"Writing the log failed: {error}"))
+                # waiting syncs see the error, nobody else has to
+                waiting.exception()
+        self._commit = None
+
+    def _start_snapshot(self) -> None:
+        # the columns are copied and the segment rotated on the event loop in between two writes,
+        # so the snapshot is consistent with everything logged to the segments it replaces
+        columns = self.snapshot_source()
+        previous_file = self._file
+        self._segment += 1
+        self._file = self._open_segment(self._segment)
+        self._records_since_snapshot = 0
+        self._snapshotting = asyncio.create_task(self._snapshot(columns, self._segment, previous_file))
+
+    async def _snapshot(self, columns: OrderColumns, segment: int, previous_file: int) -> None:
+        try:
+            await asyncio.to_thread(self._write_snapshot, columns, segment, previous_file)
+        except Exception:
+            # the segments it would have replaced are kept, the next snapshot covers them
+            logger.exception("Writing snapshot %d failed", segment)
+
+    def _write_snapshot(self, columns: OrderColumns, segment: int, previous_file: int) -> None:
+        os.close(previous_file)
+        path = self.directory / f"snapshot-{segment:08d}.bin"
+        temporary = path.with_suffix(".tmp")
+        write_snapshot(temporary, columns)
+        os.replace(temporary, path)
+        self._fsync_directory()
+        for number, old in self._numbered(SEGMENT_PATTERN) + self._numbered(SNAPSHOT_PATTERN):
+            if number < segment:
+                old.unlink(missing_ok=True)
+
+    def _open_segment(self, number: int) -> int:
+        return os.open(self.directory / f"wal-{number:08d}.log", os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    @staticmethod
+    def _write(file: int, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(file, view):]
+        os.fsync(file)
+
+    def _fsync_directory(self) -> None:
+        directory = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    def _numbered(self, pattern: re.Pattern) -> list[tuple[int, Path]]:
+        return sorted((int(match.group(1)), path) for path in self.directory.iterdir()
+                      if (match := pattern.fullmatch(path.name)))
+
+    def _replay(self, segments: list[Path]) -> Iterator[dict]:
+        for segment in segments:
+            with open(segment, "rb") as file:
+                for line in file:
+                    if not line.endswith(b"\n"):
+                        # torn write of the last record before a crash
+                        break
+                    self._records_since_snapshot += 1
+                    yield orjson.loads(line)
@@ -1,20 +1,357 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict, deque
+from enum import Enum
+from typing import Any, Callable, Hashable, NamedTuple, Protocol
+
+import orjson
 from fastapi.websockets import WebSocket
+from starlette import status
+
+from app.api.broker import WORKER_ID, Broker
+from app.api.metrics import broadcast_fanout_latency, broadcast_messages, registry
+from app.api.wire_protocol import WireProtocol, encode_order_output, negotiate
+from app.config import settings
+from app.model.trading_platform_model import OrderOutput
+
+logger = logging.getLogger(__name__)
+
+
+def encode_message(message: Any) -> str:
+    # encoded once per event, every subscriber gets the very same text frame
+    return orjson.dumps(message).decode()
+
+
+class BroadcastMessage(NamedTuple):
+    # JSON text of the event, an order update whenever `order_id` is given
+    payload: str
+    order_id: str | None = None
+    stocks: str | None = None
+    # the updated order itself, binary frames are packed from it; not sent through the broker
+    order: OrderOutput | None = None
+
+
+def order_update(order: OrderOutput) -> BroadcastMessage:
+    return BroadcastMessage(encode_message(order.model_dump(exclude_none=True)), order.id, order.stocks, order)
+
+
+class MergeableMessage(Protocol):
+    """Message encoded only once it is written, later messages for its key are merged into it while it waits."""
+
+    def encode(self) -> str:
+        ...
+
+    def merged(self, later: "MergeableMessage") -> "MergeableMessage":
+        ...
+
+
+class SlowConsumerPolicy(str, Enum):
+    drop_oldest = "drop_oldest"
+    coalesce = "coalesce"
+    disconnect = "disconnect"
+
+
+class ClientConnection:
+    """Outbound side of a single websocket: a bounded queue drained by its own writer task."""
+
+    def __init__(self,
+                 websocket: WebSocket,
+                 max_queue_size: int,
+                 policy: SlowConsumerPolicy,
+                 protocol: WireProtocol = WireProtocol.json):
+        self.websocket = websocket
+        self.protocol = protocol
+        self.max_queue_size = max_queue_size
+        self.policy = policy
+        # queue holds message keys, the latest message for each key lives in `messages`
+        self.queue: deque[Hashable] = deque()
+        self.messages: dict[Hashable, str | bytes | MergeableMessage] = {}
+        self.dropped = 0
+        self.closed = False
+        # new clients get the whole feed until they subscribe to something specific
+        self.firehose = True
+        self.implicit_firehose = True
+        self.own_orders = False
+        self.stocks: set[str] = set()
+        # market data symbol -> sequence number of the latest depth update queued, None until the book was sent
+        self.market_data: dict[str, int | None] = {}
+        self.orders: set[str] = set()
+        self._ready = asyncio.Event()
+        self._writer: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def enqueue(self, message: str | bytes | MergeableMessage, key: Hashable | None = None) -> bool:
+        """Queue a message without awaiting the socket, returns False when the client must be dropped."""
+        if self.closed:
+            return False
+        if key is None:
+            key = object()
+        if key in self.messages:
+            # the previous update for this key has not been sent yet
+            if self.policy is SlowConsumerPolicy.coalesce:
+                self.messages[key] = message
+                return True
+            key = object()
+        if len(self.queue) >= self.max_queue_size:
+            if self.policy is SlowConsumerPolicy.disconnect:
+                return False
+            self.messages.pop(self.queue.popleft(), None)
+            self.dropped += 1
+        self.queue.append(key)
+        self.messages[key] = message
+        self._ready.set()
+        return True
+
+    def enqueue_mergeable(self, message: MergeableMessage, key: Hashable) -> bool:
+        """Queue a message, or fold it into the one for the same key the client has not been sent yet."""
+        if (queued := self.messages.get(key)) is not None and not isinstance(queued, (str, bytes)):
+            self.messages[key] = queued.merged(message)
+            return True
+        return self.enqueue(message, key)
+
+    async def _write_loop(self) -> None:
+        try:
+            while True:
+                await self._ready.wait()
+                while self.queue:
+                    message = self.messages.pop(self.queue.popleft())
+                    if isinstance(message, bytes):
+                        await self.websocket.send_bytes(message)
+                    else:
+                        await self.websocket.send_text(message if isinstance(message, str) else message.encode())
+                self._ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # peer went away mid-send, the receive loop will notice and disconnect
+            self.closed = True
+
+    async def close(self, code: int = status.WS_1000_NORMAL_CLOSURE) -> None:
+        self.stop()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    def stop(self) -> None:
+        self.closed = True
+        self.queue.clear()
+        self.messages.clear()
+        if self._writer and not self._writer.done():
+            self._writer.cancel()
 
 
 class WebSocketManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
+    BROADCAST_CHANNEL = "broadcasts"
+
+    def __init__(self, max_queue_size: int = settings.ws_send_queue_size,
+                 policy: SlowConsumerPolicy = SlowConsumerPolicy(settings.ws_slow_consumer_policy)):
+        self.max_queue_size = max_queue_size
+        self.policy = policy
+        self.active_connections: dict[WebSocket, ClientConnection] = {}
+        # subscription index, broadcasts only visit the connections interested in a message
+        self._firehose: dict[ClientConnection, None] = {}
+        self._by_stocks: dict[str, dict[ClientConnection, None]] = defaultdict(dict)
+        self._by_order: dict[str, dict[ClientConnection, None]] = defaultdict(dict)
+        self._by_market_data: dict[str, dict[ClientConnection, None]] = defaultdict(dict)
+        self._closing: set[asyncio.Task] = set()
+        self._broker: Broker | None = None
+        self._listeners: list[Callable[[list[BroadcastMessage]], None]] = []
 
-    async def connect(self, websocket: WebSocket) -> None:
-        await websocket.accept()
-        self.active_connections.append(websocket)
+    async def attach_broker(self, broker: Broker) -> None:
+        """Share broadcasts with the other workers, each one delivers them to its own clients."""
+        self._broker = broker
+        await broker.subscribe(self.BROADCAST_CHANNEL, self._receive)
+
+    def add_listener(self, listener: Callable[[list[BroadcastMessage]], None]) -> None:
+        """Have `listener` called with every batch of messages delivered to this worker's clients."""
+        self._listeners.append(listener)
+
+    async def connect(self, websocket: WebSocket) -> ClientConnection:
+        protocol = negotiate(websocket.scope.get("subprotocols", []))
+        await websocket.accept(subprotocol=protocol and protocol.value)
+        connection = ClientConnection(websocket, self.max_queue_size, self.policy, protocol or WireProtocol.json)
+        connection.start()
+        self.active_connections[websocket] = connection
+        self._firehose[connection] = None
+        return connection
 
     def disconnect(self, websocket: WebSocket) -> None:
-        self.active_connections.remove(websocket)
+        if connection := self.active_connections.pop(websocket, None):
+            self._unindex(connection)
+            connection.stop()
+
+    def subscribe(self,
+                  websocket: WebSocket,
+                  stocks: list[str] = (),
+                  orders: list[str] = (),
+                  own_orders: bool = False,
+                  firehose: bool = False,
+                  market_data: list[str] = ()) -> ClientConnection:
+        connection = self.active_connections[websocket]
+        if firehose:
+            connection.implicit_firehose = False
+            self._set_firehose(connection, True)
+        elif connection.implicit_firehose and (stocks or orders or own_orders or market_data):
+            connection.implicit_firehose = False
+            self._set_firehose(connection, False)
+        connection.own_orders = connection.own_orders or own_orders
+        for symbol in stocks:
+            connection.stocks.add(symbol)
+            self._by_stocks[symbol][connection] = None
+        for order_id in orders:
+            connection.orders.add(order_id)
+            self._by_order[order_id][connection] = None
+        for symbol in market_data:
+            # depth updates wait for the book to be sent first
+            connection.market_data[symbol] = None
+            self._by_market_data[symbol][connection] = None
+        return connection
+
+    def unsubscribe(self,
+                    websocket: WebSocket,
+                    stocks: list[str] = (),
+                    orders: list[str] = (),
+                    own_orders: bool = False,
+                    firehose: bool = False,
+                    market_data: list[str] = ()) -> ClientConnection:
+        connection = self.active_connections[websocket]
+        if firehose:
+            connection.implicit_firehose = False
+            self._set_firehose(connection, False)
+        if own_orders:
+            connection.own_orders = False
+        for symbol in stocks:
+            connection.stocks.discard(symbol)
+            self._discard(self._by_stocks, symbol, connection)
+        for order_id in orders:
+            connection.orders.discard(order_id)
+            self._discard(self._by_order, order_id, connection)
+        for symbol in market_data:
+            connection.market_data.pop(symbol, None)
+            self._discard(self._by_market_data, symbol, connection)
+        return connection
+
+    def track_order(self, websocket: WebSocket, order_id: str) -> None:
+        """Route updates of an order placed through `websocket` to it when it asked for its own orders."""
+        connection = self.active_connections.get(websocket)
+        if connection is not None and connection.own_orders:
+            connection.orders.add(order_id)
+            self._by_order[order_id][connection] = None
+
+    def release_order(self, order_id: str) -> None:
+        """Forget per-order subscriptions once the order reached its final status."""
+        for connection in self._by_order.pop(order_id, ()):
+            connection.orders.discard(order_id)
+
+    def market_data_subscribers(self, stocks: str) -> dict[ClientConnection, None]:
+        return self._by_market_data.get(stocks, {})
+
+    async def send(self, websocket: WebSocket, message: dict | str) -> None:
+        if connection := self.active_connections.get(websocket):
+            connection.enqueue(message if isinstance(message, str) else encode_message(message))
+
+    async def broadcast(self, message: dict | str, key: Hashable | None = None, stocks: str | None = None) -> None:
+        if isinstance(message, dict):
+            key = key or message.get("id")
+            stocks = stocks or message.get("stocks")
+            message = encode_message(message)
+        await self.broadcast_many([BroadcastMessage(message, key, stocks)])
+
+    async def broadcast_many(self, messages: list[BroadcastMessage]) -> None:
+        if self._broker is not None:
+            self._broker.publish(self.BROADCAST_CHANNEL,
+                                 orjson.dumps([WORKER_ID, [message[:3] for message in messages]]))
+        self._deliver(messages)
+
+    def _receive(self, data: bytes) -> None:
+        origin, messages = orjson.loads(data)
+        if origin != WORKER_ID:
+            self._deliver([BroadcastMessage(*message) for message in messages])
+
+    def _deliver(self, messages: list[BroadcastMessage]) -> None:
+        start = time.perf_counter()
+        recipients: dict[ClientConnection, list[BroadcastMessage]] = defaultdict(list)
+        for message in messages:
+            for connection in self._subscribers(message):
+                recipients[connection].append(message)
+        # order updates are encoded for binary clients once, and only when one of them gets the update
+        binary: dict[str, bytes] = {}
+        for connection, connection_messages in recipients.items():
+            try:
+                for message in connection_messages:
+                    payload = message.payload
+                    if connection.protocol is WireProtocol.binary and message.order_id is not None:
+                        if (payload := binary.get(message.payload)) is None:
+                            payload = binary[message.payload] = self._encode_binary(message)
+                    if not connection.enqueue(payload, message.order_id):
+                        self.drop(connection)
+                        break
+            except Exception:
+                # a message that can not be delivered only costs the connection it was meant for
+                logger.exception("Delivering a broadcast failed, dropping the connection")
+                self.drop(connection)
+        for listener in self._listeners:
+            listener(messages)
+        broadcast_messages.inc(amount=len(messages))
+        broadcast_fanout_latency.observe(time.perf_counter() - start)
+
+    @staticmethod
+    def _encode_binary(message: BroadcastMessage) -> bytes:
+        # updates from other workers arrive as their JSON text only
+        order = message.order or OrderOutput.model_validate_json(message.payload)
+        return encode_order_output(order)
+
+    def _subscribers(self, message: BroadcastMessage) -> dict[ClientConnection, None]:
+        subscribers = self._firehose
+        for index, key in ((self._by_stocks, message.stocks), (self._by_order, message.order_id)):
+            if key is not None and (interested := index.get(key)):
+                subscribers = {**subscribers, **interested}
+        return subscribers
+
+    def _set_firehose(self, connection: ClientConnection, enabled: bool) -> None:
+        connection.firehose = enabled
+        if enabled:
+            self._firehose[connection] = None
+        else:
+            self._firehose.pop(connection, None)
+
+    def _unindex(self, connection: ClientConnection) -> None:
+        self._firehose.pop(connection, None)
+        for symbol in connection.stocks:
+            self._discard(self._by_stocks, symbol, connection)
+        for order_id in connection.orders:
+            self._discard(self._by_order, order_id, connection)
+        for symbol in connection.market_data:
+            self._discard(self._by_market_data, symbol, connection)
+
+    @staticmethod
+    def _discard(index: dict, key: str, connection: ClientConnection) -> None:
+        if (connections := index.get(key)) is not None:
+            connections.pop(connection, None)
+            if not connections:
+                del index[key]
+
+    def drop(self, connection: ClientConnection) -> None:
+        """Disconnect a client that can not keep up."""
+        self.active_connections.pop(connection.websocket, None)
+        self._unindex(connection)
+        task = asyncio.create_task(connection.close(code=status.WS_1008_POLICY_VIOLATION))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
 
-    async def broadcast(self, message: dict) -> None:
-        for connection in self.active_connections:
-            await connection.send_json(message)
 
+ws_manager = WebSocketManager()
 
-ws_manager = WebSocketManager()
\ No newline at end of file
+registry.gauge("websocket_active_connections", "Connected WebSocket clients",
+               lambda: len(ws_manager.active_connections))
+registry.gauge("websocket_send_queue_depth", "Messages waiting in WebSocket send queues across all clients",
+               lambda: sum(len(connection.queue) for connection in ws_manager.active_connections.values()))
+registry.gauge("websocket_send_queue_max_depth", "Deepest WebSocket send queue",
+               lambda: max((len(connection.queue) for connection in ws_manager.active_connections.values()),
+                           default=0))
+registry.gauge("websocket_dropped_messages", "Messages dropped for slow WebSocket consumers still connected",
+               lambda: sum(connection.dropped for connection in ws_manager.active_connections.values()))
@@ -0,0 +1,78 @@
+import struct
+from enum import Enum
+from math import isfinite, isnan, nan
+from typing import Any
+
+from app.api.order_encoding import SIDE_NUMBERS, SIDES, STATUS_NUMBERS, pack_order_id
+from app.model.trading_platform_model import OrderOutput, OrderSide, OrderStatus
+
+# side number, quantity, limit price or NaN and symbol length, followed by the symbol in UTF-8
+ORDER_INPUT = struct.Struct("<BddH")
+# order id, status number, side number, quantity, limit price or NaN, filled quantity or NaN and symbol length,
+# followed by the symbol in UTF-8
+ORDER_OUTPUT = struct.Struct("<16sBBdddH")
+
+
+class WireProtocol(str, Enum):
+    """WebSocket subprotocols a client can ask for, JSON text frames unless it does."""
+    json = "trading.json"
+    binary = "trading.binary.v1"
+
+
+class FrameError(ValueError):
+    """A binary frame that does not follow the layout of its messages."""
+
+
+def negotiate(offered: list[str]) -> WireProtocol | None:
+    """The first subprotocol offered by the client that is spoken here, None when there is none."""
+    for name in offered:
+        try:
+            return WireProtocol(name)
+        except ValueError:
+            continue
+    return None
+
+
+def decode_orders(frame: bytes, max_orders: int | None = None) -> list[dict[str, Any]]:
+    """Order inputs packed back to back in a binary frame, as the dicts their JSON would parse into.
+
+    Values are checked by validation like JSON input is, only a frame that can not be split into
+    orders, holds more than `max_orders` or numbers that are not finite raises FrameError.
+    """
+    orders = []
+    offset = 0
+    try:
+        while offset < len(frame):
+            if max_orders is not None and len(orders) == max_orders:
+                raise FrameError(f"Frame holds more than {max_orders} orders")
+            side, quantity, price, length = ORDER_INPUT.unpack_from(frame, offset)
+            # NaN is how a missing price is packed, every other number must be finite
+            if not isfinite(quantity) or not (isfinite(price) or isnan(price)):
+                raise FrameError(f"Order at byte {offset} holds a number that is not finite")
+            offset += ORDER_INPUT.size
+            if offset + length > len(frame):
+                raise FrameError(f"Symbol of {length} bytes at byte {offset} runs past the end of the frame")
+            order = {"stocks": frame[offset:offset + length].decode(), "quantity": quantity}
+            offset += length
+            if side:
+                order["side"] = SIDES[side].value
+            if not isnan(price):
+                order["price"] = price
+            orders.append(order)
+    except (struct.error, UnicodeDecodeError, IndexError) as e:
+        raise FrameError(f"Malformed order at byte {offset}: {e}") from e
+    if not orders:
+        raise FrameError("Frame holds no orders")
+    return orders
+
+
+def encode_order_output(order: OrderOutput) -> bytes:
+    """Binary frame of an order update."""
+    symbol = order.stocks.encode()
+    return ORDER_OUTPUT.pack(pack_order_id(order.id).to_bytes(16),
+                             STATUS_NUMBERS[OrderStatus(order.status)],
+                             SIDE_NUMBERS[order.side and OrderSide(order.side)],
+                             order.quantity,
+                             nan if order.price is None else order.price,
+                             nan if order.filled_quantity is None else order.filled_quantity,
+                             len(symbol)) + symbol
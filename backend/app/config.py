@@ -0,0 +1,56 @@
+import os
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Settings:
+    ws_send_queue_size: int
+    ws_slow_consumer_policy: str
+    ws_max_in_flight_orders: int
+    orders_page_size: int
+    orders_max_page_size: int
+    orders_max_batch_size: int
+    orders_max_wait_seconds: float
+    idempotency_cache_size: int
+    idempotency_ttl_seconds: float
+    sse_history_size: int
+    sse_keepalive_seconds: float
+    latency_model: str
+    wal_dir: str
+    wal_commit_interval_ms: float
+    wal_commit_batch: int
+    wal_snapshot_records: int
+    broker_url: str
+    host: str
+    port: int
+    workers: int
+    matching_shards: int
+    matching_shard_dir: str
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(ws_send_queue_size=int(os.getenv("WS_SEND_QUEUE_SIZE", "1024")),
+                   ws_slow_consumer_policy=os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_oldest"),
+                   ws_max_in_flight_orders=int(os.getenv("WS_MAX_IN_FLIGHT_ORDERS", "100")),
+                   orders_page_size=int(os.getenv("ORDERS_PAGE_SIZE", "100")),
+                   orders_max_page_size=int(os.getenv("ORDERS_MAX_PAGE_SIZE", "1000")),
+                   orders_max_batch_size=int(os.getenv("ORDERS_MAX_BATCH_SIZE", "1000")),
+                   orders_max_wait_seconds=float(os.getenv("ORDERS_MAX_WAIT_SECONDS", "60")),
+                   idempotency_cache_size=int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "100000")),
+                   idempotency_ttl_seconds=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600")),
+                   sse_history_size=int(os.getenv("SSE_HISTORY_SIZE", "10000")),
+                   sse_keepalive_seconds=float(os.getenv("SSE_KEEPALIVE_SECONDS", "15")),
+                   latency_model=os.getenv("LATENCY_MODEL", "uniform:0.1:1"),
+                   wal_dir=os.getenv("WAL_DIR", ""),
+                   wal_commit_interval_ms=float(os.getenv("WAL_COMMIT_INTERVAL_MS", "5")),
+                   wal_commit_batch=int(os.getenv("WAL_COMMIT_BATCH", "1000")),
+                   wal_snapshot_records=int(os.getenv("WAL_SNAPSHOT_RECORDS", "100000")),
+                   broker_url=os.getenv("BROKER_URL", ""),
+                   host=os.getenv("HOST", "127.0.0.1"),
+                   port=int(os.getenv("PORT", "8000")),
+                   workers=int(os.getenv("WORKERS", "1")),
+                   matching_shards=int(os.getenv("MATCHING_SHARDS", "0")),
+                   matching_shard_dir=os.getenv("MATCHING_SHARD_DIR", ""))
+
+
+settings = Settings.from_env()
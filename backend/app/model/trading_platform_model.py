@@ -5,9 +5,9 @@
 from __future__ import annotations
 
 from enum import Enum
-from typing import Any
+from typing import Any, Literal
 
-from pydantic import BaseModel, Field, ConfigDict, confloat
+from pydantic import BaseModel, Field, ConfigDict, confloat, model_validator
 
 
 class OrderBaseModel(BaseModel):
@@ -16,13 +16,30 @@ class OrderBaseModel(BaseModel):
     )
 
 
+class OrderSide(Enum):
+    buy = 'buy'
+    sell = 'sell'
+
+
 class OrderInput(OrderBaseModel):
     stocks: str = Field(
         ..., description="Currency pair symbol (e.g. 'EURUSD'), or any other stuff"
     )
-    quantity: confloat(gt=0.0) = Field(
+    quantity: confloat(gt=0.0, allow_inf_nan=False) = Field(
         ..., description='Quantity of the currency pair to be traded'
     )
+    side: OrderSide | None = Field(
+        None, description='Matched against the order book when given, otherwise the order runs the simulated lifecycle'
+    )
+    price: confloat(gt=0.0, allow_inf_nan=False) | None = Field(
+        None, description='Limit price, an order with a side but no price is a market order'
+    )
+
+    @model_validator(mode='after')
+    def price_needs_side(self) -> OrderInput:
+        if self.price is not None and self.side is None:
+            raise ValueError('A limit price requires a side')
+        return self
 
 
 class OrderStatus(Enum):
@@ -36,6 +53,18 @@ class OrderOutput(OrderBaseModel):
     stocks: str = Field(..., description="Currency pair symbol (e.g. 'EURUSD')")
     quantity: float = Field(..., description='Quantity of the currency pair to be traded')
     status: OrderStatus = Field(..., description='Status of the order')
+    side: OrderSide | None = Field(None, description='Side of a matched order')
+    price: float | None = Field(None, description='Limit price of a matched order')
+    filled_quantity: float | None = Field(None, description='Quantity of a matched order filled so far')
+
+
+class Fill(OrderBaseModel):
+    type: Literal['fill'] = Field('fill', description='Tells fills apart from order updates')
+    stocks: str = Field(..., description='Currency pair symbol')
+    price: float = Field(..., description='Price of the resting order that was hit')
+    quantity: float = Field(..., description='Quantity traded')
+    buy_order: str = Field(..., description='Id of the buy order')
+    sell_order: str = Field(..., description='Id of the sell order')
 
 
 class Error(OrderBaseModel):
@@ -51,3 +80,64 @@ class RequestError(Error):
 
 class RequestErrors(BaseModel):
     errors: list[RequestError | Error] = Field(default_factory=list, description='List of request errors')
+
+
+class OrderResult(OrderBaseModel):
+    order: OrderOutput | None = Field(None, description='Placed order')
+    errors: list[RequestError] | None = Field(None, description='Reasons the order was rejected')
+
+
+class OrderAck(OrderBaseModel):
+    ack: list[str] = Field(..., description='Ids assigned to the accepted orders, in submission order')
+
+
+class CancelRequest(OrderBaseModel):
+    action: Literal['cancel'] = Field(..., description='Cancels the selected orders that have not finished yet')
+    own_orders: bool = Field(False, description='Orders placed through this connection')
+    stocks: list[str] = Field(default_factory=list, description='Currency pair symbols whose orders are cancelled')
+    orders: list[str] = Field(default_factory=list, description='Order ids to cancel')
+
+
+class CancelledOrders(OrderBaseModel):
+    cancelled: list[str] = Field(..., description='Ids of the orders that were cancelled')
+
+
+class SubscriptionAction(Enum):
+    subscribe = 'subscribe'
+    unsubscribe = 'unsubscribe'
+    resync = 'resync'
+
+
+class SubscriptionRequest(OrderBaseModel):
+    action: SubscriptionAction = Field(..., description='Whether topics are added or removed')
+    all: bool = Field(False, description='Every order update')
+    own_orders: bool = Field(False, description='Updates of orders placed through this connection')
+    stocks: list[str] = Field(default_factory=list, description='Currency pair symbols to follow')
+    orders: list[str] = Field(default_factory=list, description='Order ids to follow')
+    market_data: list[str] = Field(default_factory=list, description='Currency pair symbols to follow the depth of')
+
+
+class Subscriptions(OrderBaseModel):
+    all: bool = Field(..., description='Every order update is delivered')
+    own_orders: bool = Field(..., description='Updates of orders placed through this connection are delivered')
+    stocks: list[str] = Field(default_factory=list, description='Followed currency pair symbols')
+    orders: list[str] = Field(default_factory=list, description='Followed order ids')
+    market_data: list[str] = Field(default_factory=list, description='Currency pair symbols whose depth is followed')
+
+
+class MarketDataBook(OrderBaseModel):
+    type: Literal['book'] = Field('book', description='Tells book snapshots apart from other messages')
+    stocks: str = Field(..., description='Currency pair symbol')
+    sequence: int = Field(..., description='Sequence number of the latest depth update included')
+    bids: list[list[float]] = Field(..., description='Price and size of every bid level, best first')
+    asks: list[list[float]] = Field(..., description='Price and size of every ask level, best first')
+
+
+class MarketDataDepth(OrderBaseModel):
+    type: Literal['depth'] = Field('depth', description='Tells depth updates apart from other messages')
+    stocks: str = Field(..., description='Currency pair symbol')
+    previous_sequence: int = Field(..., description='Sequence number the update applies on top of')
+    sequence: int = Field(..., description='Sequence number of the update')
+    changes: list[tuple[OrderSide, float, float, float]] = Field(
+        ..., description='Side, price, size delta and size afterwards of every changed level'
+    )
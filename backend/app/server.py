@@ -1,36 +1,101 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
+
+import orjson
 import uvicorn
-from fastapi import FastAPI, Request, status
-from fastapi.encoders import jsonable_encoder
+from fastapi import FastAPI, Request, Response, status
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
 
+from app.api.broker import LocalBroker
+from app.api.broker_hub import run as run_hub
+from app.api.decoding import render_errors
+from app.api.lifecycle import lifecycle_scheduler
+from app.api.market_data import market_data
+from app.api.matching import matching_engine
+from app.api.matching_shard import start_shards
+from app.api.metrics import MetricsMiddleware
+from app.api.routes.metrics import router as metrics_router
 from app.api.routes.orders import router as orders_router
 from app.api.routes.websockets import router as websocket_router
-from app.model.trading_platform_model import RequestError
+from app.api.utils import broker, orders_db
+from app.api.websocket_manager import ws_manager
+from app.config import settings
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    if matching_engine.shards is None and broker is not None and not isinstance(broker, LocalBroker):
+        raise ValueError("BROKER_URL needs MATCHING_SHARDS, every worker would match against books of its own")
+    if broker is not None:
+        await broker.connect()
+        await ws_manager.attach_broker(broker)
+        if matching_engine.shards is not None:
+            # books are shared through the shards, so their depth can be too
+            await market_data.attach_broker(broker)
+    await orders_db.open()
+    await matching_engine.open()
+    if broker is None:
+        # with a broker the orders synced from other workers keep running their lifecycles there
+        lifecycle_scheduler.resume()
+        await matching_engine.restore()
+    yield
+    await lifecycle_scheduler.stop()
+    await matching_engine.close()
+    await orders_db.close()
+    if broker is not None:
+        await broker.close()
+
 
 app = FastAPI(title="Forex Trading Platform API",
               version="1.0.0",
               description="A RESTful API to simulate a Forex trading platform "
-                          "with WebSocket support for real-time order updates.")
+                          "with WebSocket support for real-time order updates.",
+              lifespan=lifespan)
 
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
-    errors = [RequestError(message=error.get("msg"),
-                           input=error.get("input"),
-                           localization=error.get("loc"),
-                           type=error.get("type")).model_dump(exclude_none=True, exclude_defaults=True,
-                                                              exclude_unset=True) for error in exc.errors()]
-
-    return JSONResponse(
+    # inputs of anything but JSON bodies, e.g. raw bytes, are rendered as text
+    return Response(
         status_code=status.HTTP_400_BAD_REQUEST,
-        content=jsonable_encoder({"errors": errors})
+        content=orjson.dumps({"errors": render_errors(exc.errors())}, default=str),
+        media_type="application/json"
     )
 
 
 app.include_router(orders_router, prefix="/orders")
 app.include_router(websocket_router)
+app.include_router(metrics_router)
+app.add_middleware(MetricsMiddleware)
 
 
 if __name__ == '__main__':
-    uvicorn.run("backend.app.server:app", reload=False)
+    hub = None
+    shards = []
+    if settings.workers > 1 and not settings.broker_url:
+        # workers inherit the environment, point them at a hub of our own
+        socket_directory = tempfile.mkdtemp()
+        socket_path = os.path.join(socket_directory, "broker.sock")
+        hub = multiprocessing.Process(target=run_hub, args=(socket_path,), daemon=True)
+        hub.start()
+        os.environ["BROKER_URL"] = f"unix://{socket_path}"
+    if settings.workers > 1 and not settings.matching_shard_dir:
+        # every worker routes to the same shards, a single worker starts its own
+        shard_directory, shards = start_shards(settings.matching_shards or 1)
+        os.environ["MATCHING_SHARDS"] = str(len(shards))
+        os.environ["MATCHING_SHARD_DIR"] = shard_directory
+    try:
+        # open event streams never finish by themselves, they are cut once in-flight requests had their time
+        uvicorn.run("app.server:app", host=settings.host, port=settings.port, reload=False, workers=settings.workers,
+                    timeout_graceful_shutdown=5)
+    finally:
+        if hub is not None:
+            hub.terminate()
+            shutil.rmtree(socket_directory, ignore_errors=True)
+        for shard in shards:
+            shard.terminate()
+        if shards:
+            shutil.rmtree(shard_directory, ignore_errors=True)
@@ -0,0 +1,95 @@
+import json
+import os
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+from app.api.latency import ZeroLatency
+from app.api.utils import set_latency_model
+
+ROUNDS = int(os.getenv("BENCHMARK_ROUNDS", "200"))
+WARMUP_ROUNDS = int(os.getenv("BENCHMARK_WARMUP_ROUNDS", "20"))
+# a previous BENCHMARK_OUTPUT report to compare medians against
+BASELINE = os.getenv("BENCHMARK_BASELINE")
+MAX_REGRESSION = float(os.getenv("BENCHMARK_MAX_REGRESSION", "0.10"))
+
+results: dict[str, dict[str, float]] = {}
+regressions: list[str] = []
+
+
+class AsyncBenchmark:
+    """Times a coroutine function over many rounds, in the spirit of pytest-benchmark's `benchmark` fixture."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    async def __call__(self, function: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        for _ in range(WARMUP_ROUNDS):
+            await function(*args, **kwargs)
+        timings = []
+        result = None
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            result = await function(*args, **kwargs)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        results[self.name] = {"rounds": ROUNDS,
+                              "min_us": round(timings[0] * 1e6, 1),
+                              "median_us": round(statistics.median(timings) * 1e6, 1),
+                              "p95_us": round(timings[int(len(timings) * 0.95) - 1] * 1e6, 1),
+                              "mean_us": round(statistics.fmean(timings) * 1e6, 1)}
+        return result
+
+
+@pytest.fixture(scope="session", autouse=True)
+def zero_latency():
+    # benchmarks measure the server's own overhead, not the simulated processing time
+    set_latency_model(ZeroLatency())
+
+
+@pytest_asyncio.fixture(scope="session")
+async def asgi_client() -> AsyncClient:
+    from app.api.lifecycle import lifecycle_scheduler
+    from app.server import app
+    async with AsyncClient(transport=ASGITransport(app=app),
+                           base_url="http://benchmark",
+                           headers={"Content-Type": "application/json"}) as async_client:
+        yield async_client
+    await lifecycle_scheduler.stop()
+
+
+@pytest.fixture
+def benchmark(request) -> AsyncBenchmark:
+    return AsyncBenchmark(request.node.name)
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not results:
+        return
+    terminalreporter.section("route overhead")
+    for name, stats in results.items():
+        terminalreporter.write_line(f"{name:<55} median {stats['median_us']:>10.1f} us  "
+                                    f"p95 {stats['p95_us']:>10.1f} us  min {stats['min_us']:>10.1f} us")
+    if output := os.getenv("BENCHMARK_OUTPUT"):
+        Path(output).write_text(json.dumps(results, indent=2, sort_keys=True))
+    if regressions:
+        terminalreporter.section(f"regressions over {MAX_REGRESSION:.0%}", red=True)
+        for regression in regressions:
+            terminalreporter.write_line(regression)
+
+
+def pytest_sessionfinish(session):
+    if not BASELINE or not results:
+        return
+    baseline = json.loads(Path(BASELINE).read_text())
+    regressions.extend(f"{name}: median {stats['median_us']} us vs {baseline[name]['median_us']} us"
+                       for name, stats in results.items()
+                       if name in baseline
+                       and stats["median_us"] > baseline[name]["median_us"] * (1 + MAX_REGRESSION))
+    if regressions:
+        session.exitstatus = pytest.ExitCode.TESTS_FAILED
@@ -0,0 +1,70 @@
+import pytest
+from hamcrest import assert_that, equal_to, has_entries, has_length
+from starlette import status
+
+from app.api.matching import matching_engine
+from app.api.utils import orders_db, place_orders
+from app.model.trading_platform_model import OrderInput, OrderSide, OrderStatus
+
+pytestmark = pytest.mark.asyncio(scope="session")
+
+BOOK_SIZE = 10_000
+
+
+@pytest.fixture(scope="module", autouse=True)
+def filled_order_book():
+    if len(orders_db) < BOOK_SIZE:
+        place_orders([OrderInput(stocks=stocks, quantity=1.0)
+                      for stocks in ["EURUSD", "GBPUSD", "USDJPY", "CHFPLN"] * (BOOK_SIZE // 4)])
+
+
+class TestRouteOverhead:
+
+    async def test_get_orders_page(self, asgi_client, benchmark):
+        response = await benchmark(asgi_client.get, "/orders/", params={"limit": 100})
+        assert_that(response.json(), has_length(100))
+
+    async def test_get_orders_filtered_page(self, asgi_client, benchmark):
+        response = await benchmark(asgi_client.get, "/orders/", params={"limit": 100, "stocks": "CHFPLN"})
+        assert_that(response.json(), has_length(100))
+
+    async def test_get_order(self, asgi_client, benchmark):
+        order = next(iter(orders_db))
+        response = await benchmark(asgi_client.get, f"/orders/{order.id}")
+        assert_that(response.status_code, equal_to(status.HTTP_200_OK))
+
+    async def test_get_unchanged_order(self, asgi_client, benchmark):
+        order = next(iter(orders_db))
+        etag = (await asgi_client.get(f"/orders/{order.id}")).headers["ETag"]
+        response = await benchmark(asgi_client.get, f"/orders/{order.id}", headers={"If-None-Match": etag})
+        assert_that(response.status_code, equal_to(status.HTTP_304_NOT_MODIFIED))
+
+    async def test_place_order(self, asgi_client, benchmark):
+        response = await benchmark(asgi_client.post, "/orders/", json={"stocks": "EURUSD", "quantity": 10.5})
+        assert_that(response.status_code, equal_to(status.HTTP_201_CREATED))
+
+    async def test_place_orders_batch(self, asgi_client, benchmark):
+        basket = [{"stocks": "EURUSD", "quantity": quantity} for quantity in range(1, 101)]
+        response = await benchmark(asgi_client.post, "/orders/batch", json=basket)
+        assert_that(response.json(), has_length(100))
+
+    async def test_match_limit_order(self, asgi_client, benchmark):
+        # every buy takes the best of thousands of asks spread over as many price levels
+        asks = place_orders([OrderInput(stocks="AUDUSD", quantity=1.0, side=OrderSide.sell, price=1.0 + level / 1000)
+                             for level in range(BOOK_SIZE)])
+        await matching_engine.submit(asks)
+        response = await benchmark(asgi_client.post, "/orders/",
+                                   json={"stocks": "AUDUSD", "quantity": 1.0, "side": "buy", "price": 20.0})
+        assert_that(response.json(), has_entries(status=OrderStatus.executed.value))
+
+    async def test_reject_invalid_order(self, asgi_client, benchmark):
+        response = await benchmark(asgi_client.post, "/orders/", json={"stocks": 123, "quantity": -1})
+        assert_that(response.status_code, equal_to(status.HTTP_400_BAD_REQUEST))
+
+    async def test_reject_malformed_json(self, asgi_client, benchmark):
+        response = await benchmark(asgi_client.post, "/orders/", content='{"stocks": "EURUSD" "quantity": 1}')
+        assert_that(response.status_code, equal_to(status.HTTP_400_BAD_REQUEST))
+
+    async def test_stream_orders(self, asgi_client, benchmark):
+        response = await benchmark(asgi_client.get, "/orders/stream", params={"stocks": "CHFPLN"})
+        assert_that(response.status_code, equal_to(status.HTTP_200_OK))
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+from hamcrest import assert_that, equal_to
+
+from app.api.broker import RespBroker
+from app.api.broker_hub import BrokerHub
+
+pytestmark = pytest.mark.asyncio
+
+
+class RestartableHub:
+    def __init__(self, path: str):
+        self.path = path
+        self._hub = BrokerHub()
+        self._server: asyncio.Server | None = None
+        self._writers: list[asyncio.StreamWriter] = []
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_unix_server(self._handle, self.path)
+
+    async def stop(self) -> None:
+        self._server.close()
+        for writer in self._writers:
+            writer.close()
+        self._writers.clear()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.append(writer)
+        await self._hub.handle(reader, writer)
+
+
+async def wait_for(done, timeout: float = 2) -> None:
+    async def poll():
+        while not done():
+            await asyncio.sleep(0.005)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+class TestRespBroker:
+
+    async def test_failing_handler_does_not_stop_delivery(self, tmp_path):
+        # given
+        hub = RestartableHub(str(tmp_path / "hub.sock"))
+        await hub.start()
+        broker = RespBroker(f"unix://{hub.path}")
+        await broker.connect()
+        received = []
+
+        def handler(payload: bytes) -> None:
+            if payload == b"bad":
+                raise ValueError("malformed")
+            received.append(payload)
+
+        await broker.subscribe("orders", handler)
+        # when
+        for message in (b"bad", b"good"):
+            broker.publish("orders", message)
+        await wait_for(lambda: received)
+        # then
+        assert_that(received, equal_to([b"good"]), "Message after the failing one handled")
+        await broker.close()
+        await hub.stop()
+
+    async def test_reconnects_after_losing_the_hub(self, tmp_path):
+        # given
+        hub = RestartableHub(str(tmp_path / "hub.sock"))
+        await hub.start()
+        broker = RespBroker(f"unix://{hub.path}")
+        await broker.connect()
+        received, reconnects = [], []
+        await broker.subscribe("orders", received.append)
+        broker.on_reconnect(lambda: reconnects.append(True))
+        # when
+        await hub.stop()
+        await hub.start()
+        await wait_for(lambda: reconnects)
+        broker.publish("orders", b"after")
+        await wait_for(lambda: received)
+        # then
+        assert_that(received, equal_to([b"after"]), "Subscription restored")
+        assert_that(len(reconnects), equal_to(1), "Reconnect listeners told once")
+        await broker.close()
+        await hub.stop()
@@ -0,0 +1,94 @@
+import asyncio
+import uuid
+
+import pytest
+from hamcrest import assert_that, equal_to, has_item
+
+from app.api.lifecycle import OrderLifecycleScheduler
+from app.api.order_store import InMemoryOrderStore
+from app.api.websocket_manager import BroadcastMessage
+from app.model.trading_platform_model import OrderOutput, OrderStatus
+
+pytestmark = pytest.mark.asyncio
+
+
+class FailingStore(InMemoryOrderStore):
+    __slots__ = ("failing",)
+
+    def __init__(self):
+        super().__init__()
+        self.failing: str | None = None
+
+    def set_status(self, order_id, order_status, filled_quantity=None):
+        if order_id == self.failing:
+            raise RuntimeError("corrupt order")
+        return super().set_status(order_id, order_status, filled_quantity)
+
+
+class RecordingManager:
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.broadcasts: list[list[BroadcastMessage]] = []
+        self.released: list[str] = []
+
+    async def broadcast_many(self, messages: list[BroadcastMessage]) -> None:
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("broadcast failed")
+        self.broadcasts.append(messages)
+
+    def release_order(self, order_id: str) -> None:
+        self.released.append(order_id)
+
+
+def new_order(store: InMemoryOrderStore) -> str:
+    order_id = str(uuid.uuid4())
+    store.add(OrderOutput(id=order_id, stocks="EURUSD", quantity=1, status=OrderStatus.pending))
+    return order_id
+
+
+async def wait_for(done, timeout: float = 2) -> None:
+    async def poll():
+        while not done():
+            await asyncio.sleep(0.005)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+class TestOrderLifecycleScheduler:
+
+    async def test_failing_transition_does_not_stop_other_lifecycles(self):
+        # given
+        store = FailingStore()
+        manager = RecordingManager()
+        scheduler = OrderLifecycleScheduler(store, manager, delay=lambda: 0.01)
+        store.failing = bad = new_order(store)
+        good = new_order(store)
+        done = []
+        # when
+        scheduler.schedule(bad, on_done=lambda: done.append(bad))
+        scheduler.schedule(good, on_done=lambda: done.append(good))
+        await wait_for(lambda: len(done) == 2)
+        # then
+        assert_that(store[good].status, equal_to(OrderStatus.cancelled.value), "Healthy order ran its lifecycle")
+        assert_that(store[bad].status, equal_to(OrderStatus.pending.value), "Failing order dropped out")
+        assert_that(len(scheduler), equal_to(0), "Nothing left scheduled")
+        await scheduler.stop()
+
+    async def test_failing_broadcast_keeps_runner_alive(self):
+        # given
+        store = InMemoryOrderStore()
+        manager = RecordingManager(failures=1)
+        scheduler = OrderLifecycleScheduler(store, manager, delay=lambda: 0.01)
+        first = new_order(store)
+        scheduler.schedule(first)
+        await wait_for(lambda: first in manager.released)
+        # when
+        second = new_order(store)
+        scheduler.schedule(second)
+        await wait_for(lambda: second in manager.released)
+        # then
+        assert_that([message.order_id for messages in manager.broadcasts for message in messages],
+                    has_item(second), "Later transitions broadcast")
+        assert_that(scheduler._runner.done(), equal_to(False), "Runner still running")
+        await scheduler.stop()
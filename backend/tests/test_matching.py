@@ -0,0 +1,43 @@
+import uuid
+
+import pytest
+from hamcrest import assert_that, equal_to
+
+from app.api.market_data import MarketDataFeed
+from app.api.matching import MatchingEngine
+from app.api.order_store import InMemoryOrderStore
+from app.api.websocket_manager import WebSocketManager
+from app.model.trading_platform_model import OrderOutput, OrderSide, OrderStatus
+
+pytestmark = pytest.mark.asyncio
+
+
+class UnreachableShards:
+    shards = 1
+
+    def __init__(self):
+        self.cancelled: list[tuple[str, str]] = []
+
+    async def match(self, orders):
+        raise ConnectionError("Matching shard went away")
+
+    async def cancel(self, orders):
+        self.cancelled.extend(orders)
+        return []
+
+
+class TestMatchingEngine:
+
+    async def test_orders_are_taken_back_out_when_matching_fails(self):
+        # given
+        store, shards, manager = InMemoryOrderStore(), UnreachableShards(), WebSocketManager()
+        engine = MatchingEngine(store, manager, MarketDataFeed(manager), shards)
+        order = OrderOutput(id=str(uuid.uuid4()), stocks="EURUSD", quantity=1, side=OrderSide.buy, price=1.1,
+                            status=OrderStatus.pending)
+        store.add(order)
+        # when
+        with pytest.raises(ConnectionError):
+            await engine.submit([store[order.id]])
+        # then
+        assert_that(order.id in store, equal_to(False), "No orphan left in the store")
+        assert_that(shards.cancelled, equal_to([(order.id, "EURUSD")]), "Taken out of the books too")
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+from hamcrest import assert_that, equal_to
+
+from app.api.matching_shard import MatchingShard, ShardConnection, read_frame
+
+pytestmark = pytest.mark.asyncio
+
+
+async def crashing_shard(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    # dies on the first request without replying
+    await read_frame(reader)
+    writer.close()
+
+
+class TestShardConnection:
+
+    async def test_requests_fail_once_the_shard_went_away(self, tmp_path):
+        # given
+        path = str(tmp_path / "shard-0.sock")
+        server = await asyncio.start_unix_server(crashing_shard, path)
+        connection = ShardConnection(path)
+        await connection.connect()
+        # when
+        waiting = connection.request("depth", "EURUSD")
+        # then
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(waiting, 1)
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(connection.request("depth", "EURUSD"), 1)
+        await connection.close()
+        server.close()
+
+    async def test_reconnects_once_the_shard_is_back(self, tmp_path):
+        # given
+        path = str(tmp_path / "shard-0.sock")
+        crashed = await asyncio.start_unix_server(crashing_shard, path)
+        reconnected = asyncio.Event()
+        # the crashed shard stops accepting, so reconnecting fails until it is back
+        connection = ShardConnection(path, restart=crashed.close, on_reconnect=reconnected.set)
+        connection.RECONNECT_INTERVAL = 0.01
+        await connection.connect()
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(connection.request("depth", "EURUSD"), 1)
+        # when
+        restarted = await asyncio.start_unix_server(MatchingShard().handle, path)
+        await asyncio.wait_for(reconnected.wait(), 2)
+        # then
+        assert_that(await asyncio.wait_for(connection.request("depth", "EURUSD"), 1), equal_to([0, [], []]),
+                    "Requests served again")
+        await connection.close()
+        restarted.close()
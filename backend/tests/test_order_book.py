@@ -0,0 +1,51 @@
+from hamcrest import assert_that, equal_to, has_item, less_than_or_equal_to
+
+from app.api.order_book import OrderBooks
+from app.model.trading_platform_model import OrderSide
+
+
+class TestOrderBooks:
+
+    def test_rounding_leftover_counts_as_full_fill(self):
+        # given
+        books = OrderBooks()
+        books.match([("sell-1", "EURUSD", "sell", 1.1, 0.2, 0.0), ("sell-2", "EURUSD", "sell", 1.1, 0.1, 0.0)])
+        # when
+        events = books.match([("buy", "EURUSD", "buy", 1.1, 0.3, 0.0)])
+        # then
+        assert_that(events, has_item(("order", "sell-2", "executed", 0.1)), "Second maker filled completely")
+        assert_that(events, has_item(("order", "buy", "executed", 0.3)), "Taker filled completely")
+        assert_that(books.depth("EURUSD"), equal_to((3, [], [])), "No dust left in the book")
+        assert_that(len(books), equal_to(0), "Nothing resting")
+
+    def test_better_price_fills_first_then_earlier_order_at_the_same_price(self):
+        # given
+        books = OrderBooks()
+        books.match([("sell-early", "EURUSD", "sell", 1.2, 1.0, 0.0), ("sell-late", "EURUSD", "sell", 1.2, 1.0, 0.0),
+                     ("sell-better", "EURUSD", "sell", 1.1, 1.0, 0.0)])
+        # when
+        events = books.match([("buy", "EURUSD", "buy", 1.2, 3.0, 0.0)])
+        # then
+        fills = [(event[2], event[5]) for event in events if event[0] == "fill"]
+        assert_that(fills, equal_to([(1.1, "sell-better"), (1.2, "sell-early"), (1.2, "sell-late")]),
+                    "Price priority, then time priority within the level")
+
+    def test_prices_of_emptied_levels_are_compacted(self):
+        # given
+        books = OrderBooks()
+        books.rest([(str(i), "EURUSD", "sell", 1 + i / 100, 1.0, 0.0) for i in range(100)])
+        # when
+        books.cancel(str(i) for i in range(1, 99))
+        # then
+        book = books.book("EURUSD")
+        assert_that(len(book._prices[OrderSide.sell]), less_than_or_equal_to(5), "Stale prices dropped")
+        assert_that(book.best_price(OrderSide.sell), equal_to(1.0), "Best price kept")
+
+    def test_depth_of_unknown_symbol_creates_no_book(self):
+        # given
+        books = OrderBooks()
+        # when
+        depth = books.depth("EURUSD")
+        # then
+        assert_that(depth, equal_to((0, [], [])), "Empty snapshot")
+        assert_that(books._books, equal_to({}), "No book created")
@@ -0,0 +1,96 @@
+import uuid
+
+from hamcrest import assert_that, equal_to, less_than_or_equal_to
+
+from app.api.order_encoding import STATUS_NUMBERS
+from app.api.order_store import InMemoryOrderStore
+from app.model.trading_platform_model import OrderOutput, OrderStatus
+
+PENDING = STATUS_NUMBERS[OrderStatus.pending]
+# what an index of 10 live orders may hold before stale entries are compacted away
+COMPACTED_LENGTH = InMemoryOrderStore.COMPACTION_THRESHOLD + 10
+
+
+def filled_store(count: int, stocks: str = "EURUSD") -> tuple[InMemoryOrderStore, list[str]]:
+    store = InMemoryOrderStore()
+    order_ids = [str(uuid.uuid4()) for _ in range(count)]
+    for order_id in order_ids:
+        store.add(OrderOutput(id=order_id, stocks=stocks, quantity=1, status=OrderStatus.pending))
+    return store, order_ids
+
+
+def all_pages(store: InMemoryOrderStore, limit: int, **filters) -> list[list[str]]:
+    pages, cursor = [], None
+    while True:
+        orders, cursor = store.page(limit, cursor, **filters)
+        pages.append([order.id for order in orders])
+        if cursor is None:
+            return pages
+
+
+class TestInMemoryOrderStore:
+
+    def test_pages_walk_every_order_once(self):
+        # given
+        store, order_ids = filled_store(5)
+        # when
+        pages = all_pages(store, 2)
+        # then
+        assert_that(pages, equal_to([order_ids[:2], order_ids[2:4], order_ids[4:]]), "Placement order, no overlap")
+
+    def test_pages_by_status_follow_transitions(self):
+        # given
+        store, order_ids = filled_store(6)
+        # moved out of order, later orders first
+        for order_id in reversed(order_ids[::2]):
+            store.set_status(order_id, OrderStatus.executed)
+        store.set_status(order_ids[2], OrderStatus.pending)
+        store.set_status(order_ids[2], OrderStatus.executed)
+        # when
+        executed = all_pages(store, 2, order_status=OrderStatus.executed)
+        pending = all_pages(store, 10, order_status=OrderStatus.pending)
+        # then
+        assert_that(executed, equal_to([[order_ids[0], order_ids[2]], [order_ids[4]]]),
+                    "Executed orders once each, in placement order")
+        assert_that(pending, equal_to([order_ids[1::2]]), "Moved orders left the pending pages")
+
+    def test_removed_orders_are_compacted_out_of_the_indexes(self):
+        # given
+        count = 4 * InMemoryOrderStore.COMPACTION_THRESHOLD
+        store, order_ids = filled_store(count)
+        # when
+        for order_id in order_ids[:-10]:
+            store.remove(order_id)
+        # then
+        assert_that(len(store._by_stocks[0]), less_than_or_equal_to(COMPACTED_LENGTH),
+                    "Symbol index compacted")
+        assert_that(len(store._status_index(PENDING)), less_than_or_equal_to(COMPACTED_LENGTH),
+                    "Status index compacted")
+        assert_that(all_pages(store, count, stocks="EURUSD"), equal_to([order_ids[-10:]]), "Live orders kept")
+
+    def test_transitions_are_compacted_out_of_the_old_status_index(self):
+        # given
+        count = 4 * InMemoryOrderStore.COMPACTION_THRESHOLD
+        store, order_ids = filled_store(count)
+        # when
+        for order_id in order_ids[:-10]:
+            store.set_status(order_id, OrderStatus.executed)
+        # then
+        assert_that(len(store._status_index(PENDING)), less_than_or_equal_to(COMPACTED_LENGTH),
+                    "Pending index compacted")
+        assert_that([order.id for order in store.by_status(OrderStatus.pending)], equal_to(order_ids[-10:]),
+                    "Pending orders kept")
+        assert_that(len(list(store.by_status(OrderStatus.executed))), equal_to(count - 10), "Executed orders indexed")
+
+    def test_transitions_leave_the_index_unmerged_until_read(self):
+        # given
+        store, order_ids = filled_store(3)
+        executed = STATUS_NUMBERS[OrderStatus.executed]
+        for order_id in reversed(order_ids):
+            store.set_status(order_id, OrderStatus.executed)
+        # when
+        store.set_status(order_ids[1], OrderStatus.cancelled)
+        # then
+        assert_that(executed in store._unsorted, equal_to(True), "Leaving a status does not merge its index")
+        assert_that([order.id for order in store.by_status(OrderStatus.executed)],
+                    equal_to([order_ids[0], order_ids[2]]), "Merged once read")
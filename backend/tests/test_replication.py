@@ -0,0 +1,93 @@
+import asyncio
+import uuid
+
+import pytest
+import pytest_asyncio
+from hamcrest import assert_that, equal_to
+
+from app.api.broker import LocalBroker
+from app.api.order_store import InMemoryOrderStore, ReplicatedOrderStore
+from app.model.trading_platform_model import OrderOutput, OrderStatus
+
+pytestmark = pytest.mark.asyncio
+
+
+async def wait_for(done, timeout: float = 2) -> None:
+    async def poll():
+        while not done():
+            await asyncio.sleep(0.005)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+@pytest_asyncio.fixture
+async def workers(monkeypatch):
+    """Stores of two workers replicating through one broker."""
+    monkeypatch.setattr(ReplicatedOrderStore, "SYNC_TIMEOUT", 0.05)
+    broker = LocalBroker()
+    stores = [ReplicatedOrderStore(InMemoryOrderStore(), broker, origin=f"worker-{number}") for number in range(2)]
+    for store in stores:
+        await store.open()
+    yield stores
+    await broker.close()
+
+
+class TestReplicatedOrderStore:
+
+    async def test_cancel_on_one_worker_removes_the_order_on_the_other(self, workers):
+        # given
+        first, second = workers
+        order_id = str(uuid.uuid4())
+        first.add(OrderOutput(id=order_id, stocks="EURUSD", quantity=1, status=OrderStatus.pending))
+        await wait_for(lambda: order_id in second)
+        # when
+        second.set_status(order_id, OrderStatus.cancelled)
+        second.remove(order_id)
+        await wait_for(lambda: order_id not in first)
+        # then
+        assert_that(len(first), equal_to(0), "Order gone on the worker that placed it")
+        assert_that(len(second), equal_to(0), "Order gone on the worker that cancelled it")
+
+    async def test_late_worker_copies_the_book(self, workers, monkeypatch):
+        # given
+        first, _ = workers
+        order_id = str(uuid.uuid4())
+        first.add(OrderOutput(id=order_id, stocks="EURUSD", quantity=1, status=OrderStatus.pending))
+        first.set_status(order_id, OrderStatus.executed)
+        # when
+        late = ReplicatedOrderStore(InMemoryOrderStore(), first._broker, origin="worker-late")
+        monkeypatch.setattr(ReplicatedOrderStore, "SYNC_TIMEOUT", 1)
+        await late.open()
+        # then
+        assert_that(late[order_id].status, equal_to(OrderStatus.executed.value), "Book copied from a running worker")
+
+    async def test_reconnected_worker_catches_up(self, workers):
+        # given
+        first, second = workers
+        order_id = str(uuid.uuid4())
+        first.add(OrderOutput(id=order_id, stocks="EURUSD", quantity=1, status=OrderStatus.pending))
+        await wait_for(lambda: order_id in second)
+        # a transition published while the second worker was cut off from the broker
+        first._store.set_status(order_id, OrderStatus.executed)
+        # when
+        second._reconnected()
+        await second._resync
+        # then
+        assert_that(second[order_id].status, equal_to(OrderStatus.executed.value), "Missed transition applied")
+        assert_that(len(second), equal_to(1), "Order kept its place")
+
+    async def test_reconnected_worker_drops_orders_removed_meanwhile(self, workers):
+        # given
+        first, second = workers
+        kept, cancelled = str(uuid.uuid4()), str(uuid.uuid4())
+        for order_id in (kept, cancelled):
+            first.add(OrderOutput(id=order_id, stocks="EURUSD", quantity=1, status=OrderStatus.pending))
+        await wait_for(lambda: cancelled in second)
+        # a cancel published while the second worker was cut off from the broker
+        first._store.remove(cancelled)
+        # when
+        second._reconnected()
+        await second._resync
+        # then
+        assert_that(cancelled in second, equal_to(False), "Missed cancel applied")
+        assert_that(kept in second, equal_to(True), "Other orders kept")
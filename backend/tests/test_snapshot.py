@@ -0,0 +1,59 @@
+import uuid
+
+import pytest
+from hamcrest import assert_that, contains_exactly, equal_to
+
+from app.api.order_store import DurableOrderStore, InMemoryOrderStore
+from app.api.snapshot import OrderSnapshot, write_snapshot
+from app.api.wal import WriteAheadLog
+from app.model.trading_platform_model import OrderOutput, OrderSide, OrderStatus
+
+
+def new_order(**fields) -> OrderOutput:
+    return OrderOutput(id=str(uuid.uuid4()), status=OrderStatus.pending, **fields)
+
+
+class TestOrderSnapshot:
+
+    def test_written_snapshot_loads_the_same_orders(self, tmp_path):
+        # given
+        store = InMemoryOrderStore()
+        lifecycle = new_order(stocks="EURUSD", quantity=1.5)
+        limit = new_order(stocks="GBPUSD", quantity=2, side=OrderSide.sell, price=1.25, filled_quantity=0.5)
+        market = new_order(stocks="EURUSD", quantity=3, side=OrderSide.buy, filled_quantity=0.0)
+        removed = new_order(stocks="USDJPY", quantity=4)
+        for order in (lifecycle, limit, market, removed):
+            store.add(order)
+        store.set_status(lifecycle.id, OrderStatus.executed)
+        store.remove(removed.id)
+        # when
+        write_snapshot(tmp_path / "snapshot.bin", store.columns())
+        loaded = InMemoryOrderStore()
+        loaded.load_snapshot(OrderSnapshot(tmp_path / "snapshot.bin"))
+        # then
+        assert_that(list(loaded), contains_exactly(*store), "Live orders loaded in placement order")
+        assert_that(list(loaded.by_status(OrderStatus.executed)), contains_exactly(store[lifecycle.id]),
+                    "Status index rebuilt")
+        assert_that(list(loaded.by_stocks("EURUSD")), contains_exactly(store[lifecycle.id], store[market.id]),
+                    "Symbol index rebuilt")
+        assert_that(loaded.get(removed.id), equal_to(None), "Removed order left out")
+
+    @pytest.mark.asyncio
+    async def test_restart_maps_the_snapshot_written_on_close(self, tmp_path):
+        # given
+        store = DurableOrderStore(InMemoryOrderStore(), WriteAheadLog(tmp_path, commit_interval=0.001))
+        await store.open()
+        orders = [new_order(stocks="EURUSD", quantity=quantity) for quantity in (1, 2, 3)]
+        for order in orders:
+            store.add(order)
+        store.set_status(orders[0].id, OrderStatus.cancelled)
+        expected = list(store)
+        await store.close()
+        assert_that(sorted(path.name for path in tmp_path.iterdir()),
+                    equal_to(["snapshot-00000001.bin", "wal-00000001.log"]), "Log replaced by a snapshot")
+        # when
+        restarted = DurableOrderStore(InMemoryOrderStore(), WriteAheadLog(tmp_path, commit_interval=0.001))
+        await restarted.open()
+        # then
+        assert_that(list(restarted), contains_exactly(*expected), "Orders recovered")
+        await restarted.close()
@@ -0,0 +1,151 @@
+import asyncio
+import os
+import threading
+
+import pytest
+from hamcrest import assert_that, equal_to
+
+from app.api import wal as wal_module
+from app.api.snapshot import OrderColumns
+from app.api.wal import LogFailedError, WriteAheadLog
+
+pytestmark = pytest.mark.asyncio
+
+
+class TestWriteAheadLogFailures:
+
+    async def test_failed_write_fails_later_syncs(self, tmp_path):
+        # given
+        log = WriteAheadLog(tmp_path, commit_interval=0.001)
+        log.recover()
+        await log.open()
+        log.append({"op": "remove", "id": "1"})
+        await log.sync()
+        os.close(log._file)
+        # when
+        log.append({"op": "remove", "id": "2"})
+        with pytest.raises(LogFailedError):
+            await asyncio.wait_for(log.sync(), 1)
+        log.append({"op": "remove", "id": "3"})
+        # then
+        with pytest.raises(LogFailedError):
+            await asyncio.wait_for(log.sync(), 1)
+        log._file = None
+        await log.close()
+
+    async def test_commits_carry_on_while_snapshot_is_written(self, tmp_path, monkeypatch):
+        # given
+        writing, release = threading.Event(), threading.Event()
+
+        def slow_write_snapshot(path, columns):
+            writing.set()
+            release.wait(5)
+            path.write_bytes(b"")
+
+        monkeypatch.setattr(wal_module, "write_snapshot", slow_write_snapshot)
+        log = WriteAheadLog(tmp_path, commit_interval=0.001, snapshot_records=2, snapshot_source=OrderColumns)
+        log.recover()
+        await log.open()
+        for order_id in "12":
+            log.append({"op": "remove", "id": order_id})
+        await log.sync()
+        await asyncio.to_thread(writing.wait, 5)
+        # when
+        log.append({"op": "remove", "id": "3"})
+        await asyncio.wait_for(log.sync(), 1)
+        # then
+        assert_that(log._snapshotting.done(), equal_to(False), "Snapshot still being written")
+        assert_that((tmp_path / "wal-00000001.log").read_bytes(), equal_to(b'{"op":"remove","id":"3"}\n'),
+                    "Record committed to the next segment")
+        release.set()
+        await log.close()
+
+
+async def logged(tmp_path, records: list[dict], **options) -> WriteAheadLog:
+    log = WriteAheadLog(tmp_path, commit_interval=0.001, **options)
+    log.recover()
+    await log.open()
+    for record in records:
+        log.append(record)
+    await log.sync()
+    return log
+
+
+class TestWriteAheadLog:
+
+    async def test_synced_records_survive_a_crash(self, tmp_path):
+        # given
+        records = [{"op": "remove", "id": str(order_id)} for order_id in range(3)]
+        crashed = await logged(tmp_path, records)
+        # when
+        snapshot, replayed = WriteAheadLog(tmp_path).recover()
+        # then
+        assert_that(snapshot, equal_to(None), "No snapshot taken")
+        assert_that(list(replayed), equal_to(records), "Every synced record replayed in order")
+        await crashed.close()
+
+    async def test_torn_trailing_record_is_skipped(self, tmp_path):
+        # given
+        records = [{"op": "remove", "id": "1"}, {"op": "remove", "id": "2"}]
+        crashed = await logged(tmp_path, records)
+        with open(tmp_path / "wal-00000000.log", "ab") as segment:
+            segment.write(b'{"op":"remo')
+        # when
+        _, replayed = WriteAheadLog(tmp_path).recover()
+        # then
+        assert_that(list(replayed), equal_to(records), "Complete records replayed, the torn one dropped")
+        await crashed.close()
+
+    async def test_records_appended_while_closing_are_written_first(self, tmp_path, monkeypatch):
+        # given
+        writing, release = threading.Event(), threading.Event()
+        write = WriteAheadLog._write
+
+        def slow_write(file, data):
+            writing.set()
+            release.wait(5)
+            write(file, data)
+
+        monkeypatch.setattr(WriteAheadLog, "_write", staticmethod(slow_write))
+        log = await logged(tmp_path, [])
+        log.append({"op": "remove", "id": "1"})
+        closing = asyncio.create_task(log.close())
+        await asyncio.to_thread(writing.wait, 5)
+        # when
+        log.append({"op": "remove", "id": "2"})
+        release.set()
+        await asyncio.wait_for(closing, 1)
+        # then
+        assert_that(list(WriteAheadLog(tmp_path).recover()[1]),
+                    equal_to([{"op": "remove", "id": "1"}, {"op": "remove", "id": "2"}]), "Both records on disk")
+
+    async def test_restart_appends_to_a_new_segment(self, tmp_path):
+        # given
+        first = await logged(tmp_path, [{"op": "remove", "id": "1"}])
+        await first.close()
+        # when
+        second = await logged(tmp_path, [{"op": "remove", "id": "2"}])
+        await second.close()
+        # then
+        assert_that(sorted(path.name for path in tmp_path.iterdir()),
+                    equal_to(["wal-00000000.log", "wal-00000001.log"]), "One segment per run")
+        assert_that(list(WriteAheadLog(tmp_path).recover()[1]),
+                    equal_to([{"op": "remove", "id": "1"}, {"op": "remove", "id": "2"}]), "Segments replayed in order")
+
+    async def test_snapshot_rotates_and_replaces_older_segments(self, tmp_path):
+        # given
+        columns = OrderColumns()
+        records = [{"op": "remove", "id": str(order_id)} for order_id in range(3)]
+        # when
+        log = await logged(tmp_path, records[:2], snapshot_records=2, snapshot_source=lambda: columns)
+        log.append(records[2])
+        await log.sync()
+        await log._snapshotting
+        # then
+        assert_that(sorted(path.name for path in tmp_path.iterdir()),
+                    equal_to(["snapshot-00000001.bin", "wal-00000001.log"]), "Segment 0 replaced by the snapshot")
+        snapshot, replayed = WriteAheadLog(tmp_path).recover()
+        assert_that(snapshot.name, equal_to("snapshot-00000001.bin"), "Snapshot recovered")
+        assert_that(list(replayed), equal_to(records[2:]), "Only records after the snapshot replayed")
+        log.snapshot_source = None
+        await log.close()
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+from hamcrest import assert_that, equal_to
+
+from app.api.websocket_manager import SlowConsumerPolicy, WebSocketManager, order_update
+from app.api.wire_protocol import WireProtocol
+from app.model.trading_platform_model import OrderOutput, OrderStatus
+
+pytestmark = pytest.mark.asyncio
+
+
+class FakeWebSocket:
+    def __init__(self, subprotocols: list[str] = ()):
+        self.scope = {"subprotocols": list(subprotocols)}
+        self.sent: list[str | bytes] = []
+        self.close_code: int | None = None
+
+    async def accept(self, subprotocol: str | None = None) -> None:
+        pass
+
+    async def send_text(self, data: str) -> None:
+        self.sent.append(data)
+
+    async def send_bytes(self, data: bytes) -> None:
+        self.sent.append(data)
+
+    async def close(self, code: int = 1000) -> None:
+        self.close_code = code
+
+
+async def wait_for(done, timeout: float = 2) -> None:
+    async def poll():
+        while not done():
+            await asyncio.sleep(0.005)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+class TestWebSocketManager:
+
+    async def test_undeliverable_message_only_drops_its_connection(self):
+        # given
+        manager = WebSocketManager(max_queue_size=16, policy=SlowConsumerPolicy.drop_oldest)
+        binary, text = FakeWebSocket([WireProtocol.binary.value]), FakeWebSocket()
+        await manager.connect(binary)
+        await manager.connect(text)
+        # an id that can not be packed into a binary frame
+        order = OrderOutput(id="not-an-order-id", stocks="EURUSD", quantity=1, status=OrderStatus.pending)
+        # when
+        await manager.broadcast_many([order_update(order)])
+        await wait_for(lambda: text.sent and binary.close_code is not None)
+        # then
+        assert_that(text.sent, equal_to([order_update(order).payload]), "JSON client got the update")
+        assert_that(binary in manager.active_connections, equal_to(False), "Binary client dropped")
+        manager.disconnect(text)
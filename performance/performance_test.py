@@ -1,71 +1,276 @@
+import argparse
 import asyncio
 import json
+import platform
 import random
 import statistics
 import time
-from dataclasses import dataclass
+from collections import Counter, deque
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
 
 import websockets
-from httpx import AsyncClient
+from httpx import AsyncClient, Limits
 from loguru import logger
 from starlette import status
 
 from tests.conftest import get_http_url, get_ws_url
 
+PERCENTILES = (50, 95, 99, 99.9)
+
+
+@dataclass
+class BenchmarkConfig:
+    http_url: str
+    ws_url: str
+    duration: float
+    warmup: float
+    concurrency: int
+    rate: float
+    ws_ratio: float
+    interval: float
+    drain_timeout: float
+    seed: int
+    output: Path | None
+
 
 @dataclass
-class Duration:
-    start_time = time.time()
-    end_time = None
+class OrderTiming:
+    transport: str
+    # intended start, in open-loop mode this is the scheduled arrival rather than the moment it was sent
+    start_time: float = field(default_factory=time.perf_counter)
+    placed_time: float | None = None
+    executed_time: float | None = None
+    warmup: bool = False
+
+
+@dataclass
+class BenchmarkState:
+    orders: dict[str, OrderTiming] = field(default_factory=dict)
+    # updates that overtook the placement response, keyed by order id
+    early_executions: dict[str, float] = field(default_factory=dict)
+    errors: Counter = field(default_factory=Counter)
+
 
+def percentiles(samples: list[float]) -> dict[str, float | int | None]:
+    if not samples:
+        return {"count": 0, **{f"p{p}": None for p in PERCENTILES}, "mean": None, "max": None}
+    ordered = sorted(samples)
+    result = {"count": len(ordered)}
+    for p in PERCENTILES:
+        # nearest-rank percentile, stable for diffing between runs
+        rank = max(1, -(-len(ordered) * p // 100))
+        result[f"p{p}"] = round(ordered[int(rank) - 1] * 1000, 3)
+    result["mean"] = round(statistics.fmean(ordered) * 1000, 3)
+    result["max"] = round(ordered[-1] * 1000, 3)
+    return result
 
-placed_orders = []
-order_times = {}
 
+def record_execution(state: BenchmarkState, message: dict) -> None:
+    if message.get("status") != "executed":
+        return
+    order_id = message.get("id")
+    now = time.perf_counter()
+    if (timing := state.orders.get(order_id)) is None:
+        state.early_executions[order_id] = now
+    elif timing.executed_time is None:
+        timing.executed_time = now
 
-async def create_order(client: AsyncClient):
-    duration = Duration()
-    response = await client.post("/orders", json={"stocks": "EURUSD",
-                                                  "quantity": random.uniform(0.5, 1000000.0)})
+
+def record_placement(state: BenchmarkState, order_id: str, timing: OrderTiming) -> None:
+    timing.placed_time = time.perf_counter()
+    state.orders[order_id] = timing
+    if (executed_time := state.early_executions.pop(order_id, None)) is not None:
+        timing.executed_time = executed_time
+
+
+async def listen_for_updates(config: BenchmarkConfig, state: BenchmarkState, ready: asyncio.Event) -> None:
+    async with websockets.connect(config.ws_url + "/ws", max_queue=None) as websocket:
+        ready.set()
+        async for raw_message in websocket:
+            record_execution(state, json.loads(raw_message))
+
+
+async def place_rest_order(client: AsyncClient, state: BenchmarkState, timing: OrderTiming) -> None:
+    try:
+        response = await client.post("/orders/", json={"stocks": random.choice(["EURUSD", "GBPUSD", "USDJPY"]),
+                                                        "quantity": random.uniform(0.5, 1000000.0)})
+    except Exception as e:
+        state.errors[type(e).__name__] += 1
+        return
     if response.status_code == status.HTTP_201_CREATED:
-        order_id = response.json().get("id")
-        logger.info(f"Order created with id '{order_id}'")
-        placed_orders.append(order_id)
-        order_times[order_id] = duration
-    logger.info(f"Failed to place order: {response.json()}")
-
-
-async def receive_ws_messages():
-    async with websockets.connect(get_ws_url() + "/ws") as websocket_client:
-        counter = 0
-        while True:
-            message = json.loads(await websocket_client.recv())
-            order_id = message.get("id")
-            if message.get("status") == "executed":
-                counter += 1
-                logger.info(f"Received message with id '{order_id}' and count is '{counter}'")
-                order_times[order_id].end_time = time.time()
-                placed_orders.remove(message.get("id"))
-            if len(placed_orders) == 0:
-                break
-
-
-async def main():
-    async with AsyncClient(base_url=get_http_url(), follow_redirects=True) as client:
-        tasks = [asyncio.create_task(receive_ws_messages())]
-        tasks.extend([asyncio.create_task(create_order(client)) for _ in range(100)])
+        record_placement(state, response.json().get("id"), timing)
+    else:
+        state.errors[f"http_{response.status_code}"] += 1
+
+
+class WsOrderClient:
+    """Order entry socket: acks arrive in submission order, so pending timings are matched FIFO."""
+
+    def __init__(self, config: BenchmarkConfig, state: BenchmarkState):
+        self.config = config
+        self.state = state
+        self.pending: deque[tuple[OrderTiming, asyncio.Future]] = deque()
+        self.websocket = None
+        self._reader: asyncio.Task | None = None
+
+    async def __aenter__(self) -> "WsOrderClient":
+        self.websocket = await websockets.connect(self.config.ws_url + "/ws?ack=true", max_queue=None)
+        await self.websocket.send(json.dumps({"action": "subscribe", "own_orders": True}))
+        self._reader = asyncio.create_task(self._read())
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._reader.cancel()
+        await self.websocket.close()
+
+    async def place(self, timing: OrderTiming) -> None:
+        acked = asyncio.get_running_loop().create_future()
+        self.pending.append((timing, acked))
+        await self.websocket.send(json.dumps({"stocks": random.choice(["EURUSD", "GBPUSD", "USDJPY"]),
+                                              "quantity": random.uniform(0.5, 1000000.0)}))
+        await acked
+
+    async def _read(self) -> None:
+        async for raw_message in self.websocket:
+            message = json.loads(raw_message)
+            if "ack" in message:
+                for order_id in message["ack"]:
+                    timing, acked = self.pending.popleft()
+                    record_placement(self.state, order_id, timing)
+                    acked.set_result(None)
+            elif "errors" in message:
+                self.state.errors["ws_rejected"] += 1
+                _, acked = self.pending.popleft()
+                acked.set_result(None)
+
+
+async def run_order(config: BenchmarkConfig,
+                    state: BenchmarkState,
+                    client: AsyncClient,
+                    ws_client: WsOrderClient,
+                    timing: OrderTiming,
+                    slots: asyncio.Semaphore) -> None:
+    async with slots:
+        if timing.transport == "ws":
+            await ws_client.place(timing)
+        else:
+            await place_rest_order(client, state, timing)
+
+
+async def generate_load(config: BenchmarkConfig,
+                        state: BenchmarkState,
+                        client: AsyncClient,
+                        ws_client: WsOrderClient) -> None:
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(config.concurrency)
+    tasks = set()
+    begin = time.perf_counter()
+    warmup_end = begin + config.warmup
+    end = warmup_end + config.duration
+    next_arrival = begin
+    while (now := time.perf_counter()) < end:
+        if config.rate > 0:
+            # open loop: arrivals follow a Poisson process regardless of how fast the server answers
+            if next_arrival > now:
+                await asyncio.sleep(next_arrival - now)
+            start_time = next_arrival
+            next_arrival += random.expovariate(config.rate)
+        else:
+            # closed loop: a new order as soon as one of the concurrent slots frees up
+            await slots.acquire()
+            slots.release()
+            start_time = time.perf_counter()
+        transport = "ws" if random.random() < config.ws_ratio else "rest"
+        timing = OrderTiming(transport=transport, start_time=start_time, warmup=start_time < warmup_end)
+        task = loop.create_task(run_order(config, state, client, ws_client, timing, slots))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        await asyncio.sleep(0)
+    if tasks:
         await asyncio.gather(*tasks)
 
-    execution_delays = [duration.end_time - duration.start_time for order_id, duration in order_times.items()]
-    average_delay = statistics.mean(execution_delays)
-    standard_deviation_delay = statistics.stdev(execution_delays)
-    logger.info(f"Average order execution delay: {average_delay:.2f} seconds")
-    logger.info(f"Standard deviation of order execution delay: {standard_deviation_delay:.2f} seconds")
-    logger.info(f"Total orders processed: {len(order_times)}")
 
-    for order_id, duration in order_times.items():
-        logger.info(f"Order '{order_id}' Duration: {duration.end_time - duration.start_time:.2f}")
+async def wait_for_executions(config: BenchmarkConfig, state: BenchmarkState) -> None:
+    deadline = time.perf_counter() + config.drain_timeout
+    while time.perf_counter() < deadline:
+        if all(timing.executed_time is not None for timing in state.orders.values()):
+            return
+        await asyncio.sleep(0.1)
+
+
+def throughput_over_time(timings: list[OrderTiming], begin: float, interval: float) -> list[dict]:
+    placed = Counter(int((t.placed_time - begin) // interval) for t in timings if t.placed_time is not None)
+    executed = Counter(int((t.executed_time - begin) // interval) for t in timings if t.executed_time is not None)
+    last_bucket = max([*placed, *executed], default=-1)
+    return [{"t": round(bucket * interval, 3),
+             "placed_per_s": round(placed[bucket] / interval, 3),
+             "executed_per_s": round(executed[bucket] / interval, 3)}
+            for bucket in range(last_bucket + 1)]
+
+
+def build_report(config: BenchmarkConfig, state: BenchmarkState, begin: float) -> dict:
+    measured = [t for t in state.orders.values() if not t.warmup]
+    report = {
+        "config": {**asdict(config), "output": str(config.output) if config.output else None},
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "orders": {"measured": len(measured),
+                   "warmup": len(state.orders) - len(measured),
+                   "not_executed": sum(1 for t in measured if t.executed_time is None),
+                   "errors": dict(state.errors)},
+        "latency_ms": {},
+        "throughput": {"placed_per_s": round(len(measured) / config.duration, 3) if config.duration else None,
+                       "over_time": throughput_over_time(measured, begin + config.warmup, config.interval)},
+    }
+    for transport in ("rest", "ws"):
+        timings = [t for t in measured if t.transport == transport]
+        if timings:
+            report["latency_ms"][transport] = {
+                "placement": percentiles([t.placed_time - t.start_time for t in timings]),
+                "execution": percentiles([t.executed_time - t.start_time for t in timings
+                                          if t.executed_time is not None]),
+            }
+    return report
+
+
+async def main(config: BenchmarkConfig) -> dict:
+    random.seed(config.seed)
+    state = BenchmarkState()
+    listener_ready = asyncio.Event()
+    listener = asyncio.create_task(listen_for_updates(config, state, listener_ready))
+    await listener_ready.wait()
+    limits = Limits(max_connections=config.concurrency, max_keepalive_connections=config.concurrency)
+    async with AsyncClient(base_url=config.http_url, limits=limits) as client, WsOrderClient(config, state) as ws_client:
+        begin = time.perf_counter()
+        await generate_load(config, state, client, ws_client)
+        await wait_for_executions(config, state)
+    listener.cancel()
+    return build_report(config, state, begin)
+
+
+def parse_args() -> BenchmarkConfig:
+    parser = argparse.ArgumentParser(description="Load generator for the trading platform")
+    parser.add_argument("--http-url", default=get_http_url())
+    parser.add_argument("--ws-url", default=get_ws_url())
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds of load")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds of load excluded from the results")
+    parser.add_argument("--concurrency", type=int, default=50, help="maximum orders in flight")
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="open-loop arrival rate in orders/s, 0 runs closed loop at full concurrency")
+    parser.add_argument("--ws-ratio", type=float, default=0.0, help="share of orders placed over WebSocket")
+    parser.add_argument("--interval", type=float, default=1.0, help="throughput bucket width in seconds")
+    parser.add_argument("--drain-timeout", type=float, default=10.0,
+                        help="seconds to wait for executions once the load stops")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write the JSON report to this file")
+    return BenchmarkConfig(**vars(parser.parse_args()))
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    benchmark_config = parse_args()
+    result = asyncio.run(main(benchmark_config))
+    report_json = json.dumps(result, indent=2, sort_keys=True)
+    if benchmark_config.output:
+        benchmark_config.output.write_text(report_json)
+        logger.info(f"Report written to '{benchmark_config.output}'")
+    print(report_json)
@@ -1,4 +1,7 @@
+from typing import AsyncIterator
+
 import pytest_asyncio
+from httpx import Response
 
 from tests.model.trading_platform_model import OrderOutput, OrderInput
 from tests.conftest import http_client
@@ -10,3 +13,16 @@ async def created_order(http_client) -> OrderOutput:
                                       json=OrderInput(stocks="PLNUSD",
                                                       quantity=23.24).model_dump())
     yield OrderOutput.model_validate(response.json())
+
+
+async def read_events(response: Response) -> AsyncIterator[dict[str, str]]:
+    """Server-Sent Events of a streamed response as their fields, comments left out."""
+    event = {}
+    async for line in response.aiter_lines():
+        if not line:
+            if event:
+                yield event
+            event = {}
+        elif not line.startswith(":"):
+            field, _, value = line.partition(":")
+            event[field] = value.removeprefix(" ")
@@ -1,8 +1,16 @@
+import asyncio
+import json
+import uuid
+
 import pytest
-from hamcrest import assert_that, equal_to, has_entries, is_, empty
+from hamcrest import (assert_that, equal_to, has_entries, is_, empty, has_length, not_none, none, only_contains,
+                      contains_string, starts_with, contains_inanyorder, is_not)
 from starlette import status
 
-from tests.model.trading_platform_model import OrderInput, OrderStatus
+from tests.http.conftest import read_events
+
+from tests.model.trading_platform_model import (OrderInput, OrderOutput, OrderSide, OrderStatus, OrderResult,
+                                                RequestError)
 
 pytestmark = pytest.mark.asyncio
 
@@ -28,6 +36,43 @@ class TestOrderRoutes:
         assert_that(response.status_code, equal_to(status.HTTP_200_OK), "Response status is 200")
         assert_that(isinstance(response.json(), list), "The response is a list")
 
+    async def test_get_orders_paginated_by_stocks(self, http_client):
+        # given
+        stocks = uuid.uuid4().hex[:8].upper()
+        created_ids = []
+        for quantity in [1, 2, 3]:
+            response = await http_client.post("/orders", json=OrderInput(stocks=stocks, quantity=quantity).model_dump())
+            created_ids.append(response.json().get("id"))
+        # when
+        first_page = await http_client.get("/orders", params={"stocks": stocks, "limit": 2})
+        second_page = await http_client.get("/orders", params={"stocks": stocks, "limit": 2,
+                                                              "cursor": first_page.headers.get("X-Next-Cursor")})
+        # then
+        assert_that(first_page.status_code, equal_to(status.HTTP_200_OK), "Response status is 200")
+        assert_that(first_page.json(), has_length(2), "First page is full")
+        assert_that(first_page.headers.get("X-Next-Cursor"), not_none(), "Next cursor returned")
+        assert_that(second_page.json(), has_length(1), "Second page holds the rest")
+        assert_that(second_page.headers.get("X-Next-Cursor"), none(), "No more pages")
+        assert_that([order["id"] for order in first_page.json() + second_page.json()],
+                    equal_to(created_ids), "Orders returned in placement order")
+        assert_that(first_page.json() + second_page.json(), only_contains(has_entries(stocks=stocks)),
+                    "Only requested symbol returned")
+
+    async def test_stream_orders(self, http_client):
+        # given
+        stocks = uuid.uuid4().hex[:8].upper()
+        created_ids = []
+        for quantity in [1, 2]:
+            response = await http_client.post("/orders", json=OrderInput(stocks=stocks, quantity=quantity).model_dump())
+            created_ids.append(response.json().get("id"))
+        # when
+        response = await http_client.get("/orders/stream", params={"stocks": stocks})
+        # then
+        assert_that(response.status_code, equal_to(status.HTTP_200_OK), "Response status is 200")
+        assert_that(response.headers.get("content-type"), equal_to("application/x-ndjson"), "NDJSON returned")
+        lines = [OrderOutput.model_validate_json(line) for line in response.text.splitlines()]
+        assert_that([order.id for order in lines], equal_to(created_ids), "Every order streamed in placement order")
+
     async def test_place_order(self, http_client):
         order_request = OrderInput(stocks="EURUSD", quantity=100)
         response = await http_client.post("/orders", json=order_request.model_dump())
@@ -36,12 +81,186 @@ class TestOrderRoutes:
                                                  stocks=order_request.stocks,
                                                  quantity=order_request.quantity), "Client received expected data")
 
+    async def test_place_orders_batch(self, http_client):
+        # given
+        orders = [OrderInput(stocks="EURUSD", quantity=10).model_dump(),
+                  {"stocks": "EURUSD", "quantity": -1},
+                  OrderInput(stocks="GBPUSD", quantity=20).model_dump()]
+        # when
+        response = await http_client.post("/orders/batch", json=orders)
+        # then
+        assert_that(response.status_code, equal_to(status.HTTP_201_CREATED), "Response status is 201")
+        results = [OrderResult.model_validate(result) for result in response.json()]
+        assert_that(results, has_length(3), "One result per submitted order")
+        assert_that(results[0].order.model_dump(), has_entries(stocks="EURUSD", quantity=10,
+                                                               status=OrderStatus.pending.value), "First order placed")
+        assert_that(results[1].errors, equal_to([RequestError(message="Input should be greater than 0",
+                                                              input=-1,
+                                                              localization=["body", 1, "quantity"],
+                                                              type="greater_than")]), "Second order rejected")
+        assert_that(results[2].order.model_dump(), has_entries(stocks="GBPUSD", quantity=20), "Third order placed")
+
+    async def test_place_orders_batch_with_non_finite_quantities(self, http_client):
+        # given
+        body = '[{"stocks": "EURUSD", "quantity": 10}, {"stocks": "EURUSD", "quantity": NaN}, ' \
+               '{"stocks": "EURUSD", "quantity": 1e400}, {"stocks": "GBPUSD", "quantity": 20}]'
+        # when
+        response = await http_client.post("/orders/batch", content=body)
+        # then
+        assert_that(response.status_code, equal_to(status.HTTP_201_CREATED), "Response status is 201")
+        results = [OrderResult.model_validate(result) for result in response.json()]
+        assert_that([result.order is not None for result in results], equal_to([True, False, False, True]),
+                    "Finite orders placed")
+        assert_that([error.type for result in results[1:3] for error in result.errors],
+                    equal_to(["finite_number", "finite_number"]), "Non-finite orders rejected one by one")
+
+    async def test_retried_order_placed_once(self, http_client):
+        # given
+        order_request = OrderInput(stocks=uuid.uuid4().hex[:8].upper(), quantity=7)
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        first = await http_client.post("/orders", json=order_request.model_dump(), headers=headers)
+        # when
+        retry = await http_client.post("/orders", json=order_request.model_dump(), headers=headers)
+        # then
+        assert_that(retry.status_code, equal_to(status.HTTP_201_CREATED), "Response status is 201")
+        assert_that(retry.json(), equal_to(first.json()), "Original order returned")
+        assert_that(retry.headers.get("Idempotent-Replayed"), equal_to("true"), "Retry marked as replayed")
+        response = await http_client.get("/orders", params={"stocks": order_request.stocks})
+        assert_that(response.json(), has_length(1), "Only one order placed")
+
+    async def test_limit_orders_match(self, http_client):
+        # given
+        stocks = uuid.uuid4().hex[:8].upper()
+        response = await http_client.post("/orders", json=OrderInput(stocks=stocks, quantity=5, side=OrderSide.sell,
+                                                                     price=1.1).model_dump())
+        resting = OrderOutput.model_validate(response.json())
+        # when
+        response = await http_client.post("/orders", json=OrderInput(stocks=stocks, quantity=3, side=OrderSide.buy,
+                                                                     price=1.2).model_dump())
+        # then
+        assert_that(response.status_code, equal_to(status.HTTP_201_CREATED), "Response status is 201")
+        assert_that(resting.model_dump(), has_entries(status=OrderStatus.pending.value, filled_quantity=0),
+                    "Sell order rests in the book")
+        assert_that(response.json(), has_entries(status=OrderStatus.executed.value, filled_quantity=3),
+                    "Buy order filled at once")
+        response = await http_client.get(f"/orders/{resting.id}")
+        assert_that(response.json(), has_entries(status=OrderStatus.pending.value, filled_quantity=3),
+                    "Sell order partially filled")
+
+    async def test_market_order_without_liquidity(self, http_client):
+        # given
+        order_request = OrderInput(stocks=uuid.uuid4().hex[:8].upper(), quantity=1, side=OrderSide.buy)
+        # when
+        response = await http_client.post("/orders", json=order_request.model_dump())
+        # then
+        assert_that(response.json(), has_entries(status=OrderStatus.cancelled.value, filled_quantity=0),
+                    "Nothing to trade with")
+
     async def test_get_order(self, http_client, created_order):
         response = await http_client.get(f"/orders/{created_order.id}")
         assert_that(response.status_code, equal_to(status.HTTP_200_OK), "Response status is 200")
-        assert_that(response.json(), equal_to(created_order.model_dump()), "Returned order is equal to created")
+        assert_that(response.json(), equal_to(created_order.model_dump(exclude_none=True)),
+                    "Returned order is equal to created")
+
+    async def test_get_unchanged_order(self, http_client):
+        # given
+        response = await http_client.post("/orders", json=OrderInput(stocks=uuid.uuid4().hex[:8].upper(), quantity=1,
+                                                                     side=OrderSide.sell, price=2.5).model_dump())
+        response = await http_client.get(f"/orders/{response.json().get('id')}")
+        # when
+        unchanged = await http_client.get(f"/orders/{response.json().get('id')}",
+                                          headers={"If-None-Match": response.headers.get("ETag")})
+        # then
+        assert_that(response.headers.get("ETag"), not_none(), "Version returned")
+        assert_that(unchanged.status_code, equal_to(status.HTTP_304_NOT_MODIFIED), "Response status is 304")
+        assert_that(unchanged.text, is_(empty()))
+
+    async def test_wait_for_order_change(self, http_client):
+        # given
+        stocks = uuid.uuid4().hex[:8].upper()
+        response = await http_client.post("/orders", json=OrderInput(stocks=stocks, quantity=1, side=OrderSide.sell,
+                                                                     price=2.5).model_dump())
+        resting = await http_client.get(f"/orders/{response.json().get('id')}")
+        # when
+        waiting = asyncio.create_task(http_client.get(f"/orders/{resting.json().get('id')}",
+                                                      params={"wait_for_change": 5},
+                                                      headers={"If-None-Match": resting.headers.get("ETag")}))
+        await asyncio.sleep(0.2)
+        await http_client.post("/orders", json=OrderInput(stocks=stocks, quantity=1, side=OrderSide.buy).model_dump())
+        changed = await waiting
+        # then
+        assert_that(changed.status_code, equal_to(status.HTTP_200_OK), "Response status is 200")
+        assert_that(changed.json(), has_entries(status=OrderStatus.executed.value, filled_quantity=1),
+                    "Changed order returned")
+        assert_that(changed.headers.get("ETag"), is_not(equal_to(resting.headers.get("ETag"))), "New version")
+
+    async def test_stream_order_events(self, http_client):
+        # given
+        stocks = uuid.uuid4().hex[:8].upper()
+        async with http_client.stream("GET", "/orders/events", params={"stocks": stocks}) as response:
+            # when
+            placed = await http_client.post("/orders", json=OrderInput(stocks=stocks, quantity=1, side=OrderSide.sell,
+                                                                       price=2.5).model_dump())
+            event = await asyncio.wait_for(anext(read_events(response)), timeout=5)
+        # then
+        assert_that(response.status_code, equal_to(status.HTTP_200_OK), "Response status is 200")
+        assert_that(response.headers.get("Content-Type"), starts_with("text/event-stream"), "Event stream")
+        assert_that(event.get("id"), not_none(), "Event has an id")
+        assert_that(json.loads(event.get("data")), has_entries(id=placed.json().get("id"),
+                                                               status=OrderStatus.pending.value),
+                    "Update of the placed order")
+
+    async def test_resume_order_events(self, http_client):
+        # given
+        stocks = uuid.uuid4().hex[:8].upper()
+        async with http_client.stream("GET", "/orders/events", params={"stocks": stocks}) as response:
+            await http_client.post("/orders", json=OrderInput(stocks=stocks, quantity=1, side=OrderSide.sell,
+                                                              price=2.5).model_dump())
+            await http_client.post("/orders", json=OrderInput(stocks=stocks, quantity=1,
+                                                              side=OrderSide.buy).model_dump())
+            first = await asyncio.wait_for(anext(read_events(response)), timeout=5)
+        # when
+        async with http_client.stream("GET", "/orders/events", params={"stocks": stocks},
+                                      headers={"Last-Event-ID": first.get("id")}) as response:
+            resumed = await asyncio.wait_for(anext(read_events(response)), timeout=5)
+        # then
+        assert_that(json.loads(resumed.get("data")), has_entries(type="fill", stocks=stocks),
+                    "Stream resumed right after the last event received")
 
     async def test_cancel_order(self, http_client, created_order):
         response = await http_client.delete(f"/orders/{created_order.id}")
         assert_that(response.status_code, equal_to(status.HTTP_204_NO_CONTENT), "Response status is 200")
         assert_that(response.text, is_(empty()))
+
+    async def test_cancel_orders_of_symbol(self, http_client):
+        # given
+        stocks = uuid.uuid4().hex[:8].upper()
+        created_ids = []
+        for side, price in [(OrderSide.buy, 1.0), (OrderSide.sell, 1.5)]:
+            order_request = OrderInput(stocks=stocks, quantity=2, side=side, price=price)
+            response = await http_client.post("/orders", json=order_request.model_dump())
+            created_ids.append(response.json().get("id"))
+        other = await http_client.post("/orders", json=OrderInput(stocks="EURUSD", quantity=3).model_dump())
+        # when
+        response = await http_client.delete("/orders/", params={"stocks": stocks})
+        # then
+        assert_that(response.status_code, equal_to(status.HTTP_200_OK), "Response status is 200")
+        assert_that(response.json(), has_entries(cancelled=contains_inanyorder(*created_ids)),
+                    "Every order of the symbol cancelled")
+        response = await http_client.get("/orders", params={"stocks": stocks})
+        assert_that(response.json(), is_(empty()), "Cancelled orders removed")
+        response = await http_client.get(f"/orders/{other.json().get('id')}")
+        assert_that(response.status_code, equal_to(status.HTTP_200_OK), "Orders of other symbols kept")
+
+
+class TestMetrics:
+
+    async def test_metrics_exposed_in_prometheus_format(self, http_client, created_order):
+        # when
+        response = await http_client.get("/metrics")
+        # then
+        assert_that(response.status_code, equal_to(status.HTTP_200_OK), "Response status is 200")
+        assert_that(response.headers.get("content-type"), starts_with("text/plain"), "Prometheus text format")
+        assert_that(response.text, contains_string('http_request_duration_seconds_count{route="orders:placeOrder",'
+                                                   'method="POST",status="201"}'), "Route latency recorded")
+        assert_that(response.text, contains_string("websocket_active_connections "), "Connection gauge exposed")
@@ -77,7 +77,15 @@ class TestOrderRequestValidation:
                                "quantity": 0}, [RequestError(message="Input should be greater than 0",
                                                              input=0,
                                                              localization=["body", "quantity"],
-                                                             type="greater_than")])
+                                                             type="greater_than")]),
+        ("limit price without side", {"stocks": "EURUSD",
+                                      "quantity": 1,
+                                      "price": 1.5}, [RequestError(message="Value error, A limit price requires a side",
+                                                                   input={"stocks": "EURUSD",
+                                                                          "quantity": 1,
+                                                                          "price": 1.5},
+                                                                   localization=["body"],
+                                                                   type="value_error")])
     ])
     async def test_invalid_order_request(self, desc, json_data, expected_errors, http_client):
         # when
@@ -101,3 +109,15 @@ class TestOrderRequestValidation:
                                       type="json_invalid").model_dump(exclude_none=True)
         assert_that(response.status_code, equal_to(status.HTTP_400_BAD_REQUEST), "Invalid json properly handled")
         assert_that(response.json().get("errors"), only_contains(expected_error), "Expected error returned")
+
+    async def test_quantity_too_large_to_be_finite(self, http_client):
+        # given
+        overflowing_request = '{"stocks": "EURUSD", "quantity": 1e400}'
+        # when
+        response = await http_client.post("/orders", content=overflowing_request)
+        # then
+        expected_error = RequestError(message="Input should be a finite number",
+                                      localization=["body", "quantity"],
+                                      type="finite_number").model_dump(exclude_none=True)
+        assert_that(response.status_code, equal_to(status.HTTP_400_BAD_REQUEST), "Overflowing quantity rejected")
+        assert_that(response.json().get("errors"), has_item(has_entries(expected_error)), "Expected error returned")
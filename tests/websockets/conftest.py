@@ -1,4 +1,8 @@
 import asyncio
+import math
+import re
+import struct
+import uuid
 from typing import Coroutine, Type
 
 import pytest_asyncio
@@ -7,8 +11,16 @@ from pydantic import BaseModel
 from websockets.legacy.client import WebSocketClientProtocol
 
 from tests.conftest import get_ws_url, http_client
+from tests.model.trading_platform_model import OrderInput, OrderOutput, OrderSide, OrderStatus
 
 TIMEOUT = 5  # seconds
+IDLE_TIMEOUT = 10  # seconds
+
+BINARY_PROTOCOL = "trading.binary.v1"
+ORDER_INPUT = struct.Struct("<BddH")
+ORDER_OUTPUT = struct.Struct("<16sBBdddH")
+SIDES = (None, *OrderSide)
+STATUSES = tuple(OrderStatus)
 
 
 async def wait_for_response_and_parse_model(coro: Coroutine, timeout: int, model: Type[BaseModel]) -> BaseModel:
@@ -16,6 +28,36 @@ async def wait_for_response_and_parse_model(coro: Coroutine, timeout: int, model
     return model.model_validate_json(response)
 
 
+def pack_order_input(order: OrderInput) -> bytes:
+    symbol = order.stocks.encode()
+    return ORDER_INPUT.pack(SIDES.index(order.side and OrderSide(order.side)), order.quantity,
+                            math.nan if order.price is None else order.price, len(symbol)) + symbol
+
+
+def unpack_order_output(frame: bytes) -> OrderOutput:
+    order_id, status_number, side_number, quantity, price, filled, _ = ORDER_OUTPUT.unpack_from(frame)
+    return OrderOutput(id=str(uuid.UUID(bytes=order_id)),
+                       stocks=frame[ORDER_OUTPUT.size:].decode(),
+                       quantity=quantity,
+                       status=STATUSES[status_number],
+                       side=SIDES[side_number],
+                       price=None if math.isnan(price) else price,
+                       filled_quantity=None if math.isnan(filled) else filled)
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def no_orders_in_flight(http_client):
+    # updates of orders placed by earlier tests would otherwise reach clients subscribed to every order
+    async def wait_for_idle_scheduler():
+        while True:
+            metrics = (await http_client.get("/metrics")).text
+            if re.search(r"^order_lifecycle_scheduled_transitions 0$", metrics, re.MULTILINE):
+                return
+            await asyncio.sleep(0.1)
+
+    await asyncio.wait_for(wait_for_idle_scheduler(), timeout=IDLE_TIMEOUT)
+
+
 @pytest_asyncio.fixture
 async def websocket_client() -> WebSocketClientProtocol:
     uri = get_ws_url() + "/ws"
@@ -23,6 +65,13 @@ async def websocket_client() -> WebSocketClientProtocol:
         yield websocket
 
 
+@pytest_asyncio.fixture
+async def acking_websocket_client() -> WebSocketClientProtocol:
+    uri = get_ws_url() + "/ws?ack=true"
+    async with websockets.connect(uri) as websocket:
+        yield websocket
+
+
 @pytest_asyncio.fixture
 async def second_websocket_client():
     uri = get_ws_url() + "/ws"
@@ -35,3 +84,10 @@ async def third_websocket_client():
     uri = get_ws_url() + "/ws"
     async with websockets.connect(uri) as websocket:
         yield websocket
+
+
+@pytest_asyncio.fixture
+async def binary_websocket_client():
+    uri = get_ws_url() + "/ws"
+    async with websockets.connect(uri, subprotocols=[BINARY_PROTOCOL]) as websocket:
+        yield websocket
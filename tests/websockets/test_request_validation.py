@@ -1,10 +1,11 @@
 import json
+import uuid
 
 import pytest
 from hamcrest import assert_that, equal_to, has_length
 from starlette import status
 
-from tests.model.trading_platform_model import Error, RequestError, RequestErrors
+from tests.model.trading_platform_model import Error, OrderInput, RequestError, RequestErrors
 from tests.websockets.conftest import wait_for_response_and_parse_model, TIMEOUT
 
 pytestmark = pytest.mark.asyncio
@@ -127,3 +128,18 @@ class TestWsRequestValidation:
         assert_that(response.errors, has_length(1), "One error returned")
         assert_that(response.errors[0], equal_to(Error(code=status.WS_1003_UNSUPPORTED_DATA,
                                                        message="Expecting ',' delimiter: line 1 column 21 (char 20)")))
+
+    async def test_oversized_basket_rejected(self, websocket_client, http_client):
+        # given
+        stocks = uuid.uuid4().hex[:8].upper()
+        basket = [OrderInput(stocks=stocks, quantity=1).model_dump() for _ in range(1001)]
+        # when
+        await websocket_client.send(json.dumps(basket))
+        response = await wait_for_response_and_parse_model(coro=websocket_client.recv(),
+                                                           timeout=TIMEOUT,
+                                                           model=RequestErrors)
+        # then
+        assert_that(response.errors, has_length(1), "One error returned")
+        assert_that(response.errors[0].type, equal_to("too_long"), "Basket too long")
+        response = await http_client.get("/orders", params={"stocks": stocks})
+        assert_that(response.json(), has_length(0), "Nothing placed")
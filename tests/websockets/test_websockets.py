@@ -1,14 +1,20 @@
 import asyncio
 import json
+import math
+import uuid
 
 import pytest
-from hamcrest import assert_that, has_entries, is_, equal_to
+from hamcrest import (assert_that, has_entries, is_, equal_to, has_length, contains_inanyorder, has_properties,
+                      only_contains)
 from hamcrest.core.core.future import future_raising, resolved
 from starlette import status
 from websockets.legacy.client import WebSocketClientProtocol
 
-from tests.model.trading_platform_model import OrderOutput, OrderStatus, OrderInput
-from tests.websockets.conftest import wait_for_response_and_parse_model, TIMEOUT
+from tests.model.trading_platform_model import (CancelledOrders, CancelRequest, Fill, MarketDataBook, MarketDataDepth,
+                                               OrderAck, OrderOutput, OrderSide, OrderStatus, OrderInput, RequestError,
+                                               RequestErrors, SubscriptionAction, SubscriptionRequest, Subscriptions)
+from tests.websockets.conftest import (wait_for_response_and_parse_model, pack_order_input, unpack_order_output,
+                                      BINARY_PROTOCOL, TIMEOUT)
 
 pytestmark = pytest.mark.asyncio
 
@@ -93,6 +99,89 @@ class TestWsMessages:
                     future_raising(TimeoutError),
                     "No more messages left")
 
+    async def test_cancelling_own_orders_ends_their_lifecycle(self, websocket_client):
+        # given
+        await websocket_client.send(SubscriptionRequest(action=SubscriptionAction.subscribe,
+                                                        own_orders=True).model_dump_json())
+        await wait_for_response_and_parse_model(coro=websocket_client.recv(), timeout=TIMEOUT, model=Subscriptions)
+        await websocket_client.send(json.dumps([OrderInput(stocks="USDPLN", quantity=1).model_dump(),
+                                                OrderInput(stocks="USDPLN", quantity=2).model_dump()]))
+        # when
+        await websocket_client.send(CancelRequest(action="cancel", own_orders=True).model_dump_json())
+        messages = []
+        while "cancelled" not in (message := json.loads(await asyncio.wait_for(websocket_client.recv(), TIMEOUT))):
+            messages.append(message)
+        # then
+        cancelled = CancelledOrders.model_validate(message)
+        assert_that(cancelled.cancelled, has_length(2), "Both orders cancelled")
+        assert_that([message["id"] for message in messages if message["status"] == OrderStatus.cancelled.value],
+                    contains_inanyorder(*cancelled.cancelled), "Cancelled update broadcast for both orders")
+        assert_that(await resolved(asyncio.wait_for(websocket_client.recv(), timeout=TIMEOUT)),
+                    future_raising(TimeoutError),
+                    "No lifecycle updates after cancellation")
+
+    async def test_binary_protocol_order_entry_and_updates(self, binary_websocket_client, websocket_client):
+        # given
+        stocks = uuid.uuid4().hex[:8].upper()
+        # when
+        await binary_websocket_client.send(pack_order_input(OrderInput(stocks=stocks, quantity=1.5)) +
+                                           pack_order_input(OrderInput(stocks=stocks, quantity=2, side=OrderSide.sell,
+                                                                       price=3.25)))
+        updates = [unpack_order_output(await asyncio.wait_for(binary_websocket_client.recv(), TIMEOUT))
+                   for _ in range(4)]
+        json_updates = [await wait_for_response_and_parse_model(coro=websocket_client.recv(),
+                                                                timeout=TIMEOUT,
+                                                                model=OrderOutput)
+                        for _ in range(4)]
+        # then
+        assert_that(binary_websocket_client.subprotocol, equal_to(BINARY_PROTOCOL), "Binary protocol negotiated")
+        assert_that(updates, equal_to(json_updates), "Binary updates carry what JSON updates do")
+        assert_that([(update.quantity, update.status) for update in updates],
+                    contains_inanyorder((2, OrderStatus.pending.value), (1.5, OrderStatus.pending.value),
+                                        (1.5, OrderStatus.executed.value), (1.5, OrderStatus.cancelled.value)),
+                    "Both orders placed from one binary frame")
+        assert_that(updates, only_contains(has_properties(stocks=stocks)), "Symbol decoded")
+
+    async def test_malformed_binary_frame_rejected(self, binary_websocket_client):
+        # when
+        await binary_websocket_client.send(b"\x01\x02")
+        response = await wait_for_response_and_parse_model(coro=binary_websocket_client.recv(),
+                                                           timeout=TIMEOUT,
+                                                           model=RequestErrors)
+        # then
+        assert_that(response.errors, has_length(1), "Frame rejected")
+        assert_that(response.errors[0].code, equal_to(status.WS_1003_UNSUPPORTED_DATA), "Unsupported data")
+
+    async def test_binary_frame_with_infinite_quantity_rejected(self, binary_websocket_client):
+        # when
+        await binary_websocket_client.send(pack_order_input(OrderInput.model_construct(stocks="EURUSD",
+                                                                                       quantity=math.inf)))
+        response = await wait_for_response_and_parse_model(coro=binary_websocket_client.recv(),
+                                                           timeout=TIMEOUT,
+                                                           model=RequestErrors)
+        # then
+        assert_that(response.errors, has_length(1), "Frame rejected")
+        assert_that(response.errors[0].code, equal_to(status.WS_1003_UNSUPPORTED_DATA), "Unsupported data")
+
+    async def test_order_retried_over_websocket_placed_once(self, http_client, websocket_client):
+        # given
+        order_request = OrderInput(stocks=uuid.uuid4().hex[:8].upper(), quantity=3)
+        idempotency_key = str(uuid.uuid4())
+        await websocket_client.send(SubscriptionRequest(action=SubscriptionAction.subscribe,
+                                                        stocks=["NOTHING"]).model_dump_json())
+        await wait_for_response_and_parse_model(coro=websocket_client.recv(), timeout=TIMEOUT, model=Subscriptions)
+        response = await http_client.post("/orders", json=order_request.model_dump(),
+                                          headers={"Idempotency-Key": idempotency_key})
+        # when
+        await websocket_client.send(json.dumps({**order_request.model_dump(), "idempotency_key": idempotency_key}))
+        original = await wait_for_response_and_parse_model(coro=websocket_client.recv(),
+                                                           timeout=TIMEOUT,
+                                                           model=OrderOutput)
+        # then
+        assert_that(original.id, equal_to(response.json().get("id")), "Order placed over HTTP returned")
+        response = await http_client.get("/orders", params={"stocks": order_request.stocks})
+        assert_that(response.json(), has_length(1), "Only one order placed")
+
     async def test_creating_order_via_http_receiving_messages_via_websocket(self, http_client, websocket_client):
         response = await http_client.post("/orders",
                                           json=OrderInput(stocks="EURUSD",
@@ -117,3 +206,139 @@ class TestWsMessages:
                                                                  timeout=TIMEOUT,
                                                                  model=OrderOutput)
             assert_that(ws_message, equal_to(expected_message), "Expected message is received")
+
+    async def test_batch_of_orders(self, websocket_client):
+        # given
+        await websocket_client.send(json.dumps([{"stocks": "EURUSD", "quantity": 10},
+                                                {"stocks": "EURUSD", "quantity": 0}]))
+        # when
+        errors = await wait_for_response_and_parse_model(coro=websocket_client.recv(),
+                                                         timeout=TIMEOUT,
+                                                         model=RequestErrors)
+        # then
+        assert_that(errors.errors, equal_to([RequestError(code=status.WS_1003_UNSUPPORTED_DATA,
+                                                          message="Input should be greater than 0",
+                                                          input=0,
+                                                          localization=[1, "quantity"],
+                                                          type="greater_than")]), "Invalid order rejected")
+        for order_status in [OrderStatus.pending, OrderStatus.executed, OrderStatus.cancelled]:
+            response = await wait_for_response_and_parse_model(coro=websocket_client.recv(),
+                                                               timeout=TIMEOUT,
+                                                               model=OrderOutput)
+            assert_that(response.model_dump(),
+                        matcher=has_entries(stocks="EURUSD", quantity=10, status=order_status.value),
+                        reason=f"Client received expected message with status '{order_status}'")
+
+    async def test_orders_are_acked_without_waiting_for_status_updates(self, acking_websocket_client):
+        # given
+        first_order = OrderInput(stocks="EURUSD", quantity=1).model_dump_json()
+        second_order = OrderInput(stocks="EURUSD", quantity=2).model_dump_json()
+        # when
+        await acking_websocket_client.send(first_order)
+        await acking_websocket_client.send(second_order)
+        first_ack = await wait_for_response_and_parse_model(coro=acking_websocket_client.recv(),
+                                                            timeout=0.1,
+                                                            model=OrderAck)
+        second_ack = await wait_for_response_and_parse_model(coro=acking_websocket_client.recv(),
+                                                             timeout=0.1,
+                                                             model=OrderAck)
+        # then
+        assert_that(first_ack.ack + second_ack.ack, has_length(2), "Both orders acked before any status update")
+        updates = [await wait_for_response_and_parse_model(coro=acking_websocket_client.recv(),
+                                                           timeout=TIMEOUT,
+                                                           model=OrderOutput)
+                   for _ in range(6)]
+        assert_that([update.id for update in updates if update.status == OrderStatus.cancelled.value],
+                    contains_inanyorder(*first_ack.ack, *second_ack.ack),
+                    "Both lifecycles ran concurrently to completion")
+
+    async def test_client_subscribed_to_stocks_gets_only_matching_orders(self, websocket_client,
+                                                                          second_websocket_client):
+        # given
+        await second_websocket_client.send(SubscriptionRequest(action=SubscriptionAction.subscribe,
+                                                               stocks=["CHFJPY"]).model_dump_json())
+        subscriptions = await wait_for_response_and_parse_model(coro=second_websocket_client.recv(),
+                                                                timeout=TIMEOUT,
+                                                                model=Subscriptions)
+        assert_that(subscriptions, equal_to(Subscriptions(all=False, own_orders=False, stocks=["CHFJPY"])),
+                    "Subscription confirmed")
+        # when
+        await websocket_client.send(OrderInput(stocks="EURUSD", quantity=1).model_dump_json())
+        await websocket_client.send(OrderInput(stocks="CHFJPY", quantity=2).model_dump_json())
+        # then
+        for order_status in [OrderStatus.pending, OrderStatus.executed, OrderStatus.cancelled]:
+            response = await wait_for_response_and_parse_model(coro=second_websocket_client.recv(),
+                                                               timeout=TIMEOUT,
+                                                               model=OrderOutput)
+            assert_that(response.model_dump(),
+                        matcher=has_entries(stocks="CHFJPY", quantity=2, status=order_status.value),
+                        reason=f"Client received only the subscribed symbol with status '{order_status}'")
+
+    async def test_crossing_limit_orders_broadcast_fill(self, websocket_client, second_websocket_client):
+        # given
+        stocks = uuid.uuid4().hex[:8].upper()
+        await second_websocket_client.send(SubscriptionRequest(action=SubscriptionAction.subscribe,
+                                                               stocks=[stocks]).model_dump_json())
+        await wait_for_response_and_parse_model(coro=second_websocket_client.recv(),
+                                                timeout=TIMEOUT,
+                                                model=Subscriptions)
+        # when
+        await websocket_client.send(OrderInput(stocks=stocks, quantity=2, side=OrderSide.sell,
+                                               price=4.2).model_dump_json())
+        sell = await wait_for_response_and_parse_model(coro=second_websocket_client.recv(),
+                                                       timeout=TIMEOUT,
+                                                       model=OrderOutput)
+        await websocket_client.send(OrderInput(stocks=stocks, quantity=2, side=OrderSide.buy,
+                                               price=4.5).model_dump_json())
+        fill = await wait_for_response_and_parse_model(coro=second_websocket_client.recv(),
+                                                       timeout=TIMEOUT,
+                                                       model=Fill)
+        updates = [await wait_for_response_and_parse_model(coro=second_websocket_client.recv(),
+                                                           timeout=TIMEOUT,
+                                                           model=OrderOutput)
+                   for _ in range(2)]
+        # then
+        assert_that(sell.model_dump(), has_entries(status=OrderStatus.pending.value, filled_quantity=0),
+                    "Sell order rests in the book")
+        assert_that(fill.model_dump(), has_entries(stocks=stocks, price=4.2, quantity=2, sell_order=sell.id),
+                    "Fill traded at the resting price")
+        assert_that(updates, only_contains(has_properties(status=OrderStatus.executed.value, filled_quantity=2)),
+                    "Both orders executed")
+        assert_that(updates[1].id, equal_to(fill.buy_order), "Buy order update follows the fill")
+
+    async def test_market_data_book_then_depth_updates(self, http_client, websocket_client):
+        # given
+        stocks = uuid.uuid4().hex[:8].upper()
+        await websocket_client.send(SubscriptionRequest(action=SubscriptionAction.subscribe,
+                                                        market_data=[stocks]).model_dump_json())
+        subscriptions = await wait_for_response_and_parse_model(coro=websocket_client.recv(),
+                                                                timeout=TIMEOUT,
+                                                                model=Subscriptions)
+        book = await wait_for_response_and_parse_model(coro=websocket_client.recv(),
+                                                       timeout=TIMEOUT,
+                                                       model=MarketDataBook)
+        # when
+        await http_client.post("/orders", json=OrderInput(stocks=stocks, quantity=2, side=OrderSide.sell,
+                                                          price=1.5).model_dump())
+        await http_client.post("/orders", json=OrderInput(stocks=stocks, quantity=0.5, side=OrderSide.buy).model_dump())
+        updates = [await wait_for_response_and_parse_model(coro=websocket_client.recv(),
+                                                           timeout=TIMEOUT,
+                                                           model=MarketDataDepth)
+                   for _ in range(2)]
+        await websocket_client.send(SubscriptionRequest(action=SubscriptionAction.resync,
+                                                        market_data=[stocks]).model_dump_json())
+        await wait_for_response_and_parse_model(coro=websocket_client.recv(), timeout=TIMEOUT, model=Subscriptions)
+        resynced_book = await wait_for_response_and_parse_model(coro=websocket_client.recv(),
+                                                                timeout=TIMEOUT,
+                                                                model=MarketDataBook)
+        # then
+        assert_that(subscriptions.market_data, equal_to([stocks]), "Subscription confirmed")
+        assert_that(book, has_properties(stocks=stocks, bids=[], asks=[]), "Empty book sent first")
+        assert_that([(update.previous_sequence, update.sequence) for update in updates],
+                    equal_to([(book.sequence, book.sequence + 1), (book.sequence + 1, book.sequence + 2)]),
+                    "Updates numbered consecutively")
+        assert_that([update.changes for update in updates],
+                    equal_to([[(OrderSide.sell.value, 1.5, 2, 2)], [(OrderSide.sell.value, 1.5, -0.5, 1.5)]]),
+                    "Resting order added, then partially taken")
+        assert_that(resynced_book, has_properties(sequence=book.sequence + 2, bids=[], asks=[[1.5, 1.5]]),
+                    "Resync sends the current book")